@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+import tempfile
+from typing import List, Optional
+
+import yaml
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def write_config(tasks: dict, gui: Optional[dict] = None) -> str:
+    """
+    Writes a jorun configuration to a temporary file, returning its path
+    """
+    config = {"tasks": tasks}
+    if gui:
+        config["gui"] = gui
+
+    fd, path = tempfile.mkstemp(prefix="jorun-bench-", suffix=".yml")
+    with os.fdopen(fd, "w") as f:
+        yaml.safe_dump(config, f)
+    return path
+
+
+def jorun(arguments: List[str], **kwargs) -> subprocess.Popen:
+    """
+    Runs jorun from the sources of this checkout
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [SOURCE_DIRECTORY, os.environ.get("PYTHONPATH")])))
+    return subprocess.Popen([sys.executable, "-c", "import sys; from jorun.main import main; sys.exit(main())",
+                             *arguments], env=env, **kwargs)
@@ -0,0 +1,68 @@
+"""
+Measures the time from launching jorun with the GUI to its main window being shown, for many tasks spread over
+several panes
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/first_window.py --tasks 500
+"""
+import argparse
+import os
+import signal
+import subprocess
+import time
+
+from common import write_config, jorun
+
+
+def first_window(config: str, tasks: int, timeout: float) -> float:
+    start = time.perf_counter()
+    process = jorun([config, "--gui", "--level", "DEBUG"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                    start_new_session=True)
+    shown = None
+    started = 0
+    try:
+        deadline = start + timeout
+        for line in process.stdout:
+            if b"Main window shown" in line:
+                shown = time.perf_counter() - start
+            elif line.rstrip().endswith(b" is started"):
+                started += 1
+
+            # Interrupted once every task started, so that jorun stops them all
+            if shown is not None and started == tasks:
+                return shown
+            if time.perf_counter() > deadline:
+                break
+        raise RuntimeError("The main window was not shown")
+    finally:
+        os.killpg(process.pid, signal.SIGINT)
+        try:
+            process.communicate(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--panes", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60)
+    arguments = parser.parse_args()
+
+    tasks = [f"task{i}" for i in range(arguments.tasks)]
+    per_pane = -(-len(tasks) // arguments.panes)
+    config = write_config({t: {"type": "shell", "run_mode": "indefinite", "shell": {"command": "sleep 600"}}
+                           for t in tasks},
+                          {"panes": {f"pane{p}": {"tasks": tasks[p * per_pane:(p + 1) * per_pane]}
+                                     for p in range(arguments.panes)}})
+
+    try:
+        times = [first_window(config, len(tasks), arguments.timeout) for _ in range(arguments.repeat)]
+        print(f"first window in {1000 * min(times):.0f} ms (best of {len(times)}), {len(tasks)} tasks")
+    finally:
+        os.remove(config)
+
+
+if __name__ == "__main__":
+    main()
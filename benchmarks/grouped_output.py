@@ -0,0 +1,51 @@
+"""
+Compares the time a run takes with the stream and the grouped console outputs, for tasks printing many lines
+at the same time
+
+    python benchmarks/grouped_output.py --tasks 8 --lines 200000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from common import write_config, jorun
+
+
+def run(config: str, output: str, workers: int) -> float:
+    arguments = [config, "--no-gui", "--output", output]
+    if workers:
+        arguments += ["--workers", str(workers)]
+
+    start = time.perf_counter()
+    process = jorun(arguments, stdout=subprocess.DEVNULL)
+    if process.wait() != 0:
+        sys.exit(f"jorun exited with {process.returncode}")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=8)
+    parser.add_argument("--lines", type=int, default=200000, help="The lines printed by each task")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    arguments = parser.parse_args()
+
+    command = f"{sys.executable} -c \"import sys; sys.stdout.writelines(f'line {{i}} of the output\\\\n' " \
+              f"for i in range({arguments.lines}))\""
+    config = write_config({f"task{i}": {"type": "shell", "shell": {"command": command}}
+                           for i in range(arguments.tasks)})
+
+    try:
+        for output in ("stream", "grouped"):
+            best = min(run(config, output, arguments.workers) for _ in range(arguments.repeat))
+            total = arguments.tasks * arguments.lines
+            print(f"{output:8} {best:7.2f}s  {total / best:12,.0f} lines/s")
+    finally:
+        os.remove(config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Measures the time the GUI takes to build its window for many task panels, and to show each pane once
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/panel_construction.py --tasks 500
+"""
+import argparse
+import os
+import sys
+import time
+
+from common import SOURCE_DIRECTORY
+
+sys.path.insert(0, SOURCE_DIRECTORY)
+
+from PySide6.QtWidgets import QApplication  # noqa: E402
+
+from jorun.logger import logger  # noqa: E402
+from jorun.palette.darcula import DarculaColorPalette  # noqa: E402
+from jorun.ui.main_window import MainWindow  # noqa: E402
+from jorun.ui.theme import install_theme  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--panes", type=int, default=10)
+    parser.add_argument("--columns", type=int, default=5)
+    arguments = parser.parse_args()
+    logger.setLevel("WARNING")
+
+    tasks = [f"task{i}" for i in range(arguments.tasks)]
+    per_pane = -(-len(tasks) // arguments.panes)
+    panes = {f"pane{p}": {"tasks": tasks[p * per_pane:(p + 1) * per_pane], "columns": arguments.columns}
+             for p in range(arguments.panes)}
+
+    app = QApplication(sys.argv)
+
+    start = time.perf_counter()
+    install_theme(app, DarculaColorPalette())
+    themed = time.perf_counter()
+
+    window = MainWindow(tasks, panes)
+    built = time.perf_counter()
+
+    window.show()
+    app.processEvents()
+    shown = time.perf_counter()
+
+    tabs = window.centralWidget()
+    for index in range(tabs.count()):
+        tabs.setCurrentIndex(index)
+        app.processEvents()
+    all_shown = time.perf_counter()
+
+    print(f"theme           {1000 * (themed - start):8.1f} ms")
+    print(f"window built    {1000 * (built - themed):8.1f} ms")
+    print(f"first pane      {1000 * (shown - built):8.1f} ms")
+    print(f"every pane      {1000 * (all_shown - shown):8.1f} ms  ({tabs.count()} tabs)")
+    print(f"total           {1000 * (all_shown - start):8.1f} ms  for {len(tasks)} panels")
+
+    window.close()
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from typing import List, Dict, Optional, Tuple
+
+from .. import constants
+
+
+class OutputRing:
+    """
+    Keeps the last lines of a task output. Lines are addressed by a cursor, their position in the whole output,
+    so that any number of readers can follow the ring independently
+    """
+    _buffer: List[str]
+    _capacity: int
+    _end: int
+    _changed: Optional[asyncio.Event]
+
+    def __init__(self, capacity: int = constants.API_RING_LINES):
+        self._buffer = []
+        self._capacity = capacity
+        self._end = 0
+        self._changed = None
+
+    @property
+    def start(self) -> int:
+        return max(0, self._end - self._capacity)
+
+    @property
+    def end(self) -> int:
+        return self._end
+
+    def append(self, line: str):
+        if len(self._buffer) < self._capacity:
+            self._buffer.append(line)
+        else:
+            self._buffer[self._end % self._capacity] = line
+        self._end += 1
+
+        if self._changed:
+            self._changed.set()
+            self._changed = None
+
+    def read(self, cursor: int, limit: int) -> Tuple[List[str], int, int]:
+        """
+        Returns the lines from `cursor`, the cursor following them and the number of lines lost because
+        they were overwritten before being read
+        """
+        lost = max(0, self.start - cursor)
+        cursor = min(max(cursor, self.start), self._end)
+        count = min(self._end - cursor, limit)
+
+        first = cursor % self._capacity
+        if first + count <= self._capacity:
+            lines = self._buffer[first:first + count]
+        else:
+            lines = self._buffer[first:] + self._buffer[:first + count - self._capacity]
+
+        return lines, cursor + count, lost
+
+    async def wait(self, cursor: int):
+        """
+        Waits until there are lines after `cursor`
+        """
+        while cursor >= self._end:
+            if not self._changed:
+                self._changed = asyncio.Event()
+            await self._changed.wait()
+
+
+class OutputRings:
+    """
+    The output rings of all the tasks, shared by the API subscribers
+    """
+    _rings: Dict[str, OutputRing]
+
+    def __init__(self):
+        self._rings = {}
+
+    def ring(self, task: str) -> OutputRing:
+        ring = self._rings.get(task)
+        if not ring:
+            ring = self._rings[task] = OutputRing()
+        return ring
+
+    def append(self, task: str, line: str):
+        self.ring(task).append(line)
+
+    def extend(self, task: str, lines: List[str]):
+        ring = self.ring(task)
+        for line in lines:
+            ring.append(line)
+
+
+class RingHandler(logging.Handler):
+    """
+    Copies the output of the tasks to their rings
+    """
+    _rings: OutputRings
+
+    def __init__(self, rings: OutputRings):
+        super(RingHandler, self).__init__()
+        self._rings = rings
+
+    def emit(self, record: logging.LogRecord):
+        task = getattr(record, "subprocess", None)
+        if task is not None:
+            self._rings.append(task, record.msg)
@@ -0,0 +1,330 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import struct
+from typing import Callable, List, Dict, Optional, Awaitable, Tuple
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from .. import constants
+from ..logger import logger
+from ..messaging.message import TaskCommand
+from .ring import OutputRings, OutputRing
+
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+WS_OPCODE_TEXT = 0x1
+WS_OPCODE_CLOSE = 0x8
+WS_OPCODE_PING = 0x9
+WS_OPCODE_PONG = 0xA
+
+STATUS_REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+}
+
+COMMANDS = {
+    "start": TaskCommand.START,
+    "stop": TaskCommand.STOP,
+    "restart": TaskCommand.RESTART,
+}
+
+
+LOOPBACK_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+class SlowClientException(Exception):
+    pass
+
+
+def is_loopback(host: str) -> bool:
+    return host in LOOPBACK_HOSTS or host.startswith("127.")
+
+
+class HttpRequest:
+    method: str
+    path: List[str]
+    query: Dict[str, List[str]]
+    headers: Dict[str, str]
+
+    def __init__(self, method: str, target: str, headers: Dict[str, str]):
+        url = urlsplit(target)
+        self.method = method
+        self.path = [unquote(p) for p in url.path.split("/") if p]
+        self.query = parse_qs(url.query)
+        self.headers = headers
+
+    def param(self, name: str) -> Optional[str]:
+        values = self.query.get(name)
+        return values[0] if values else None
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[HttpRequest]:
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+
+    method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    if headers.get("content-length"):
+        await reader.readexactly(int(headers["content-length"]))
+
+    return HttpRequest(method, target, headers)
+
+
+def websocket_frame(payload: bytes, opcode: int = WS_OPCODE_TEXT) -> bytes:
+    if len(payload) < 126:
+        header = struct.pack("!BB", 0x80 | opcode, len(payload))
+    elif len(payload) < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, len(payload))
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, len(payload))
+    return header + payload
+
+
+async def read_websocket_frame(reader: asyncio.StreamReader):
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack("!Q", await reader.readexactly(8))
+
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+    return first & 0x0F, payload
+
+
+class ApiServer:
+    """
+    Serves the state of the tasks, accepts commands and streams the output of the tasks over SSE or WebSocket.
+    Every subscriber reads the shared output rings from its own cursor
+    """
+    _rings: OutputRings
+    _list_tasks: Callable[[], List[dict]]
+    _send_command: Callable[[str, TaskCommand], bool]
+    _shutdown: Optional[Callable[[], None]]
+    _servers: List[asyncio.AbstractServer]
+    _socket_path: Optional[str]
+    _token: Optional[str]
+
+    def __init__(self, rings: OutputRings, list_tasks: Callable[[], List[dict]],
+                 send_command: Callable[[str, TaskCommand], bool], shutdown: Optional[Callable[[], None]] = None,
+                 token: Optional[str] = None):
+        self._rings = rings
+        self._list_tasks = list_tasks
+        self._send_command = send_command
+        self._shutdown = shutdown
+        self._servers = []
+        self._socket_path = None
+        self._token = token
+
+    async def start(self, host: str, port: int) -> int:
+        """
+        Listens on the given address, on a free port if `port` is 0, and returns the port
+        """
+        server = await asyncio.start_server(self._handle_client, host, port)
+        self._servers.append(server)
+        port = server.sockets[0].getsockname()[1]
+        logger.info(f"API listening on http://{host}:{port}")
+
+        if not is_loopback(host):
+            logger.warning(f"The API is reachable from other machines on {host}, which can control the tasks"
+                           + ("" if self._token else ". Set an API token to restrict it"))
+        return port
+
+    async def start_unix(self, path: str):
+        self._servers.append(await asyncio.start_unix_server(self._handle_client, path))
+        self._socket_path = path
+        logger.info(f"API listening on {path}")
+
+    def close(self):
+        for server in self._servers:
+            server.close()
+        if self._socket_path and os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+
+    @staticmethod
+    def _respond(writer: asyncio.StreamWriter, status: int, body: any):
+        data = json.dumps(body).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {STATUS_REASONS[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + data)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await read_request(reader)
+            if request:
+                await self._route(request, reader, writer)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except SlowClientException:
+            logger.debug("Dropped an API subscriber not keeping up with the output")
+        finally:
+            writer.close()
+
+    def _refusal(self, request: HttpRequest) -> Optional[Tuple[int, str]]:
+        """
+        Refuses the requests any web page open in a browser could send to the loopback address: the ones from
+        other origins, and the commands and WebSocket upgrades without a custom header, which pages can only add
+        through a preflight request that is never allowed. A token can be required too
+        """
+        origin = request.headers.get("origin")
+        if origin is not None and not is_loopback(urlsplit(origin).hostname or ""):
+            return 403, f"Origin {origin} not allowed"
+
+        if self._token:
+            authorization = request.headers.get("authorization", "")
+            token = authorization[len("Bearer "):] if authorization.startswith("Bearer ") else request.param("token")
+            if not token or not hmac.compare_digest(token.encode("utf-8"), self._token.encode("utf-8")):
+                return 401, "Invalid or missing token"
+
+        upgrade = request.headers.get("upgrade", "").lower() == "websocket"
+        if (request.method == "POST" or upgrade) and constants.API_CLIENT_HEADER.lower() not in request.headers:
+            return 403, f"Missing the {constants.API_CLIENT_HEADER} header"
+
+        return None
+
+    async def _route(self, request: HttpRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        refusal = self._refusal(request)
+        if refusal:
+            return self._respond(writer, refusal[0], {"error": refusal[1]})
+
+        tasks = {t["name"]: t for t in self._list_tasks()}
+        path = request.path
+
+        if path == ["tasks"]:
+            return self._respond(writer, 200, list(tasks.values()))
+
+        if path == ["shutdown"] and self._shutdown:
+            if request.method != "POST":
+                return self._respond(writer, 405, {"error": "Use POST"})
+            self._shutdown()
+            return self._respond(writer, 202, {"pid": os.getpid()})
+
+        if len(path) < 2 or path[0] != "tasks" or path[1] not in tasks:
+            return self._respond(writer, 404, {"error": "Not found"})
+
+        name = path[1]
+
+        if len(path) == 2:
+            return self._respond(writer, 200, tasks[name])
+
+        if len(path) == 3 and path[2] in COMMANDS:
+            if request.method != "POST":
+                return self._respond(writer, 405, {"error": "Use POST"})
+            self._send_command(name, COMMANDS[path[2]])
+            return self._respond(writer, 202, {"task": name, "command": path[2]})
+
+        if len(path) == 3 and path[2] == "output":
+            ring = self._rings.ring(name)
+            cursor_param = request.param("cursor") or request.headers.get("last-event-id")
+
+            try:
+                cursor = ring.end if cursor_param == "end" else int(cursor_param or 0)
+            except ValueError:
+                return self._respond(writer, 400, {"error": f"Invalid cursor {cursor_param}"})
+
+            if request.headers.get("upgrade", "").lower() == "websocket":
+                return await self._stream_websocket(request, reader, writer, ring, cursor)
+            if "text/event-stream" in request.headers.get("accept", ""):
+                return await self._stream_events(reader, writer, ring, cursor)
+
+            lines, cursor, lost = ring.read(cursor, constants.API_STREAM_BATCH_LINES)
+            return self._respond(writer, 200, {"cursor": cursor, "lost": lost, "lines": lines})
+
+        return self._respond(writer, 404, {"error": "Not found"})
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, data: bytes):
+        writer.write(data)
+        if writer.transport.get_write_buffer_size() > constants.API_CLIENT_BUFFER_LIMIT:
+            try:
+                await asyncio.wait_for(writer.drain(), constants.API_CLIENT_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise SlowClientException()
+
+    @staticmethod
+    async def _follow(ring: OutputRing, cursor: int, send: Callable[[List[str], int, int], Awaitable[None]]):
+        while True:
+            lines, cursor, lost = ring.read(cursor, constants.API_STREAM_BATCH_LINES)
+            if lines or lost:
+                await send(lines, cursor, lost)
+            else:
+                await ring.wait(cursor)
+
+    @staticmethod
+    async def _until_first(*coroutines):
+        tasks = [asyncio.ensure_future(c) for c in coroutines]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                t.result()
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    async def _stream_events(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, ring: OutputRing,
+                             cursor: int):
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"Connection: close\r\n\r\n")
+
+        async def send(lines: List[str], next_cursor: int, lost: int):
+            event = []
+            if lost:
+                event.append(f"event: lost\ndata: {lost}\n\n")
+            if lines:
+                data = "".join(f"data: {line.rstrip(chr(10))}\n" for line in lines)
+                event.append(f"id: {next_cursor}\n{data}\n")
+            await self._send(writer, "".join(event).encode("utf-8"))
+
+        # The client sends nothing more, until it disconnects
+        await self._until_first(self._follow(ring, cursor, send), reader.read())
+
+    async def _stream_websocket(self, request: HttpRequest, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter, ring: OutputRing, cursor: int):
+        key = request.headers.get("sec-websocket-key")
+        if not key:
+            return self._respond(writer, 400, {"error": "Missing Sec-WebSocket-Key"})
+
+        accept = base64.b64encode(hashlib.sha1(key.encode("latin-1") + WEBSOCKET_GUID).digest()).decode("latin-1")
+        writer.write(f"HTTP/1.1 101 Switching Protocols\r\n"
+                     f"Upgrade: websocket\r\n"
+                     f"Connection: Upgrade\r\n"
+                     f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode("latin-1"))
+
+        async def send(lines: List[str], next_cursor: int, lost: int):
+            message = json.dumps({"cursor": next_cursor, "lost": lost, "lines": lines})
+            await self._send(writer, websocket_frame(message.encode("utf-8")))
+
+        async def receive():
+            while True:
+                opcode, payload = await read_websocket_frame(reader)
+                if opcode == WS_OPCODE_CLOSE:
+                    writer.write(websocket_frame(payload[:2], WS_OPCODE_CLOSE))
+                    return
+                if opcode == WS_OPCODE_PING:
+                    writer.write(websocket_frame(payload, WS_OPCODE_PONG))
+
+        await self._until_first(self._follow(ring, cursor, send), receive())
@@ -1,21 +1,240 @@
+import copy
+import hashlib
+import itertools
+import json
+import os
+import re
+import time
+
 import yaml
-from typing import List
+from typing import List, Union, Dict, Any, Tuple, Optional
 
-from .types.task import TasksConfiguration
+from . import constants
+from .errors import TaskBuildException
+from .types.task import TasksConfiguration, Dependency, Task
 from .handler.base import BaseTaskHandler
+from .handler.registry import handler_exists, load_handler
+
+
+def parse_dependency(task_name: str, dependency: Union[str, Dependency]) -> Dependency:
+    if isinstance(dependency, str):
+        return Dependency(task=dependency, when=constants.DEFAULT_DEPENDENCY_CONDITION)
+
+    if not isinstance(dependency, dict) or not isinstance(dependency.get("task"), str):
+        raise TaskBuildException(f"Task '{task_name}' has a dependency without a task name: {dependency}")
+
+    when = dependency.get("when") or constants.DEFAULT_DEPENDENCY_CONDITION
+    if when not in constants.DEPENDENCY_CONDITIONS:
+        raise TaskBuildException(f"Task '{task_name}' depends on '{dependency.get('task')}' with unknown "
+                                 f"condition '{when}'")
+
+    return Dependency(task=dependency["task"], when=when)
+
+
+def task_hash(task: Task) -> str:
+    """
+    Identifies the definition of a task, to tell whether a running instance of it is still up to date
+    """
+    return hashlib.sha256(json.dumps(task, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+# `$$` is matched first so that it is left as it is, e.g. the pid in a shell command
+_VARIABLE = re.compile(r"\$\$|\$\{([_a-zA-Z][_a-zA-Z0-9]*)\}|\$([_a-zA-Z][_a-zA-Z0-9]*)")
+
+
+def _substitute(value: Any, variables: Dict[str, str]) -> Any:
+    """
+    Replaces the `$name` and `${name}` of the given variables, leaving any other `$` untouched
+    """
+    if isinstance(value, str):
+        return _VARIABLE.sub(lambda m: variables.get(m.group(1) or m.group(2), m.group(0)), value)
+    if isinstance(value, list):
+        return [_substitute(v, variables) for v in value]
+    if isinstance(value, dict):
+        return {k: _substitute(v, variables) for k, v in value.items()}
+    return value
+
+
+def _shard_variables(task: Task) -> List[Dict[str, str]]:
+    shards = task.get("shards")
+    matrix = task.get("matrix")
+
+    if shards is not None and matrix is not None:
+        raise TaskBuildException(f"Task '{task['name']}' can't have both shards and matrix")
+
+    if matrix is not None:
+        keys = list(matrix.keys())
+        combinations = [dict(zip(keys, values)) for values in itertools.product(*matrix.values())] if keys else []
+        if not combinations:
+            raise TaskBuildException(f"Task '{task['name']}' has an empty matrix")
+    else:
+        try:
+            count = (os.cpu_count() or 1) if shards == "auto" else int(shards)
+        except (TypeError, ValueError):
+            raise TaskBuildException(f"Task '{task['name']}' has invalid shards '{shards}'")
+        if count < 1:
+            raise TaskBuildException(f"Task '{task['name']}' needs at least one shard, got {count}")
+        combinations = [{} for _ in range(count)]
+
+    return [{"shard_index": str(i), "shard_total": str(len(combinations)),
+             **{k: str(v) for k, v in combination.items()}}
+            for i, combination in enumerate(combinations)]
+
+
+def expand_shards(task: Task) -> List[Task]:
+    """
+    Expands a task declaring `shards` or a `matrix` into one task per shard, named after the shard index.
+    The shard variables are substituted in the task options and passed to the process as environment variables
+    """
+    shards: List[Task] = []
+
+    for variables in _shard_variables(task):
+        shard: Task = _substitute({k: v for k, v in task.items() if k not in ("shards", "matrix", "depends")},
+                                  variables)
+        shard["name"] = f"{task['name']}_{variables['shard_index']}"
+        shard["depends"] = copy.deepcopy(task.get("depends"))
+        shard["shard_index"] = int(variables["shard_index"])
+
+        environment = {"JORUN_SHARD_INDEX": variables["shard_index"], "JORUN_SHARD_TOTAL": variables["shard_total"]}
+        environment.update({f"JORUN_MATRIX_{k.upper()}": variables[k] for k in task.get("matrix") or {}})
+
+        options = shard.get(shard["type"])
+        if isinstance(options, dict):
+            options["environment"] = {**environment, **(options.get("environment") or {})}
+
+        shards.append(shard)
+
+    return shards
+
+
+def _check_output_rules(task: Task):
+    rules = task.get("output") or {}
+    for option in ("rate_limit", "burst"):
+        value = rules.get(option)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+            raise TaskBuildException(f"Task '{task['name']}' has invalid output {option} '{value}', "
+                                     f"expected a positive number")
+
+
+def _expand_names(names: List[str], expanded: Dict[str, List[str]]) -> List[str]:
+    return [n for name in names for n in expanded.get(name, [name])]
 
 
 def load_config(file_name: str) -> TasksConfiguration:
     with open(file_name, "r") as yamlf:
-        config: TasksConfiguration = yaml.safe_load(yamlf)
+        # The libyaml parser is several times faster on large configurations, when available
+        config: TasksConfiguration = yaml.load(yamlf, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
         for t_name, t_task in config['tasks'].items():
             t_task['name'] = t_name
+            t_task['depends'] = [parse_dependency(t_name, d) for d in t_task.get('depends') or []]
+            if not handler_exists(t_task.get('type')):
+                raise TaskBuildException(f"Task '{t_name}' has unknown type '{t_task.get('type')}'")
+            if t_task.get('on_failure') not in (None, *constants.FAILURE_POLICIES):
+                raise TaskBuildException(f"Task '{t_name}' has unknown failure policy '{t_task['on_failure']}'")
+            _check_output_rules(t_task)
+
+        tasks: Dict[str, Task] = {}
+        expanded: Dict[str, List[str]] = {}
+
+        for t_name, t_task in config['tasks'].items():
+            if t_task.get("shards") is not None or t_task.get("matrix") is not None:
+                shards = expand_shards(t_task)
+                for shard in shards:
+                    if shard["name"] in config['tasks'] or shard["name"] in tasks:
+                        raise TaskBuildException(f"Shard '{shard['name']}' of task '{t_name}' has the name of "
+                                                 f"another task")
+                    tasks[shard["name"]] = shard
+                expanded[t_name] = [s["name"] for s in shards]
+            else:
+                tasks[t_name] = t_task
+
+        # The name of a sharded task stands for all its shards, in the dependencies and in the GUI panes
+        for t_task in tasks.values():
+            t_task['depends'] = [Dependency(task=n, when=d["when"])
+                                 for d in t_task['depends'] for n in expanded.get(d["task"], [d["task"]])]
+
+        for pane in ((config.get("gui") or {}).get("panes") or {}).values():
+            pane["tasks"] = _expand_names(pane.get("tasks") or [], expanded)
 
+        config['tasks'] = tasks
         return config
 
 
+def _shard_names(tasks: Dict[str, Task]) -> Dict[str, List[str]]:
+    shards: Dict[str, List[str]] = {}
+    for name, t in tasks.items():
+        if t.get("shard_index") is not None:
+            shards.setdefault(name[:-len(f"_{t['shard_index']}")], []).append(name)
+    return shards
+
+
+def select_tasks(config: TasksConfiguration, targets: List[str],
+                 exclude: List[str]) -> Tuple[TasksConfiguration, List[str]]:
+    """
+    Keeps the target tasks, all of them if none is given, and the tasks they depend on, directly or not.
+    The excluded tasks are left out, the tasks depending on them don't wait for them. Returns the configuration
+    of the selected tasks, with their panes only, and the excluded tasks they depend on
+    """
+    tasks = config["tasks"]
+    if not targets and not exclude:
+        return config, []
+
+    # The name of a sharded task stands for all its shards
+    shards = _shard_names(tasks)
+
+    def expand(names: List[str]) -> List[str]:
+        expanded = []
+        for name in names:
+            if name not in tasks and name not in shards:
+                raise TaskBuildException(f"Unknown task '{name}'")
+            expanded.extend(shards.get(name, [name]) if name not in tasks else [name])
+        return expanded
+
+    excluded = set(expand(exclude))
+    pending = [name for name in (expand(targets) if targets else tasks) if name not in excluded]
+    selected = set()
+    excluded_dependencies = set()
+
+    while pending:
+        name = pending.pop()
+        if name in selected:
+            continue
+        selected.add(name)
+
+        for d in tasks[name].get("depends") or []:
+            if d["task"] in excluded:
+                excluded_dependencies.add(d["task"])
+            elif d["task"] in tasks and d["task"] not in selected:
+                pending.append(d["task"])
+
+    gui = config.get("gui")
+    if gui and gui.get("panes"):
+        panes = {pane_name: {**pane, "tasks": [t for t in pane.get("tasks") or [] if t in selected]}
+                 for pane_name, pane in gui["panes"].items()}
+        gui = {**gui, "panes": {pane_name: pane for pane_name, pane in panes.items() if pane["tasks"]}}
+
+    selection: TasksConfiguration = {**config, "tasks": {n: t for n, t in tasks.items() if n in selected}, "gui": gui}
+    return selection, [n for n in tasks if n in excluded_dependencies]
+
+
+def satisfied_states() -> Dict[str, float]:
+    """
+    The states of a task that is not run but assumed done, satisfying any dependency on it
+    """
+    now = time.time()
+    return {condition: now for condition in constants.DEPENDENCY_CONDITIONS}
+
+
 class AppConfiguration:
-    handlers: List[BaseTaskHandler]
+    """
+    The handlers of the task types, created when the first task of their type runs
+    """
+    handlers: Dict[str, BaseTaskHandler]
+
+    def __init__(self, handlers: Optional[List[BaseTaskHandler]] = None) -> None:
+        self.handlers = {h.task_type: h for h in handlers or []}
 
-    def __init__(self, handlers: List[BaseTaskHandler]) -> None:
-        self.handlers = handlers
\ No newline at end of file
+    def handler(self, task_type: str) -> BaseTaskHandler:
+        if task_type not in self.handlers:
+            self.handlers[task_type] = load_handler(task_type)
+        return self.handlers[task_type]
\ No newline at end of file
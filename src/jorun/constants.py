@@ -5,6 +5,97 @@ APP_NAME = "JoRun"
 SCROLL_TOLERANCE = 4
 DEFAULT_COLUMNS = 3
 
-PROCESS_KILL_POLLING_INTERVAL = 0.1
+# The time a stopped task has to exit before being killed, in seconds
+TASK_STOP_TIMEOUT = 1
 COMMANDS_DEQUEUE_INTERVAL = 0.05
 TERMINATION_CHECK_INTERVAL = 0.15
+CONFIGURATION_WATCH_INTERVAL = 1
+USAGE_SAMPLE_INTERVAL = 1
+# The durations kept per task in the timings file
+TIMINGS_HISTORY_LENGTH = 10
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+CGROUP_NAME = "jorun"
+CGROUP_CPU_PERIOD = 100000
+
+AGENT_DEFAULT_PORT = 7400
+REMOTE_READ_CHUNK_SIZE = 65536
+REMOTE_STOP_TIMEOUT = 10
+REMOTE_AUTH_TIMEOUT = 10
+
+WORKER_VOLUME_REPORT_INTERVAL = 1
+WORKER_VOLUME_RATE_SMOOTHING = 0.3
+WORKER_SHUTDOWN_TIMEOUT = 10
+
+SCANNER_READ_SIZE = 65536
+SCANNER_MAX_LINE_LENGTH = 1024 * 1024
+
+# The pseudo-terminal of the tasks run with `tty`
+TTY_COLUMNS = 120
+TTY_ROWS = 40
+TTY_TERM = "dumb"
+
+# About one frame at 60 Hz
+UI_FRAME_INTERVAL = 16
+UI_STATS_INTERVAL = 1
+TIMELINE_TAB = "Timeline"
+# The rows the timeline merges each time the view scrolls past the end
+TIMELINE_FETCH_SIZE = 1000
+# The lines a single fetch may go through looking for the filter, the rest is scanned on the next event loop turns
+TIMELINE_FETCH_SCAN = 50000
+# The lines of each task the timeline keeps, the oldest are dropped past twice as many
+TIMELINE_MAX_LINES = 100000
+# The latest lines of each task kept for a pane that was never shown
+PANE_PENDING_LINES = TIMELINE_MAX_LINES
+# Milliseconds
+TIMELINE_FILTER_DELAY = 300
+
+FLOW_CONTROL_SLOTS = 1024
+FLOW_CONTROL_POLL_INTERVAL = 0.01
+FLOW_CONTROL_SAMPLE_RATE = 10
+DEFAULT_OUTPUT_BUDGET = "64m"
+DEFAULT_TASK_OUTPUT_BUDGET = "8m"
+DEFAULT_OVERFLOW_POLICY = "block"
+
+# The output of each task kept in memory by --output=grouped, beyond which it goes to a temporary file
+DEFAULT_OUTPUT_BUFFER = "1m"
+GROUPED_COPY_SIZE = 65536
+
+# The states of a task that a dependent task can wait for
+DEPENDENCY_CONDITIONS = ("started", "ready", "completed", "succeeded")
+DEFAULT_DEPENDENCY_CONDITION = "ready"
+
+# What happens to the run when a task fails
+FAILURE_POLICIES = ("fail-fast", "continue", "ignore")
+DEFAULT_FAILURE_POLICY = "continue"
+
+# The frames kept for each allocation traced by --profile=alloc
+PROFILE_ALLOC_FRAMES = 16
+# The time a callback can keep the event loop busy, with --profile, before its stack is logged, in seconds
+DEFAULT_SLOW_CALLBACK = 0.1
+
+EXIT_FAILURE = 1
+EXIT_INTERRUPTED = 130
+
+# The duration assumed by `jorun plan` for the tasks without history or estimate, in seconds
+PLAN_DEFAULT_ESTIMATE = 1.0
+
+API_DEFAULT_HOST = "127.0.0.1"
+# Required on the commands, so that web pages can't send them
+API_CLIENT_HEADER = "X-Jorun-Api"
+API_TOKEN_ENVIRONMENT_VARIABLE = "JORUN_API_TOKEN"
+API_RING_LINES = 10000
+API_STREAM_BATCH_LINES = 1000
+# A subscriber whose unsent output exceeds this is waited for, and dropped if it doesn't catch up in time
+API_CLIENT_BUFFER_LIMIT = 1024 * 1024
+API_CLIENT_DRAIN_TIMEOUT = 5
+API_FORWARD_INTERVAL = 0.05
+
+DAEMON_START_TIMEOUT = 60
+DAEMON_STOP_TIMEOUT = 30
+DAEMON_POLL_INTERVAL = 0.2
+
+# The entry point group where other packages declare their task handlers, by task type
+HANDLER_ENTRY_POINT_GROUP = "jorun.handlers"
+DOCKER_EXECUTABLE = "docker"
+DOCKER_HASH_LABEL = "jorun.hash"
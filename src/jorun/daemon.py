@@ -0,0 +1,246 @@
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Callable
+
+from . import constants
+from .configuration import load_config, task_hash
+from .logger import logger
+from .types.task import Task
+
+
+def socket_path(configuration_file: str) -> str:
+    """
+    Each configuration file gets its own daemon, reachable through a socket named after the file path
+    """
+    runtime_dir = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), "jorun")
+    digest = hashlib.sha1(os.path.realpath(configuration_file).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(runtime_dir, f"{digest}.sock")
+
+
+def log_path(configuration_file: str) -> str:
+    return os.path.splitext(socket_path(configuration_file))[0] + ".log"
+
+
+def persistent_tasks(tasks: Dict[str, Task]) -> Dict[str, Task]:
+    """
+    Returns the tasks kept alive by the daemon: the `indefinite` ones and everything they depend on
+    """
+    selected: Dict[str, Task] = {}
+    pending = [name for name, t in tasks.items() if t.get("run_mode") == "indefinite"]
+
+    while pending:
+        name = pending.pop()
+        if name in selected or name not in tasks:
+            continue
+        selected[name] = tasks[name]
+        pending.extend(d["task"] for d in tasks[name].get("depends") or [])
+
+    return {name: t for name, t in tasks.items() if name in selected}
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    _path: str
+
+    def __init__(self, path: str):
+        super(UnixHTTPConnection, self).__init__("localhost")
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self._path)
+
+
+class DaemonClient:
+    """
+    Talks to the daemon API. A socket nobody listens on is left by a daemon that died, and is removed
+    """
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _request(self, method: str, url: str) -> Optional[any]:
+        if not os.path.exists(self.path):
+            return None
+
+        connection = UnixHTTPConnection(self.path)
+        try:
+            headers = {constants.API_CLIENT_HEADER: "1"}
+            token = os.environ.get(constants.API_TOKEN_ENVIRONMENT_VARIABLE)
+            if token:
+                headers["Authorization"] = f"Bearer {token}"
+            connection.request(method, url, headers=headers)
+            return json.loads(connection.getresponse().read())
+        except ConnectionRefusedError:
+            logger.debug(f"Removing the stale daemon socket {self.path}")
+            os.unlink(self.path)
+            return None
+        except (FileNotFoundError, ConnectionResetError, http.client.RemoteDisconnected):
+            # Gone, or going away
+            return None
+        finally:
+            connection.close()
+
+    def tasks(self) -> Optional[List[dict]]:
+        return self._request("GET", "/tasks")
+
+    def shutdown(self) -> bool:
+        return self._request("POST", "/shutdown") is not None
+
+    def wait_down(self, timeout: float = constants.DAEMON_STOP_TIMEOUT) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.tasks() is not None:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(constants.DAEMON_POLL_INTERVAL)
+        return True
+
+
+def _outdated(tasks: Dict[str, Task], running: List[dict]) -> List[str]:
+    running_hashes = {t["name"]: t["hash"] for t in running}
+    return [name for name, t in tasks.items() if running_hashes.get(name) != task_hash(t)]
+
+
+def _wait_ready(client: DaemonClient, names: List[str], process: Optional[subprocess.Popen] = None,
+                timeout: float = constants.DAEMON_START_TIMEOUT) -> Optional[List[dict]]:
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if process and process.poll() is not None:
+            return None
+
+        running = client.tasks()
+        if running is not None:
+            states = {t["name"]: t for t in running}
+            waiting = [n for n in names if states.get(n, {}).get("running") and "ready" not in states[n]["states"]]
+            if not waiting:
+                return running
+
+        time.sleep(constants.DAEMON_POLL_INTERVAL)
+
+    return None
+
+
+def adopt_tasks(configuration_file: str, tasks: Dict[str, Task]) -> Dict[str, Dict[str, float]]:
+    """
+    Returns the states of the tasks the daemon of this configuration already runs, up to date and alive,
+    so that they don't need to be run again
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        return {}
+
+    client = DaemonClient(socket_path(configuration_file))
+    running = client.tasks()
+    if running is None:
+        return {}
+
+    candidates = []
+    for t in running:
+        local = tasks.get(t["name"])
+        if not local:
+            continue
+
+        if t["hash"] != task_hash(local):
+            logger.warning(f"The daemon runs an outdated configuration of task {t['name']}, running it here. "
+                           f"Run jorun up to update the daemon")
+        elif not t["running"] and "succeeded" not in t["states"]:
+            logger.warning(f"Task {t['name']} is no longer running in the daemon, running it here")
+        else:
+            candidates.append(t["name"])
+
+    # Tasks still starting up in the daemon are waited for, the runner doesn't follow them afterwards
+    running = _wait_ready(client, candidates) or []
+    adopted = {t["name"]: t["states"] for t in running if t["name"] in candidates}
+
+    if adopted:
+        logger.info(f"Using tasks {', '.join(adopted)} from the daemon")
+    return adopted
+
+
+up_parser = argparse.ArgumentParser(prog="jorun up", description="Start the daemon keeping the indefinite tasks "
+                                                                 "of a configuration alive")
+up_parser.add_argument("configuration_file", help="The yml configuration file")
+up_parser.add_argument("--detach", help="Run the daemon in the background", action="store_true")
+up_parser.add_argument("--level", help="The log level (DEBUG, INFO, ...)", default="INFO", type=str)
+
+control_parser = argparse.ArgumentParser(prog="jorun", description="Control the daemon of a configuration")
+control_parser.add_argument("configuration_file", help="The yml configuration file")
+control_parser.add_argument("--level", help="The log level (DEBUG, INFO, ...)", default="INFO", type=str)
+
+
+def up(argv: List[str], run_daemon: Callable[[List[str]], None]):
+    arguments = up_parser.parse_args(argv)
+    logger.setLevel(arguments.level)
+
+    tasks = persistent_tasks(load_config(arguments.configuration_file)["tasks"])
+    client = DaemonClient(socket_path(arguments.configuration_file))
+
+    running = client.tasks()
+    if running is not None:
+        outdated = _outdated(tasks, running)
+        if not outdated:
+            logger.info("The daemon is already up")
+            return
+
+        logger.info(f"Tasks {', '.join(outdated)} changed, restarting the daemon")
+        client.shutdown()
+        if not client.wait_down():
+            raise RuntimeError("The daemon didn't stop in time")
+
+    daemon_argv = [arguments.configuration_file, "--level", arguments.level]
+    if not arguments.detach:
+        return run_daemon(daemon_argv)
+
+    os.makedirs(os.path.dirname(client.path), exist_ok=True)
+    with open(log_path(arguments.configuration_file), "a") as log_file:
+        process = subprocess.Popen([sys.executable, "-m", "jorun.main", "daemon", *daemon_argv],
+                                   stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+
+    if _wait_ready(client, list(tasks.keys()), process) is None:
+        raise RuntimeError(f"The daemon didn't start, see {log_path(arguments.configuration_file)}")
+
+    logger.info(f"Daemon {process.pid} up, running {', '.join(tasks.keys())}")
+
+
+def down(argv: List[str]):
+    arguments = control_parser.parse_args(argv)
+    logger.setLevel(arguments.level)
+
+    client = DaemonClient(socket_path(arguments.configuration_file))
+    if not client.shutdown():
+        logger.info("No daemon running")
+        return
+
+    if not client.wait_down():
+        raise RuntimeError("The daemon didn't stop in time")
+    logger.info("Daemon stopped")
+
+
+def status(argv: List[str]):
+    arguments = control_parser.parse_args(argv)
+    logger.setLevel(arguments.level)
+
+    tasks = load_config(arguments.configuration_file)["tasks"]
+    running = DaemonClient(socket_path(arguments.configuration_file)).tasks()
+    if running is None:
+        print("No daemon running")
+        return
+
+    now = time.time()
+    for t in running:
+        local = tasks.get(t["name"])
+        ready = t["states"].get("ready")
+
+        state = "running" if t["running"] else "stopped"
+        since = f", ready for {now - ready:.0f}s" if ready else ""
+        outdated = "" if local and task_hash(local) == t["hash"] else " (outdated)"
+        print(f"{t['name']}: {state}{since}{outdated}")
@@ -0,0 +1,242 @@
+import asyncio
+import enum
+import logging
+import multiprocessing
+import sys
+import time
+from collections import deque, defaultdict
+from logging.handlers import QueueHandler
+from typing import TypedDict, Optional, Union, Dict, Deque
+
+from tinyioc import register_instance
+
+from . import constants
+from .grouped import GroupedOutputHandler
+from .limits import parse_size
+from .logger import logger, NewlineStreamHandler
+
+
+class OverflowPolicy(enum.Enum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop-oldest"
+    SAMPLE = "sample"
+
+
+class BackpressureConfiguration(TypedDict):
+    policy: Optional[str]
+    budget: Optional[Union[int, str]]
+
+
+class OutputLedger:
+    """
+    Counts the output bytes sent to the GUI and the ones it displayed, shared between the processes.
+    The scheduler gives each task its own slot, sent along with the task definition and the output records
+    """
+    slots: int
+
+    _produced: multiprocessing.Array
+    _consumed: multiprocessing.Array
+    _total_produced: multiprocessing.Value
+    _total_consumed: multiprocessing.Value
+
+    def __init__(self, slots: int = constants.FLOW_CONTROL_SLOTS):
+        self.slots = slots
+        # The producing side is written under the lock of the total, a restarted task may run in another worker
+        # while the output of its previous run is still being sent. The UI thread is the only consumer
+        self._produced = multiprocessing.Array('q', slots, lock=False)
+        self._consumed = multiprocessing.Array('q', slots, lock=False)
+        self._total_produced = multiprocessing.Value('q', 0)
+        self._total_consumed = multiprocessing.Value('q', 0, lock=False)
+
+    def produced(self, slot: int, n_bytes: int):
+        with self._total_produced.get_lock():
+            self._produced[slot] += n_bytes
+            self._total_produced.value += n_bytes
+
+    def consumed(self, slot: int, n_bytes: int):
+        self._consumed[slot] += n_bytes
+        self._total_consumed.value += n_bytes
+
+    def in_flight(self, slot: int) -> int:
+        return self._produced[slot] - self._consumed[slot]
+
+    def total_in_flight(self) -> int:
+        return self._total_produced.value - self._total_consumed.value
+
+
+class FlowController:
+    """
+    Decides, on the producer side, whether the output of a task fits in the per-task and global budgets
+    """
+    ledger: OutputLedger
+
+    _budget: int
+    _task_budget: int
+    _policy: OverflowPolicy
+    _task_overrides: Dict[str, BackpressureConfiguration]
+    _slots: Dict[str, int]
+    _throttled: Dict[str, float]
+    _dropped: Dict[str, int]
+
+    def __init__(self, ledger: OutputLedger, arguments: any):
+        self.ledger = ledger
+        self._budget = parse_size(arguments.output_budget)
+        self._task_budget = parse_size(arguments.task_output_budget)
+        self._policy = OverflowPolicy(arguments.overflow_policy)
+        self._task_overrides = {}
+        self._slots = {}
+        self._throttled = defaultdict(float)
+        self._dropped = defaultdict(int)
+
+    def configure_task(self, name: str, configuration: Optional[BackpressureConfiguration], slot: int):
+        self._slots[name] = slot
+        if configuration:
+            self._task_overrides[name] = configuration
+
+    def slot(self, task: str) -> int:
+        return self._slots[task]
+
+    def policy(self, task: str) -> OverflowPolicy:
+        override = self._task_overrides.get(task, {}).get("policy")
+        return OverflowPolicy(override) if override else self._policy
+
+    def task_budget(self, task: str) -> int:
+        override = self._task_overrides.get(task, {}).get("budget")
+        return parse_size(override) if override else self._task_budget
+
+    def over_global_budget(self) -> bool:
+        return self.ledger.total_in_flight() > self._budget
+
+    def over_budget(self, task: str) -> bool:
+        return self.ledger.in_flight(self._slots[task]) > self.task_budget(task) or self.over_global_budget()
+
+    async def wait_for_capacity(self, task: str):
+        """
+        Waits until the output of the task fits in the budgets. Meanwhile the task pipe is not read,
+        so the child process blocks as soon as the pipe is full
+        """
+        if not self.over_budget(task):
+            return
+
+        start = time.monotonic()
+        while self.over_budget(task):
+            await asyncio.sleep(constants.FLOW_CONTROL_POLL_INTERVAL)
+        self._throttled[task] += time.monotonic() - start
+
+    def record_dropped(self, task: str, lines: int):
+        self._dropped[task] += lines
+
+    def log_metrics(self):
+        for task, seconds in self._throttled.items():
+            logger.info(f"Output of task {task} throttled for {seconds:.2f}s")
+        for task, lines in self._dropped.items():
+            logger.info(f"Output of task {task}: {lines} lines dropped")
+
+
+def record_size(record: logging.LogRecord) -> int:
+    """
+    The encoded size of an output line, which the budgets are about
+    """
+    return len(record.msg.encode("utf-8", errors="replace"))
+
+
+class FlowControlledQueueHandler(QueueHandler):
+    """
+    Sends the records to the GUI queue, applying the overflow policy of their task when the budgets are exceeded
+    """
+    _flow: FlowController
+    _backlog: Dict[str, Deque[logging.LogRecord]]
+    _backlog_bytes: Dict[str, int]
+    _dropped: Dict[str, int]
+    _sample_counter: Dict[str, int]
+
+    def __init__(self, queue: multiprocessing.Queue, flow: FlowController):
+        super(FlowControlledQueueHandler, self).__init__(queue)
+        self._flow = flow
+        self._backlog = defaultdict(deque)
+        self._backlog_bytes = defaultdict(int)
+        self._dropped = defaultdict(int)
+        self._sample_counter = defaultdict(int)
+
+    def _enqueue(self, task: str, record: logging.LogRecord):
+        # The GUI reports the same count back once it displayed the record
+        record.flow_slot = self._flow.slot(task)
+        record.flow_size = record_size(record)
+        self._flow.ledger.produced(record.flow_slot, record.flow_size)
+        super(FlowControlledQueueHandler, self).emit(record)
+
+    def emit(self, record: logging.LogRecord):
+        task = getattr(record, "subprocess", None)
+        if task is None:
+            return super(FlowControlledQueueHandler, self).emit(record)
+
+        policy = self._flow.policy(task)
+
+        if policy == OverflowPolicy.BLOCK or \
+                (not self._backlog[task] and not self._dropped[task] and not self._flow.over_budget(task)):
+            self._enqueue(task, record)
+        elif policy == OverflowPolicy.DROP_OLDEST:
+            self._backlog[task].append(record)
+            self._backlog_bytes[task] += record_size(record)
+
+            while self._backlog_bytes[task] > self._flow.task_budget(task) and len(self._backlog[task]) > 1:
+                dropped = self._backlog[task].popleft()
+                self._backlog_bytes[task] -= record_size(dropped)
+                self._dropped[task] += 1
+        elif policy == OverflowPolicy.SAMPLE:
+            self._sample_counter[task] += 1
+            # The samples still count against the global budget, beyond it the lines are all dropped
+            if self._sample_counter[task] % constants.FLOW_CONTROL_SAMPLE_RATE == 0 \
+                    and not self._flow.over_global_budget():
+                self._enqueue(task, record)
+            else:
+                self._dropped[task] += 1
+
+    @staticmethod
+    def _marker(task: str, dropped: int) -> logging.LogRecord:
+        record = logging.LogRecord(task, logging.WARNING, __file__, 0,
+                                   f"[jorun] {dropped} lines dropped\n", None, None)
+        record.subprocess = task
+        return record
+
+    def flush_backlog(self):
+        for task in [t for t in self._backlog.keys() | self._dropped.keys()
+                     if self._backlog[t] or self._dropped[t]]:
+            if self._flow.over_budget(task):
+                continue
+
+            if self._dropped[task]:
+                self._flow.record_dropped(task, self._dropped[task])
+                self._enqueue(task, self._marker(task, self._dropped[task]))
+                self._dropped[task] = 0
+
+            backlog = self._backlog[task]
+            while backlog and not self._flow.over_budget(task):
+                record = backlog.popleft()
+                self._backlog_bytes[task] -= record_size(record)
+                self._enqueue(task, record)
+
+    async def run_backlog_flusher(self):
+        while True:
+            await asyncio.sleep(constants.FLOW_CONTROL_POLL_INTERVAL)
+            self.flush_backlog()
+
+
+def create_output_handler(show_gui: bool, output_queue: Optional[multiprocessing.Queue],
+                          ledger: Optional[OutputLedger], arguments: any,
+                          console_lock: Optional[multiprocessing.Lock] = None) -> logging.Handler:
+    """
+    Creates the handler receiving the output of the tasks: the flow controlled GUI queue, or the console
+    """
+    if not show_gui and arguments.output == "grouped":
+        return GroupedOutputHandler(sys.stdout, parse_size(arguments.output_buffer), arguments.follow, console_lock)
+    if not show_gui:
+        return NewlineStreamHandler(sys.stdout)
+
+    if not ledger:
+        return QueueHandler(output_queue)
+
+    flow = FlowController(ledger, arguments)
+    register_instance(flow)
+
+    return FlowControlledQueueHandler(output_queue, flow)
@@ -0,0 +1,114 @@
+import logging
+import multiprocessing
+import shutil
+import tempfile
+from typing import Optional, List, Dict, Set, TextIO
+
+from . import constants
+from .logger import NewlineStreamHandler
+
+
+class TaskOutputBuffer:
+    """
+    The output of a task waiting to be printed, kept in memory up to a size and spilled to a temporary file beyond it
+    """
+    _limit: int
+    _chunks: List[str]
+    _size: int
+    _spill: Optional[TextIO]
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._chunks = []
+        self._size = 0
+        self._spill = None
+
+    def write(self, text: str):
+        if self._spill:
+            self._spill.write(text)
+            return
+
+        self._chunks.append(text)
+        self._size += len(text)
+
+        if self._size > self._limit:
+            self._spill = tempfile.TemporaryFile("w+", encoding="utf-8", errors="replace")
+            self._spill.writelines(self._chunks)
+            self._chunks = []
+
+    def copy_to(self, stream: TextIO):
+        if not self._spill:
+            stream.write("".join(self._chunks))
+            return
+
+        self._spill.seek(0)
+        shutil.copyfileobj(self._spill, stream, constants.GROUPED_COPY_SIZE)
+        self._spill.close()
+
+
+class GroupedOutputHandler(NewlineStreamHandler):
+    """
+    Prints the output of each task at once when it completes, instead of interleaving the lines of the tasks
+    running together. The followed tasks are printed as they go. The lock keeps the output of the other processes,
+    the workers, from being printed in the middle of a task
+    """
+    _buffer_size: int
+    _follow: Set[str]
+    _console_lock: Optional[multiprocessing.Lock]
+    _buffers: Dict[str, TaskOutputBuffer]
+    _failed: Set[str]
+
+    def __init__(self, stream: TextIO, buffer_size: int, follow: Optional[List[str]] = None,
+                 console_lock: Optional[multiprocessing.Lock] = None):
+        super(GroupedOutputHandler, self).__init__(stream)
+        self._buffer_size = buffer_size
+        self._follow = set(follow or [])
+        self._console_lock = console_lock
+        self._buffers = {}
+        self._failed = set()
+
+    def emit(self, record: logging.LogRecord):
+        task = getattr(record, "subprocess", None)
+        if task is None or task in self._follow:
+            if self._console_lock:
+                with self._console_lock:
+                    super(GroupedOutputHandler, self).emit(record)
+            else:
+                super(GroupedOutputHandler, self).emit(record)
+            return
+
+        try:
+            buffer = self._buffers.get(task)
+            if not buffer:
+                buffer = self._buffers[task] = TaskOutputBuffer(self._buffer_size)
+            buffer.write(self.format_line(record))
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def task_state(self, task: str, state: str):
+        if state == "failed":
+            self._failed.add(task)
+        elif state == "completed":
+            self._print([task])
+
+    def _print(self, tasks: List[str]):
+        buffers = [self._buffers.pop(t) for t in tasks if t in self._buffers]
+        if not buffers:
+            return
+
+        if self._console_lock:
+            self._console_lock.acquire()
+        try:
+            for buffer in buffers:
+                buffer.copy_to(self.stream)
+            self.flush()
+        finally:
+            if self._console_lock:
+                self._console_lock.release()
+
+    def close(self):
+        # The tasks stopped with the run, the failed ones first
+        self._print(sorted(self._buffers, key=lambda t: t not in self._failed))
+        super(GroupedOutputHandler, self).close()
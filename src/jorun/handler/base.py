@@ -2,20 +2,46 @@ import abc
 from asyncio.subprocess import Process
 from typing import Callable, Optional
 
+from ..limits import ProcessLimits
 from ..types.options import TaskOptions
 
 
 class BaseTaskHandler(abc.ABC):
+    """
+    Runs the tasks of a type. Besides `execute`, the lifecycle hooks let a handler do its own I/O around the task
+    process without blocking the event loop: `prepare` before it starts, `ready` once dependent tasks can run,
+    `stop` before it is signalled to stop, and `cleanup` once it exited, whatever the reason
+    """
+
     @property
     @abc.abstractmethod
     def task_type(self) -> str:
         pass
 
-    @abc.abstractmethod
-    async def execute(self, options: Optional[TaskOptions], completion_callback: Callable, stderr_redirect: bool) \
-            -> Optional[Process]:
+    async def prepare(self, options: Optional[TaskOptions]):
         pass
 
     @abc.abstractmethod
+    async def execute(self, options: Optional[TaskOptions], completion_callback: Callable, stderr_redirect: bool,
+                      limits: Optional[ProcessLimits] = None, output: Optional[int] = None) -> Optional[Process]:
+        """
+        Starts the task process. Its stdout and stderr are piped, unless `output` is given: a file descriptor
+        receiving both directly
+        """
+        pass
+
+    async def ready(self, options: Optional[TaskOptions], process: Process):
+        pass
+
+    async def stop(self, options: Optional[TaskOptions], process: Process):
+        # The handlers written for the synchronous hook keep working
+        self.on_exit(options, process)
+
+    async def cleanup(self, options: Optional[TaskOptions], process: Process):
+        pass
+
     def on_exit(self, options: TaskOptions, process: Process):
+        """
+        Deprecated, blocks the event loop: override `stop` instead
+        """
         pass
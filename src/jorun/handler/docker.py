@@ -1,12 +1,17 @@
 import asyncio
+import hashlib
+import json
 import subprocess
 from asyncio.subprocess import Process
-from typing import Callable, Optional, Dict, List
+from typing import Callable, Optional, Dict, List, Tuple
 
+from .. import constants
+from ..errors import TaskRunException
 from ..handler.base import BaseTaskHandler
+from ..limits import ProcessLimits
 from ..logger import logger
 from ..types.options import TaskOptions
-from ..utils import get_process_group_args
+from ..utils import get_process_group_args, get_process_limits_args
 
 
 class DockerTask(TaskOptions):
@@ -17,32 +22,110 @@ class DockerTask(TaskOptions):
     environment: Optional[Dict[str, str]]
     working_directory: Optional[str]
     stop_at_exit: bool
+    reuse: Optional[bool]
+    tty: Optional[bool]
+    docker_executable: Optional[str]
 
 
 class DockerTaskHandler(BaseTaskHandler):
-    _stop_on_exit: bool
-
-    def __init__(self):
-        self._stop_on_exit = False
-
     @property
     def task_type(self) -> str:
         return "docker"
 
-    async def execute(self, options: Optional[DockerTask], completion_callback: Callable, stderr_redirect: bool) \
-            -> Optional[Process]:
-        command = ["docker", "run", "--name", options["container_name"],
-                   *(options.get("docker_arguments") or [])]
+    @staticmethod
+    def _executable(options: DockerTask) -> str:
+        return options.get("docker_executable") or constants.DOCKER_EXECUTABLE
+
+    @staticmethod
+    async def _docker_output(options: DockerTask, *arguments: str, check: bool = False) -> Tuple[int, str]:
+        process = await asyncio.create_subprocess_exec(
+            DockerTaskHandler._executable(options), *arguments,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL)
+        stdout, stderr = await process.communicate()
+
+        if check and process.returncode != 0:
+            raise TaskRunException(f"docker {arguments[0]} failed: {stderr.decode('utf-8', errors='ignore').strip()}")
+
+        return process.returncode, stdout.decode("utf-8", errors="ignore").strip()
+
+    @staticmethod
+    def _container_arguments(options: DockerTask, limits: Optional[ProcessLimits]) -> List[str]:
+        arguments = [*(options.get("docker_arguments") or [])]
+
+        if limits:
+            arguments.extend(limits.docker_arguments())
+
+        if options.get("tty"):
+            # The container output is line buffered, stdout and stderr are merged by the terminal
+            arguments.append("--tty")
 
         for env_key, env_value in (options.get("environment") or {}).items():
             env_value_s = str(env_value).replace('"', '\\"')
-            command.append("-e")
-            command.append(f'{env_key}={env_value_s}')
+            arguments.append("-e")
+            arguments.append(f'{env_key}={env_value_s}')
+
+        arguments.append(options["image"])
+        arguments.extend(options.get("docker_command") or [])
+
+        return arguments
+
+    async def _reuse_command(self, options: DockerTask, arguments: List[str]) -> List[str]:
+        """
+        Makes sure the container of the task runs with the current configuration, reusing the existing one
+        if its configuration didn't change, and returns the command following its output. The container is
+        never attached to, so that stopping the task doesn't stop it, unless `stop_at_exit` is set
+        """
+        name = options["container_name"]
+        # A reused container must survive the task
+        arguments = [a for a in arguments if a != "--rm"]
+
+        # The image is hashed by name, as it may not be pulled yet: its ID is compared with the one of the container
+        configuration_hash = hashlib.sha256(json.dumps(arguments).encode("utf-8")).hexdigest()[:16]
+        image_returncode, image_id = await self._docker_output(options, "image", "inspect", "--format", "{{.Id}}",
+                                                          options["image"])
+
+        returncode, state = await self._docker_output(
+            options, "inspect", "--format",
+            f'{{{{.State.Running}}}} {{{{.State.StartedAt}}}} {{{{.Image}}}} '
+            f'{{{{index .Config.Labels "{constants.DOCKER_HASH_LABEL}"}}}}',
+            name)
+        running, started_at, container_image, container_hash = (state.split() + ["", "", "", ""])[:4]
+        # An image that is not local anymore is left to the next pull
+        image_changed = image_returncode == 0 and image_id != container_image
+
+        if returncode == 0 and container_hash == configuration_hash and not image_changed:
+            if running != "true":
+                logger.info(f"Starting the existing container {name}")
+                await self._docker_output(options, "start", name, check=True)
+                _, started_at = await self._docker_output(options, "inspect", "--format", "{{.State.StartedAt}}",
+                                                          name)
+            else:
+                logger.info(f"Attaching to the running container {name}")
+
+            return [self._executable(options), "logs", "--follow", "--since", started_at, name]
+
+        if returncode == 0:
+            logger.info(f"The configuration of container {name} changed, replacing it")
+            await self._docker_output(options, "rm", "--force", name)
+
+        await self._docker_output(options, "run", "--detach", "--name", name,
+                                  "--label", f"{constants.DOCKER_HASH_LABEL}={configuration_hash}", *arguments,
+                                  check=True)
+
+        return [self._executable(options), "logs", "--follow", name]
+
+    async def execute(self, options: Optional[DockerTask], completion_callback: Callable, stderr_redirect: bool,
+                      limits: Optional[ProcessLimits] = None, output: Optional[int] = None) -> Optional[Process]:
+        arguments = self._container_arguments(options, limits)
 
-        command.append(options["image"])
-        command.extend(options.get("docker_command") or [])
+        if options.get("reuse"):
+            command = await self._reuse_command(options, arguments)
+        else:
+            command = [self._executable(options), "run", "--name", options["container_name"], *arguments]
 
         stderr_file = subprocess.STDOUT if stderr_redirect else subprocess.PIPE
+        if output is not None:
+            stderr_file = output
 
         logger.debug(f"Running command: {' '.join(command)}")
 
@@ -50,20 +133,17 @@ class DockerTaskHandler(BaseTaskHandler):
             command[0],
             *command[1:],
             cwd=options.get("working_directory"),
-            stdout=subprocess.PIPE,
+            stdout=subprocess.PIPE if output is None else output,
             stderr=stderr_file,
             stdin=subprocess.DEVNULL,
-            **get_process_group_args())
+            **get_process_group_args(),
+            **get_process_limits_args(limits, client_only=True))
 
-        self._stop_on_exit = options.get("stop_at_exit", False)
         return process
 
-    def on_exit(self, options: DockerTask, process: Process):
-        if self._stop_on_exit:
+    async def stop(self, options: DockerTask, process: Process):
+        if options.get("stop_at_exit", False):
             logger.info(f"Stopping docker container {options['container_name']}")
-            logger.debug(f"Stop command: {' '.join(['docker','stop', options['container_name']])}")
-            subprocess.run([
-                "docker",
-                "stop",
-                options['container_name']
-            ])
+            returncode, _ = await self._docker_output(options, "stop", options["container_name"])
+            if returncode != 0:
+                logger.warning(f"Could not stop docker container {options['container_name']}")
@@ -2,6 +2,7 @@ from asyncio.subprocess import Process
 from typing import Callable, Optional
 
 from ..handler.base import BaseTaskHandler
+from ..limits import ProcessLimits
 from ..types.options import TaskOptions
 
 
@@ -10,11 +11,8 @@ class GroupTaskHandler(BaseTaskHandler):
     def task_type(self) -> str:
         return "group"
 
-    async def execute(self, options: Optional[TaskOptions], completion_callback: Callable, stderr_redirect: bool) \
-            -> Optional[Process]:
+    async def execute(self, options: Optional[TaskOptions], completion_callback: Callable, stderr_redirect: bool,
+                      limits: Optional[ProcessLimits] = None, output: Optional[int] = None) -> Optional[Process]:
         if completion_callback:
             completion_callback()
         return None
-
-    def on_exit(self, options: TaskOptions, process: Process):
-        pass
@@ -0,0 +1,67 @@
+import importlib
+from functools import lru_cache
+from typing import Dict, Any
+
+from .. import constants
+from ..errors import TaskBuildException
+from ..logger import logger
+from .base import BaseTaskHandler
+
+# Imported on first use, like the handlers of other packages
+BUILTIN_HANDLERS = {
+    "shell": "jorun.handler.shell:ShellTaskHandler",
+    "docker": "jorun.handler.docker:DockerTaskHandler",
+    "group": "jorun.handler.group:GroupTaskHandler",
+}
+
+
+@lru_cache(maxsize=None)
+def _entry_points() -> Dict[str, Any]:
+    """
+    The handlers other packages declare in the `jorun.handlers` entry point group, by task type. Only their
+    names are read here, their modules are imported when a task of their type runs
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # Python 3.7
+        return {}
+
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        group = eps.select(group=constants.HANDLER_ENTRY_POINT_GROUP)
+    else:
+        group = eps.get(constants.HANDLER_ENTRY_POINT_GROUP, [])
+
+    return {ep.name: ep for ep in group}
+
+
+def handler_exists(task_type: str) -> bool:
+    return task_type in BUILTIN_HANDLERS or task_type in _entry_points()
+
+
+def load_handler(task_type: str) -> BaseTaskHandler:
+    """
+    Imports and creates the handler of a task type, built in or declared by another package
+    """
+    if task_type in BUILTIN_HANDLERS:
+        module_name, class_name = BUILTIN_HANDLERS[task_type].split(":")
+        handler_class = getattr(importlib.import_module(module_name), class_name)
+    elif task_type in _entry_points():
+        entry_point = _entry_points()[task_type]
+        logger.debug(f"Loading the handler of task type '{task_type}' from {entry_point.value}")
+        try:
+            handler_class = entry_point.load()
+        except Exception as e:
+            raise TaskBuildException(f"Could not load the handler of task type '{task_type}': {e}")
+    else:
+        raise TaskBuildException(f"Task type '{task_type}' unrecognized")
+
+    if not isinstance(handler_class, type) or not issubclass(handler_class, BaseTaskHandler):
+        raise TaskBuildException(f"The handler of task type '{task_type}' is not a BaseTaskHandler")
+
+    handler = handler_class()
+    if handler.task_type != task_type:
+        raise TaskBuildException(f"The handler of task type '{task_type}' handles '{handler.task_type}' tasks")
+
+    return handler
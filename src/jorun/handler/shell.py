@@ -4,16 +4,22 @@ import asyncio
 from asyncio.subprocess import Process
 from typing import Callable, Optional, List, Union, Dict
 
+from tinyioc import get_service
+
 from ..types.options import TaskOptions
 from .base import BaseTaskHandler
+from ..limits import ProcessLimits
 from ..logger import logger
-from ..utils import get_process_group_args
+from ..spawn.client import SpawnClient
+from ..tty import tty_supported, open_tty, tty_environment, read_tty
+from ..utils import get_process_group_args, get_process_limits_args, direct_argv
 
 
 class ShellTask(TaskOptions):
     command: Union[str, List[str]]
     working_directory: Optional[str]
     environment: Optional[Dict[str, str]]
+    tty: Optional[bool]
 
 
 class ShellTaskHandler(BaseTaskHandler):
@@ -21,8 +27,8 @@ class ShellTaskHandler(BaseTaskHandler):
     def task_type(self) -> str:
         return "shell"
 
-    async def execute(self, options: Optional[ShellTask], completion_callback: Callable, stderr_redirect: bool) \
-            -> Optional[Process]:
+    async def execute(self, options: Optional[ShellTask], completion_callback: Callable, stderr_redirect: bool,
+                      limits: Optional[ProcessLimits] = None, output: Optional[int] = None) -> Optional[Process]:
         stderr_file = subprocess.STDOUT if stderr_redirect else subprocess.PIPE
 
         out_cmd = options['command']
@@ -37,27 +43,62 @@ class ShellTaskHandler(BaseTaskHandler):
             env_vars = dict(os.environ)
             env_vars.update({k: str(v) for k, v in envs.items()})
 
-        if not isinstance(options["command"], list):
-            process = await asyncio.create_subprocess_shell(
-                options["command"],
-                cwd=options.get("working_directory"),
-                env=env_vars,
-                stdout=subprocess.PIPE,
-                stderr=stderr_file,
-                stdin=subprocess.DEVNULL,
-                **get_process_group_args())
-        else:
-            process = await asyncio.create_subprocess_exec(
-                options["command"][0],
-                *options["command"][1:],
-                cwd=options.get("working_directory"),
-                env=env_vars,
-                stdout=subprocess.PIPE,
-                stderr=stderr_file,
-                stdin=subprocess.DEVNULL,
-                **get_process_group_args())
+        # Commands the shell would only split on whitespace are run directly, sparing a shell process
+        argv = options["command"] if isinstance(options["command"], list) else direct_argv(options["command"])
 
-        return process
+        spawner: Optional[SpawnClient] = get_service(SpawnClient)
+        limits_args = get_process_limits_args(limits)
+        tty = options.get("tty") and tty_supported()
+
+        if options.get("tty") and not tty:
+            logger.warning("Pseudo-terminals are not supported on this platform, running the task on pipes")
+
+        # The limits are applied by a preexec function, which the spawn server can't run
+        if spawner and not limits_args and not tty and output is None:
+            return await spawner.spawn(argv or ["/bin/sh", "-c", options["command"]], options.get("working_directory"),
+                                       env_vars, stderr_redirect)
 
-    def on_exit(self, options: TaskOptions, process: Process):
-        pass
+        stdout_file = subprocess.PIPE
+        master = None
+        if output is not None:
+            stdout_file = stderr_file = output
+        elif tty:
+            # Programs writing to a terminal flush every line, instead of filling a buffer
+            master, stdout_file = open_tty()
+            stderr_file = stdout_file if stderr_redirect else subprocess.PIPE
+            env_vars = tty_environment(envs)
+
+        try:
+            if argv is None:
+                process = await asyncio.create_subprocess_shell(
+                    options["command"],
+                    cwd=options.get("working_directory"),
+                    env=env_vars,
+                    stdout=stdout_file,
+                    stderr=stderr_file,
+                    stdin=subprocess.DEVNULL,
+                    **get_process_group_args(),
+                    **limits_args)
+            else:
+                process = await asyncio.create_subprocess_exec(
+                    argv[0],
+                    *argv[1:],
+                    cwd=options.get("working_directory"),
+                    env=env_vars,
+                    stdout=stdout_file,
+                    stderr=stderr_file,
+                    stdin=subprocess.DEVNULL,
+                    **get_process_group_args(),
+                    **limits_args)
+        except Exception:
+            if master is not None:
+                os.close(master)
+            raise
+        finally:
+            if master is not None:
+                os.close(stdout_file)
+
+        if master is not None:
+            process.stdout = await read_tty(master)
+
+        return process
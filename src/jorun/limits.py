@@ -0,0 +1,227 @@
+import itertools
+import os
+import platform
+from typing import TypedDict, Optional, List, Union, Callable, Dict
+
+import psutil
+
+from . import constants
+from .errors import TaskBuildException
+from .logger import logger
+
+
+class TaskLimits(TypedDict):
+    memory: Optional[Union[int, str]]
+    cpu_time: Optional[int]
+    file_size: Optional[Union[int, str]]
+    open_files: Optional[int]
+    cpus: Optional[float]
+    nice: Optional[int]
+    ionice: Optional[str]
+    ionice_level: Optional[int]
+    cpu_affinity: Optional[Union[str, List[int]]]
+    cgroup: Optional[Union[bool, str]]
+
+
+_SIZE_UNITS = {
+    "": 1,
+    "b": 1,
+    "k": 1024,
+    "m": 1024 ** 2,
+    "g": 1024 ** 3,
+    "t": 1024 ** 4
+}
+
+_IONICE_CLASSES = {
+    "realtime": 1,
+    "best-effort": 2,
+    "idle": 3
+}
+
+_auto_affinity_counter = itertools.count()
+
+
+def parse_size(value: Union[int, str]) -> int:
+    """
+    Parses a size in bytes, accepting docker-like suffixes (`512m`, `2g`, `64k`)
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        size = value
+    else:
+        text = str(value).strip().lower().rstrip("ib")
+        digits = text.rstrip("".join(_SIZE_UNITS.keys()))
+        unit = text[len(digits):]
+
+        try:
+            size = int(float(digits) * _SIZE_UNITS[unit])
+        except (KeyError, ValueError, OverflowError):
+            raise TaskBuildException(f"Invalid size '{value}'")
+
+    if size <= 0:
+        raise TaskBuildException(f"Invalid size '{value}'")
+
+    return size
+
+
+def parse_cpu_list(value: Union[str, List[int]]) -> List[int]:
+    """
+    Parses a CPU list either as a YAML list or in the `0-3,6` cpuset format
+    """
+    if isinstance(value, list):
+        return [int(c) for c in value]
+
+    cpus = []
+    for part in str(value).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+
+    return cpus
+
+
+def _available_cpus() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class ProcessLimits:
+    """
+    The resource limits of a single task run, resolved in the parent and applied in the child before exec
+    """
+    _task_name: str
+    _limits: TaskLimits
+    _cpu_affinity: Optional[List[int]]
+    _cgroup_dir: Optional[str]
+
+    def __init__(self, task_name: str, limits: TaskLimits, slot: Optional[int] = None):
+        self._task_name = task_name
+        self._limits = limits
+        self._cpu_affinity = self._resolve_cpu_affinity(slot)
+        self._cgroup_dir = None
+
+        if limits.get("ionice") and limits["ionice"] not in _IONICE_CLASSES:
+            raise TaskBuildException(f"Invalid ionice class '{limits['ionice']}' for task '{task_name}'")
+
+    @property
+    def cpu_affinity(self) -> Optional[List[int]]:
+        return self._cpu_affinity
+
+    def _resolve_cpu_affinity(self, slot: Optional[int]) -> Optional[List[int]]:
+        affinity = self._limits.get("cpu_affinity")
+        if affinity is None:
+            return None
+
+        available = _available_cpus()
+
+        if affinity == "auto":
+            # Spread tasks over the cores: shards use their index, other tasks the launch order
+            index = slot if slot is not None else next(_auto_affinity_counter)
+            return [available[index % len(available)]]
+
+        return [c for c in parse_cpu_list(affinity) if c in available] or None
+
+    def _rlimits(self) -> Dict[int, int]:
+        import resource
+
+        rlimits = {}
+        if self._limits.get("memory") is not None:
+            rlimits[resource.RLIMIT_AS] = parse_size(self._limits["memory"])
+        if self._limits.get("cpu_time") is not None:
+            rlimits[resource.RLIMIT_CPU] = int(self._limits["cpu_time"])
+        if self._limits.get("file_size") is not None:
+            rlimits[resource.RLIMIT_FSIZE] = parse_size(self._limits["file_size"])
+        if self._limits.get("open_files") is not None:
+            rlimits[resource.RLIMIT_NOFILE] = int(self._limits["open_files"])
+
+        return rlimits
+
+    def _prepare_cgroup(self) -> Optional[str]:
+        cgroup = self._limits.get("cgroup")
+        if not cgroup or platform.system() != "Linux":
+            return None
+
+        parent = os.path.join(constants.CGROUP_ROOT, cgroup if isinstance(cgroup, str) else constants.CGROUP_NAME)
+
+        if not os.path.isfile(os.path.join(constants.CGROUP_ROOT, "cgroup.controllers")):
+            logger.warning(f"cgroup v2 is not mounted at {constants.CGROUP_ROOT}, skipping cgroup placement "
+                           f"of task {self._task_name}")
+            return None
+
+        try:
+            os.makedirs(parent, exist_ok=True)
+            try:
+                with open(os.path.join(parent, "cgroup.subtree_control"), "w") as f:
+                    f.write("+cpu +memory")
+            except OSError:
+                logger.debug(f"Could not enable the cpu and memory controllers in {parent}")
+
+            task_dir = os.path.join(parent, self._task_name)
+            os.makedirs(task_dir, exist_ok=True)
+
+            if self._limits.get("memory") is not None:
+                with open(os.path.join(task_dir, "memory.max"), "w") as f:
+                    f.write(str(parse_size(self._limits["memory"])))
+            if self._limits.get("cpus") is not None:
+                with open(os.path.join(task_dir, "cpu.max"), "w") as f:
+                    period = constants.CGROUP_CPU_PERIOD
+                    f.write(f"{int(float(self._limits['cpus']) * period)} {period}")
+
+            return task_dir
+        except OSError as e:
+            logger.warning(f"cgroup filesystem not writable, skipping cgroup placement of task {self._task_name}: {e}")
+            return None
+
+    def preexec_fn(self, client_only: bool = False) -> Optional[Callable]:
+        """
+        The function to run in the child before exec. When `client_only` is set, the child is just a client
+        (e.g. the docker CLI) of the real workload, so only the scheduling priority is applied to it
+        """
+        if platform.system() == "Windows":
+            logger.warning(f"Resource limits are not supported on Windows, ignoring them for task {self._task_name}")
+            return None
+
+        import resource
+
+        rlimits = self._rlimits() if not client_only else {}
+        nice = self._limits.get("nice")
+        ionice = _IONICE_CLASSES.get(self._limits.get("ionice"))
+        ionice_level = self._limits.get("ionice_level")
+        affinity = self._cpu_affinity if not client_only else None
+        self._cgroup_dir = self._prepare_cgroup() if not client_only else None
+        cgroup_procs = os.path.join(self._cgroup_dir, "cgroup.procs") if self._cgroup_dir else None
+
+        def preexec():
+            # Runs in the forked child: keep it free of logging and allocations where possible
+            for res, value in rlimits.items():
+                _, hard = resource.getrlimit(res)
+                if hard != resource.RLIM_INFINITY:
+                    value = min(value, hard)
+                resource.setrlimit(res, (value, value))
+            if nice:
+                os.nice(nice)
+            if ionice:
+                psutil.Process().ionice(ionice, ionice_level if ionice in (1, 2) else None)
+            if affinity:
+                os.sched_setaffinity(0, affinity)
+            if cgroup_procs:
+                with open(cgroup_procs, "w") as f:
+                    f.write(str(os.getpid()))
+
+        return preexec
+
+    def docker_arguments(self) -> List[str]:
+        args = []
+        if self._limits.get("cpus") is not None:
+            args.extend(["--cpus", str(self._limits["cpus"])])
+        if self._limits.get("memory") is not None:
+            args.extend(["--memory", str(parse_size(self._limits["memory"]))])
+        if self._cpu_affinity:
+            args.extend(["--cpuset-cpus", ",".join(str(c) for c in self._cpu_affinity)])
+
+        return args
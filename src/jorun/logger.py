@@ -3,17 +3,18 @@ import sys
 
 
 class NewlineStreamHandler(logging.StreamHandler):
-    def emit(self, record):
-        try:
-            msg = self.format(record)
+    def format_line(self, record) -> str:
+        msg = self.format(record)
+
+        if hasattr(record, 'subprocess'):
+            msg = f"[{record.subprocess}]: {msg}"
 
-            if hasattr(record, 'subprocess'):
-                msg = f"[{record.subprocess}]: {msg}"
+        return msg if msg.endswith(self.terminator) else msg + self.terminator
 
-            stream = self.stream
+    def emit(self, record):
+        try:
             # issue 35046: merged two stream.writes into one.
-            final_message = msg if msg.endswith(self.terminator) else msg + self.terminator
-            stream.write(final_message)
+            self.stream.write(self.format_line(record))
             self.flush()
         except RecursionError:  # See issue 36272
             raise
@@ -1,13 +1,19 @@
 #!/usr/bin/env python
 import argparse
 import multiprocessing
+import os
+import sys
 import traceback
 from multiprocessing import Queue
+from typing import List
 from tinyioc import register_singleton, register_instance
 
 from .palette.hacker import HackerColorPalette
 from .palette.kimbie_dark import KimbieDarkColorPalette
 from .palette.solarized_dark import SolarizedDarkColorPalette
+from . import constants, daemon, plan, profiling
+from .flow import OutputLedger, OverflowPolicy
+from .remote import agent
 from .runner_process import RunnerProcess
 from .ui.command_handler import TaskCommandHandler
 from .palette.base import BaseColorPalette
@@ -15,18 +21,71 @@ from .palette.darcula import DarculaColorPalette
 from .palette.monokai import MonokaiColorPalette
 from .ui.application import UiApplication
 
-from .configuration import load_config
+from .configuration import load_config, select_tasks, satisfied_states
 from .types.task import TasksConfiguration, GuiConfiguration
 from .logger import logger
 
 parser = argparse.ArgumentParser(prog="jorun", description="A smart task runner", add_help=True)
 
 parser.add_argument("configuration_file", help="The yml configuration file to run")
+parser.add_argument("targets", help="The tasks to run, along with the tasks they depend on. All the tasks if none "
+                                    "is given", nargs="*")
+parser.add_argument("--exclude", help="Don't run this task, the tasks depending on it don't wait for it",
+                    action="append", default=[], metavar="TASK")
+parser.add_argument("--dry-run", help="Print the tasks that would run, without running them", action="store_true")
 parser.add_argument("--level", help="The log level (DEBUG, INFO, ...)", default="INFO", type=str)
 parser.add_argument("--file-output", help="Log tasks output to files, one per task. "
                                           "This option lets you specify the directory of the log files", type=str)
 parser.add_argument("--gui", help="Force running with the graphical interface", action='store_true')
 parser.add_argument("--no-gui", help="Force running without the graphical interface", action='store_true')
+parser.add_argument("--output-budget", help="The maximum size of the output waiting to be displayed by the "
+                                            "graphical interface (e.g. 64m)",
+                    default=constants.DEFAULT_OUTPUT_BUDGET, type=str)
+parser.add_argument("--task-output-budget", help="The maximum size of the output of a single task waiting to be "
+                                                 "displayed by the graphical interface (e.g. 8m)",
+                    default=constants.DEFAULT_TASK_OUTPUT_BUDGET, type=str)
+parser.add_argument("--overflow-policy", help="What to do with the output exceeding the budgets: block the task, "
+                                              "drop the oldest lines, or sample them",
+                    choices=[p.value for p in OverflowPolicy], default=constants.DEFAULT_OVERFLOW_POLICY, type=str)
+parser.add_argument("--output", help="Without the GUI, print the output of the tasks as it comes, or the whole output "
+                                     "of each task at once when it completes",
+                    choices=["stream", "grouped"], default="stream", type=str)
+parser.add_argument("--follow", help="With --output=grouped, print the output of this task as it comes",
+                    action="append", metavar="TASK")
+parser.add_argument("--output-buffer", help="With --output=grouped, the output of a task kept in memory before "
+                                            "going to a temporary file (e.g. 1m)",
+                    default=constants.DEFAULT_OUTPUT_BUFFER, type=str)
+parser.add_argument("--api-port", help="Serve the tasks state, commands and output on this localhost port",
+                    type=int)
+parser.add_argument("--api-host", help="The address the API listens on", default=constants.API_DEFAULT_HOST,
+                    type=str)
+parser.add_argument("--api-socket", help="Serve the API on this Unix socket", type=str)
+parser.add_argument("--api-token", help=f"Require this token from the API clients, as a bearer token or a `token` "
+                                        f"parameter. Defaults to the {constants.API_TOKEN_ENVIRONMENT_VARIABLE} "
+                                        f"environment variable",
+                    default=os.environ.get(constants.API_TOKEN_ENVIRONMENT_VARIABLE), type=str)
+parser.add_argument("--workers", help="Spread the tasks output handling over this many worker processes. "
+                                      "Defaults to the number of cores if no value is given",
+                    nargs="?", const=os.cpu_count() or 1, default=0, type=int)
+parser.add_argument("--on-failure", help="What to do when a task fails: stop the whole run, keep running the tasks "
+                                         "that don't depend on it, or ignore the failure",
+                    choices=constants.FAILURE_POLICIES, default=constants.DEFAULT_FAILURE_POLICY, type=str)
+parser.add_argument("--direct-output", help="Without the GUI, let the tasks that have no completion pattern write "
+                                            "their output straight to their --file-output log file, instead of "
+                                            "to the console", action="store_true")
+parser.add_argument("--timings", help="Add the time the tasks took to this timings history file, "
+                                      "for jorun plan --history", type=str)
+parser.add_argument("--watch", help="Reload the configuration file when it changes, restarting only the tasks "
+                                    "affected by the change", action="store_true")
+parser.add_argument("--profile", help="Profile the CPU time or the memory allocations of each process, writing a "
+                                     "profile per process when the run ends, or when jorun receives SIGUSR1",
+                    choices=["cpu", "alloc"], type=str)
+parser.add_argument("--profile-dir", help="The directory of the --profile files", default=".", type=str)
+parser.add_argument("--slow-callback", help="Log the stack of the callbacks keeping the tasks event loop busy longer "
+                                            "than this many seconds (default 0.1 with --profile)", type=float)
+parser.add_argument("--spawn-server", help="Launch the tasks processes from a small helper process, much faster to "
+                                           "fork than the runner when running many short-lived tasks",
+                    action="store_true")
 
 program_arguments: argparse.Namespace
 
@@ -45,14 +104,69 @@ palettes = {
 }
 
 
+def run_daemon(argv: List[str]):
+    """
+    Runs the indefinite tasks of a configuration, and their dependencies, until told to stop through the API
+    """
+    arguments = parser.parse_args(argv)
+    logger.setLevel(arguments.level)
+
+    config: TasksConfiguration = load_config(arguments.configuration_file)
+    tasks = daemon.persistent_tasks(config["tasks"])
+    if not tasks:
+        raise RuntimeError("No indefinite tasks to keep running")
+
+    arguments.no_gui = True
+    # jorun up restarts the daemon when the configuration changes
+    arguments.watch = False
+    arguments.api_socket = arguments.api_socket or daemon.socket_path(arguments.configuration_file)
+    os.makedirs(os.path.dirname(arguments.api_socket), exist_ok=True)
+
+    if daemon.DaemonClient(arguments.api_socket).tasks() is not None:
+        raise RuntimeError(f"A daemon is already listening on {arguments.api_socket}")
+
+    term_recv, term_snd = multiprocessing.Pipe()
+    runner_process = RunnerProcess(tasks, arguments, False, task_streams_queue, task_commands_queue,
+                                   task_messages_queue, term_snd, config.get("agents"))
+    runner_process.start()
+
+    try:
+        runner_process.join()
+    except KeyboardInterrupt:
+        logger.debug("Requested termination")
+    finally:
+        runner_process.stop(10)
+
+
+commands = {
+    "agent": agent.main,
+    "daemon": run_daemon,
+    "up": lambda argv: daemon.up(argv, run_daemon),
+    "down": daemon.down,
+    "status": daemon.status,
+    "plan": plan.main,
+}
+
+
 def main():
     global program_arguments, ui_application
 
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        return commands[sys.argv[1]](sys.argv[2:])
+
     program_arguments = parser.parse_args()
     logger.setLevel(program_arguments.level)
 
     logger.debug("Loading configuration file")
     config: TasksConfiguration = load_config(program_arguments.configuration_file)
+    config, excluded = select_tasks(config, program_arguments.targets, program_arguments.exclude)
+
+    if program_arguments.dry_run:
+        for name in config["tasks"]:
+            print(name)
+        for name in excluded:
+            print(f"{name} (excluded, assumed done)")
+        return 0
 
     missing_tasks = config["tasks"].copy()
 
@@ -77,8 +191,20 @@ def main():
 
     term_recv, term_snd = multiprocessing.Pipe()
 
+    profiler = profiling.start_profiler(program_arguments, "gui" if show_gui else "main")
+
+    output_ledger = None
+    if show_gui:
+        # Room for the tasks added by reloading the configuration
+        output_ledger = OutputLedger(max(constants.FLOW_CONTROL_SLOTS, 2 * len(tasks_config)))
+        register_instance(output_ledger)
+
+    external_states = {name: satisfied_states() for name in excluded}
+    external_states.update(daemon.adopt_tasks(program_arguments.configuration_file, tasks_config))
+
     runner_process = RunnerProcess(tasks_config, program_arguments, show_gui, task_streams_queue, task_commands_queue,
-                                   task_messages_queue, term_snd)
+                                   task_messages_queue, term_snd, config.get("agents"), output_ledger,
+                                   external_states)
     runner_process.start()
 
     try:
@@ -102,8 +228,16 @@ def main():
         logger.debug("Quitting the tasks")
         runner_process.stop(10)
 
+        if profiler:
+            profiler.stop()
+
     logger.debug("Terminated")
 
+    # A runner killed by a signal has a negative exit code
+    if runner_process.exitcode:
+        return runner_process.exitcode if runner_process.exitcode > 0 else constants.EXIT_FAILURE
+    return 0
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import re
+from typing import Optional, List
+
+# The escapes standing for a class of characters or a position, which break a literal run
+_CLASS_ESCAPES = "wWdDsSbBAZ"
+_CHARACTER_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "f": "\f", "v": "\v", "a": "\a"}
+_QUANTIFIER = re.compile(r"\{(\d*)(?:,(\d*))?\}")
+_GLOBAL_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+
+
+def _class_end(pattern: str, start: int) -> int:
+    """
+    Returns the index following the character class starting at `start`
+    """
+    i = start + 1
+    if i < len(pattern) and pattern[i] == "^":
+        i += 1
+    # A leading `]` is part of the class
+    if i < len(pattern) and pattern[i] == "]":
+        i += 1
+    while i < len(pattern) and pattern[i] != "]":
+        i += 2 if pattern[i] == "\\" else 1
+    return i + 1
+
+
+def required_literal(pattern: str) -> Optional[str]:
+    """
+    Returns the longest literal that any string matched by `pattern` must contain, if there is one. Only the
+    literals outside of groups are considered, and patterns with alternatives, case-insensitive or verbose flags
+    have none: the result may miss a literal, never return one that is not required
+    """
+    if any(set(flags) & {"i", "x"} for flags in _GLOBAL_FLAGS.findall(pattern)):
+        return None
+
+    runs: List[str] = []
+    current: List[str] = []
+    depth = 0
+    # Whether the last atom is the last character of `current`, which a quantifier applies to
+    last_literal = False
+
+    def flush():
+        if current:
+            runs.append("".join(current))
+            current.clear()
+
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        literal = None
+
+        if c == "\\":
+            if i + 1 == len(pattern):
+                return None
+            escaped = pattern[i + 1]
+            if escaped in _CHARACTER_ESCAPES:
+                literal = _CHARACTER_ESCAPES[escaped]
+            elif not escaped.isalnum():
+                literal = escaped
+            elif escaped not in _CLASS_ESCAPES:
+                # Backreferences, numeric and named characters
+                return None
+            i += 2
+        elif c == "[":
+            i = _class_end(pattern, i)
+        elif c in "*?+{":
+            quantifier = _QUANTIFIER.match(pattern, i) if c == "{" else None
+            if c == "{" and not quantifier:
+                literal = c
+                i += 1
+            else:
+                optional = c in "*?" or (quantifier and not quantifier.group(1).strip("0"))
+                if last_literal and optional:
+                    current.pop()
+                flush()
+                i = quantifier.end() if quantifier else i + 1
+                # Lazy and possessive quantifiers
+                if i < len(pattern) and pattern[i] in "?+":
+                    i += 1
+                last_literal = False
+                continue
+        elif c == "|":
+            if depth == 0:
+                return None
+            i += 1
+        else:
+            if c == "(":
+                depth += 1
+            elif c == ")":
+                depth -= 1
+            elif c not in ".^$":
+                literal = c
+            i += 1
+
+        if literal is not None and depth == 0:
+            current.append(literal)
+            last_literal = True
+        else:
+            flush()
+            last_literal = False
+
+    flush()
+    return max(runs, key=len) if runs else None
+
+
+class PatternMatcher:
+    """
+    Matches a pattern against raw output bytes. A literal required by the pattern is searched first with
+    `bytes.find`, so that only the lines that can actually match are decoded and matched by the regex, which
+    keeps the Unicode semantics of `\\w`, `\\d`, `.` and of the character classes
+    """
+    pattern: str
+    literal: Optional[bytes]
+
+    _regex: re.Pattern
+    _search: bool
+
+    def __init__(self, pattern: str, search: bool = False):
+        self.pattern = pattern
+        self._regex = re.compile(pattern)
+        self._search = search
+        literal = required_literal(pattern)
+        self.literal = literal.encode("utf-8") if literal else None
+
+    def _test(self, line: str) -> bool:
+        return (self._regex.search(line) if self._search else self._regex.match(line)) is not None
+
+    @staticmethod
+    def _decode(data: bytes) -> str:
+        # Invalid bytes are replaced rather than dropped, so that they don't make up a literal that isn't there
+        return data.decode("utf-8", errors="replace")
+
+    def match_line(self, line: bytes) -> bool:
+        if self.literal and self.literal not in line:
+            return False
+
+        return self._test(self._decode(line))
+
+    def scan(self, chunk: bytes) -> bool:
+        """
+        Returns whether any line of `chunk`, made of whole lines, matches the pattern
+        """
+        if not self.literal:
+            text = self._decode(chunk)
+            start = 0
+            while start < len(text):
+                end = text.find("\n", start)
+                end = len(text) if end == -1 else end + 1
+                if self._test(text[start:end]):
+                    return True
+                start = end
+
+            return False
+
+        idx = chunk.find(self.literal)
+        while idx != -1:
+            start = chunk.rfind(b"\n", 0, idx) + 1
+            end = chunk.find(b"\n", idx)
+            end = len(chunk) if end == -1 else end + 1
+
+            if self._test(self._decode(chunk[start:end])):
+                return True
+
+            idx = chunk.find(self.literal, end)
+
+        return False
@@ -1,5 +1,6 @@
 import enum
 from dataclasses import dataclass
+from typing import Optional, Dict, List
 
 
 class TaskStatus(enum.Enum):
@@ -11,6 +12,7 @@ class TaskStatus(enum.Enum):
 class TaskCommand(enum.Enum):
     START = 1
     STOP = 2
+    RESTART = 3
 
 
 @dataclass
@@ -32,3 +34,42 @@ class TaskCommandMessage:
     type: str = "task-command"
 
 
+@dataclass
+class ConfigurationMessage:
+    tasks: List[str]
+    panes: Optional[Dict[str, dict]]
+    type: str = "configuration"
+
+
+class WorkerCommand(enum.Enum):
+    START = 1
+    STOP = 2
+    SHUTDOWN = 3
+
+
+class WorkerEvent(enum.Enum):
+    READY = 1
+    EXITED = 2
+    OUTPUT_VOLUME = 3
+    STATE = 4
+    OUTPUT = 5
+    USAGE = 6
+
+
+@dataclass
+class WorkerCommandMessage:
+    command: WorkerCommand
+    task: Optional[str] = None
+    definition: Optional[dict] = None
+    type: str = "worker-command"
+
+
+@dataclass
+class WorkerEventMessage:
+    event: WorkerEvent
+    task: Optional[str] = None
+    volume: Optional[Dict[str, int]] = None
+    state: Optional[str] = None
+    output: Optional[Dict[str, List[str]]] = None
+    usage: Optional[dict] = None
+    type: str = "worker-event"
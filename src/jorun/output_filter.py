@@ -0,0 +1,130 @@
+import time
+from typing import TypedDict, Optional, Union, List
+
+from .matcher import PatternMatcher
+
+
+class OutputConfiguration(TypedDict):
+    include: Optional[Union[str, List[str]]]
+    exclude: Optional[Union[str, List[str]]]
+    rate_limit: Optional[float]
+    burst: Optional[int]
+    collapse_repeats: Optional[bool]
+
+
+def _as_list(patterns: Optional[Union[str, List[str]]]) -> List[str]:
+    if not patterns:
+        return []
+    return [patterns] if isinstance(patterns, str) else list(patterns)
+
+
+class OutputFilter:
+    """
+    Applies the output rules of a task to its lines before they are logged: include and exclude patterns,
+    a token bucket rate limit and the collapsing of repeated lines
+    """
+    _include: List[PatternMatcher]
+    _exclude: List[PatternMatcher]
+
+    _rate: Optional[float]
+    _burst: float
+    _tokens: float
+    _last_refill: float
+    _suppressed: int
+
+    _collapse: bool
+    _last_line: Optional[bytes]
+    _repeats: int
+
+    def __init__(self, configuration: OutputConfiguration):
+        self._include = [PatternMatcher(p, search=True) for p in _as_list(configuration.get("include"))]
+        self._exclude = [PatternMatcher(p, search=True) for p in _as_list(configuration.get("exclude"))]
+
+        self._rate = configuration.get("rate_limit")
+        # The bucket holds at least the token a line takes, whatever the rate
+        self._burst = max(1.0, configuration.get("burst") or self._rate or 0)
+        self._tokens = self._burst
+        self._last_refill = time.monotonic()
+        self._suppressed = 0
+
+        self._collapse = bool(configuration.get("collapse_repeats"))
+        self._last_line = None
+        self._repeats = 0
+
+    @staticmethod
+    def _active(matchers: List[PatternMatcher], block: bytes) -> List[PatternMatcher]:
+        # A pattern whose required literal is nowhere in the block cannot match any of its lines
+        return [m for m in matchers if not m.literal or m.literal in block]
+
+    def apply(self, block: bytes) -> List[str]:
+        """
+        Returns the lines of `block` to be logged, made of whole lines except for a trailing partial line
+        """
+        include = self._active(self._include, block)
+        exclude = self._active(self._exclude, block)
+
+        if self._include and not include:
+            return []
+
+        lines = block.split(b"\n")
+        last = lines.pop()
+        result: List[str] = []
+
+        for line in lines:
+            self._filter_line(line, b"\n", include, exclude, result)
+        if last:
+            self._filter_line(last, b"", include, exclude, result)
+
+        return result
+
+    def _filter_line(self, line: bytes, terminator: bytes, include: List[PatternMatcher],
+                     exclude: List[PatternMatcher], result: List[str]):
+        if include and not any(m.match_line(line) for m in include):
+            return
+        if exclude and any(m.match_line(line) for m in exclude):
+            return
+
+        if self._collapse:
+            if line == self._last_line:
+                self._repeats += 1
+                return
+
+            self._flush_repeats(result)
+            self._last_line = line
+
+        if self._rate and not self._take_token():
+            self._suppressed += 1
+            return
+
+        self._flush_suppressed(result)
+        result.append((line + terminator).decode('utf-8', errors='ignore'))
+
+    def _take_token(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._last_refill) * self._rate)
+        self._last_refill = now
+
+        if self._tokens < 1:
+            return False
+
+        self._tokens -= 1
+        return True
+
+    def _flush_repeats(self, result: List[str]):
+        if self._repeats:
+            result.append(f"[jorun] last line repeated {self._repeats} times\n")
+            self._repeats = 0
+
+    def _flush_suppressed(self, result: List[str]):
+        if self._suppressed:
+            result.append(f"[jorun] {self._suppressed} lines suppressed by the rate limit\n")
+            self._suppressed = 0
+
+    def flush(self) -> List[str]:
+        """
+        Returns the pending markers, when the output of the task ends
+        """
+        result: List[str] = []
+        self._flush_repeats(result)
+        self._flush_suppressed(result)
+        return result
@@ -0,0 +1,394 @@
+import argparse
+import heapq
+import json
+import os
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple, Set
+
+from . import constants
+from .configuration import load_config
+from .logger import logger
+from .types.task import Task
+
+# The dependency conditions by strength, a condition is reached no earlier than the weaker ones
+CONDITION_LEVELS = {c: i for i, c in enumerate(constants.DEPENDENCY_CONDITIONS)}
+STARTED = CONDITION_LEVELS["started"]
+
+POLICIES = ("fifo", "critical-path", "longest-first", "shortest-first")
+
+
+class TaskGraph:
+    """
+    The dependency graph of a configuration, with the tasks addressed by index for the analysis
+    """
+    names: List[str]
+    durations: List[float]
+    # (task index, condition level) pairs
+    dependencies: List[List[Tuple[int, int]]]
+    dependents: List[List[Tuple[int, int]]]
+    unknown: List[Tuple[str, str]]
+    never_satisfied: List[Tuple[str, str, str]]
+
+    def __init__(self, tasks: Dict[str, Task], durations: Dict[str, float]):
+        self.names = list(tasks.keys())
+        index = {name: i for i, name in enumerate(self.names)}
+
+        self.durations = [durations[name] for name in self.names]
+        self.dependencies = [[] for _ in self.names]
+        self.dependents = [[] for _ in self.names]
+        self.unknown = []
+        self.never_satisfied = []
+
+        for name, t in tasks.items():
+            for d in t.get("depends") or []:
+                if d["task"] not in index:
+                    self.unknown.append((name, d["task"]))
+                    continue
+
+                # An indefinite task doesn't complete
+                if d["when"] in ("completed", "succeeded") and tasks[d["task"]].get("run_mode") == "indefinite":
+                    self.never_satisfied.append((name, d["task"], d["when"]))
+                    continue
+
+                edge = (index[d["task"]], CONDITION_LEVELS[d["when"]])
+                self.dependencies[index[name]].append(edge)
+                self.dependents[edge[0]].append((index[name], edge[1]))
+
+    def __len__(self):
+        return len(self.names)
+
+
+class Simulation:
+    jobs: Optional[int]
+    policy: str
+    makespan: float
+    utilisation: float
+    peak: int
+
+    def __init__(self, jobs: Optional[int], policy: str, makespan: float, utilisation: float, peak: int):
+        self.jobs = jobs
+        self.policy = policy
+        self.makespan = makespan
+        self.utilisation = utilisation
+        self.peak = peak
+
+
+def load_durations(tasks: Dict[str, Task], history_file: Optional[str]) -> Tuple[Dict[str, float], List[str]]:
+    """
+    Returns the expected duration of every task, from the timing history if any, or the `estimate` of the task,
+    and the tasks having neither
+    """
+    history = {}
+    if history_file:
+        with open(history_file, "r") as f:
+            history = json.load(f)
+
+    durations = {}
+    missing = []
+    for name, t in tasks.items():
+        measured = history.get(name)
+        if isinstance(measured, list):
+            measured = sum(measured) / len(measured) if measured else None
+
+        if measured is not None:
+            durations[name] = float(measured)
+        elif t.get("estimate") is not None:
+            durations[name] = float(t["estimate"])
+        elif t["type"] == "group":
+            durations[name] = 0.0
+        else:
+            durations[name] = constants.PLAN_DEFAULT_ESTIMATE
+            missing.append(name)
+
+    return durations, missing
+
+
+def find_cycles(graph: TaskGraph) -> List[List[str]]:
+    """
+    Returns the strongly connected components of more than one task, or depending on themselves (Tarjan)
+    """
+    index_of = [-1] * len(graph)
+    low = [0] * len(graph)
+    on_stack = [False] * len(graph)
+    stack = []
+    cycles = []
+    counter = 0
+
+    for root in range(len(graph)):
+        if index_of[root] != -1:
+            continue
+
+        work = [(root, 0)]
+        while work:
+            node, position = work.pop()
+            if position == 0:
+                index_of[node] = low[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = True
+
+            dependencies = graph.dependencies[node]
+            if position < len(dependencies):
+                work.append((node, position + 1))
+                child = dependencies[position][0]
+                if index_of[child] == -1:
+                    work.append((child, 0))
+                elif on_stack[child]:
+                    low[node] = min(low[node], index_of[child])
+                continue
+
+            if low[node] == index_of[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component.append(member)
+                    if member == node:
+                        break
+                if len(component) > 1 or any(d == node for d, _ in dependencies):
+                    cycles.append([graph.names[i] for i in reversed(component)])
+
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+
+    return cycles
+
+
+def runnable_order(graph: TaskGraph) -> Tuple[List[int], Set[int]]:
+    """
+    Returns the tasks that can run in topological order, and the tasks that never can: in a cycle,
+    or after a missing task, an unsatisfiable dependency or a cycle
+    """
+    index = {name: i for i, name in enumerate(graph.names)}
+    remaining = [len(d) for d in graph.dependencies]
+    blocked = {index[name] for name, _ in graph.unknown}
+    blocked.update(index[name] for name, _, _ in graph.never_satisfied)
+
+    order = []
+    pending = [i for i in range(len(graph)) if remaining[i] == 0]
+    while pending:
+        node = pending.pop()
+        order.append(node)
+        for dependent, _ in graph.dependents[node]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                pending.append(dependent)
+
+    blocked.update(i for i in range(len(graph)) if remaining[i] > 0)
+    for node in order:
+        if node not in blocked and any(d in blocked for d, _ in graph.dependencies[node]):
+            blocked.add(node)
+
+    return [i for i in order if i not in blocked], blocked
+
+
+def level_widths(graph: TaskGraph, order: List[int]) -> List[int]:
+    levels = [0] * len(graph)
+    for node in order:
+        levels[node] = max((levels[d] + 1 for d, _ in graph.dependencies[node]), default=0)
+
+    widths = Counter(levels[node] for node in order)
+    return [widths[level] for level in range(len(widths))]
+
+
+def critical_path(graph: TaskGraph, order: List[int]) -> Tuple[List[int], float]:
+    """
+    Returns the chain of tasks determining the shortest possible run time, and that time
+    """
+    start = [0.0] * len(graph)
+    previous: List[Optional[int]] = [None] * len(graph)
+
+    for node in order:
+        for d, level in graph.dependencies[node]:
+            available = start[d] if level == STARTED else start[d] + graph.durations[d]
+            if previous[node] is None or available > start[node]:
+                start[node] = available
+                previous[node] = d
+
+    if not order:
+        return [], 0.0
+
+    last = max(order, key=lambda i: start[i] + graph.durations[i])
+    path = [last]
+    while previous[path[-1]] is not None:
+        path.append(previous[path[-1]])
+
+    return list(reversed(path)), start[last] + graph.durations[last]
+
+
+def redundant_edges(graph: TaskGraph, order: List[int]) -> List[Tuple[str, str]]:
+    """
+    Returns the dependencies already implied by another path between the same tasks. A task only starts once its
+    dependencies are satisfied, so a path implies a dependency if its last edge waits for the same or a stronger
+    condition
+    """
+    levels = len(constants.DEPENDENCY_CONDITIONS)
+    # reaches[node][level]: bitset of the tasks the node reaches through a path whose last edge waits for
+    # at least that condition
+    reaches: List[Optional[List[int]]] = [None] * len(graph)
+    redundant = []
+
+    for node in order:
+        implied = [0] * levels
+        for d, _ in graph.dependencies[node]:
+            for level in range(levels):
+                implied[level] |= reaches[d][level]
+
+        seen = {}
+        for d, level in graph.dependencies[node]:
+            if implied[level] >> d & 1 or seen.get(d, -1) >= level:
+                redundant.append((graph.names[node], graph.names[d]))
+            seen[d] = max(seen.get(d, -1), level)
+
+        own = implied
+        for d, level in graph.dependencies[node]:
+            for weaker in range(level + 1):
+                own[weaker] |= 1 << d
+        reaches[node] = own
+
+    return redundant
+
+
+def bottom_levels(graph: TaskGraph, order: List[int]) -> List[float]:
+    """
+    Returns for every task the length of the longest chain of work starting with it
+    """
+    bottom = [0.0] * len(graph)
+    for node in reversed(order):
+        tail = max((bottom[d] if level == STARTED else graph.durations[node] + bottom[d]
+                    for d, level in graph.dependents[node]), default=0.0)
+        bottom[node] = max(graph.durations[node], tail)
+    return bottom
+
+
+def simulate(graph: TaskGraph, order: List[int], jobs: Optional[int], policy: str,
+             bottom: Optional[List[float]] = None) -> Simulation:
+    """
+    Simulates running the tasks on `jobs` slots, or as many as needed, picking the next task to start among
+    the available ones according to the policy
+    """
+    runnable = set(order)
+    remaining = [len(d) for d in graph.dependencies]
+    durations = graph.durations
+
+    if policy == "critical-path":
+        bottom = bottom or bottom_levels(graph, order)
+        priority = lambda node, now: -bottom[node]
+    elif policy == "longest-first":
+        priority = lambda node, now: -durations[node]
+    elif policy == "shortest-first":
+        priority = lambda node, now: durations[node]
+    else:
+        priority = lambda node, now: now
+
+    available = []
+    events = []
+    sequence = 0
+
+    for node in order:
+        if remaining[node] == 0:
+            available.append((priority(node, 0.0), sequence, node))
+            sequence += 1
+    heapq.heapify(available)
+
+    now = makespan = busy = 0.0
+    running = peak = 0
+
+    while available or events:
+        while available and (jobs is None or running < jobs):
+            _, _, node = heapq.heappop(available)
+            running += 1
+            peak = max(peak, running)
+            busy += durations[node]
+            heapq.heappush(events, (now + durations[node], sequence, node))
+            sequence += 1
+
+            for dependent, level in graph.dependents[node]:
+                if level != STARTED:
+                    continue
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0 and dependent in runnable:
+                    heapq.heappush(available, (priority(dependent, now), sequence, dependent))
+                    sequence += 1
+
+        if not events:
+            break
+
+        now, _, node = heapq.heappop(events)
+        running -= 1
+        makespan = max(makespan, now)
+
+        for dependent, level in graph.dependents[node]:
+            if level == STARTED:
+                continue
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0 and dependent in runnable:
+                heapq.heappush(available, (priority(dependent, now), sequence, dependent))
+                sequence += 1
+
+    slots = jobs if jobs is not None else peak
+    utilisation = busy / (slots * makespan) if slots and makespan else 0.0
+    return Simulation(jobs, policy, makespan, utilisation, peak)
+
+
+plan_parser = argparse.ArgumentParser(prog="jorun plan", description="Analyze the tasks graph of a configuration and "
+                                                                     "predict its run time, without running it")
+plan_parser.add_argument("configuration_file", help="The yml configuration file")
+plan_parser.add_argument("--history", help="A JSON file mapping the task names to their measured duration in "
+                                           "seconds, or a list of them", type=str)
+plan_parser.add_argument("--jobs", help="The numbers of tasks allowed to run at once to simulate",
+                         nargs="+", default=[os.cpu_count() or 1], type=int)
+plan_parser.add_argument("--policy", help="The scheduling policies to simulate", nargs="+", choices=POLICIES,
+                         default=["fifo", "critical-path"])
+plan_parser.add_argument("--level", help="The log level (DEBUG, INFO, ...)", default="INFO", type=str)
+
+
+def main(argv: List[str]):
+    arguments = plan_parser.parse_args(argv)
+    logger.setLevel(arguments.level)
+
+    tasks = load_config(arguments.configuration_file)["tasks"]
+    durations, missing = load_durations(tasks, arguments.history)
+    if missing:
+        logger.warning(f"No duration known for {len(missing)} tasks, assuming {constants.PLAN_DEFAULT_ESTIMATE}s: "
+                       f"{', '.join(missing[:10])}{', ...' if len(missing) > 10 else ''}")
+
+    analysis_start = time.perf_counter()
+    graph = TaskGraph(tasks, durations)
+    order, blocked = runnable_order(graph)
+
+    print(f"{len(graph)} tasks, {sum(len(d) for d in graph.dependencies)} dependencies")
+
+    for name, dependency in graph.unknown:
+        print(f"Task {name} depends on unknown task {dependency}")
+    for name, dependency, when in graph.never_satisfied:
+        print(f"Task {name} waits for indefinite task {dependency} to be {when}, which never happens")
+    for cycle in find_cycles(graph):
+        print(f"Cycle: {' -> '.join(cycle)}")
+    if blocked:
+        print(f"{len(blocked)} tasks can never run: {', '.join(sorted(graph.names[i] for i in blocked))}")
+
+    for name, dependency in redundant_edges(graph, order):
+        print(f"Redundant dependency: {name} on {dependency}, implied by another path")
+
+    widths = level_widths(graph, order)
+    print(f"{len(widths)} levels, widths {', '.join(str(w) for w in widths)}")
+
+    path, length = critical_path(graph, order)
+    print(f"Critical path ({length:.1f}s): {' -> '.join(f'{graph.names[i]} ({graph.durations[i]:.1f}s)' for i in path)}")
+
+    bottom = bottom_levels(graph, order)
+    unlimited = simulate(graph, order, None, "fifo", bottom)
+    print(f"Maximum useful parallelism: {unlimited.peak}")
+
+    print(f"\n{'jobs':>6}  {'policy':<16}{'makespan':>10}{'utilisation':>13}")
+    simulations = [simulate(graph, order, jobs, policy, bottom)
+                   for jobs in arguments.jobs for policy in arguments.policy] + [unlimited]
+    for s in simulations:
+        jobs = s.jobs if s.jobs is not None else "-"
+        policy = s.policy if s.jobs is not None else "unlimited"
+        print(f"{jobs:>6}  {policy:<16}{s.makespan:>9.1f}s{s.utilisation:>12.0%}")
+
+    logger.debug(f"Analysis done in {time.perf_counter() - analysis_start:.3f}s")
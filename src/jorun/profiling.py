@@ -0,0 +1,223 @@
+import asyncio
+import cProfile
+import multiprocessing
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from typing import Optional, List
+
+from . import constants
+from .logger import logger
+
+# The profiler of this process, dumped on SIGUSR1
+_profiler: Optional["Profiler"] = None
+
+
+class _ProfileSnapshot:
+    """
+    The stats collected so far by the profile of another thread, which can't be disabled from this one
+    """
+    stats: dict
+
+    def __init__(self, profile: cProfile.Profile):
+        profile.snapshot_stats()
+        self.stats = profile.stats
+
+    def create_stats(self):
+        pass
+
+
+class Profiler:
+    """
+    Profiles the CPU time (cProfile) or the memory allocations (tracemalloc) of the current process, writing
+    a pstats file or a tracemalloc snapshot named after the process when stopped, and when dumped while running
+    """
+    mode: str
+    _directory: str
+    _name: str
+    _profile: Optional[cProfile.Profile]
+    # The profiles of the threads started after this one, e.g. those dequeuing the output for the GUI
+    _thread_profiles: List[cProfile.Profile]
+    _dumps: int
+
+    def __init__(self, mode: str, directory: str, name: str):
+        self.mode = mode
+        self._directory = directory
+        self._name = name
+        self._profile = None
+        self._thread_profiles = []
+        self._dumps = 0
+
+    def _path(self, suffix: str = "") -> str:
+        extension = "pstats" if self.mode == "cpu" else "snapshot"
+        return os.path.join(self._directory, f"jorun-{self._name}-{os.getpid()}{suffix}.{extension}")
+
+    def _profile_thread(self, frame, event, arg):
+        # Called once by each new thread, whose own profile then replaces this function
+        profile = cProfile.Profile()
+        self._thread_profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        if self.mode == "cpu":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+            # Until Python 3.12 a profile only sees the thread enabling it
+            if sys.version_info < (3, 12):
+                threading.setprofile(self._profile_thread)
+        else:
+            tracemalloc.start(constants.PROFILE_ALLOC_FRAMES)
+
+    def discard(self):
+        if self.mode == "cpu":
+            threading.setprofile(None)
+            self._profile.disable()
+        else:
+            tracemalloc.stop()
+
+    def _write(self, path: str):
+        if self.mode == "cpu":
+            self._profile.disable()
+            try:
+                stats = pstats.Stats(self._profile)
+                for profile in list(self._thread_profiles):
+                    stats.add(_ProfileSnapshot(profile))
+                stats.dump_stats(path)
+            finally:
+                self._profile.enable()
+        else:
+            tracemalloc.take_snapshot().dump(path)
+
+    def dump(self):
+        """
+        Writes the profile collected so far, the run going on
+        """
+        self._dumps += 1
+        path = self._path(f"-{self._dumps}")
+        try:
+            self._write(path)
+            logger.info(f"Profile snapshot written to {path}")
+        except OSError as e:
+            logger.error(f"Could not write the profile snapshot {path}: {e}")
+
+    def stop(self):
+        path = self._path()
+        try:
+            self._write(path)
+            logger.info(f"Profile written to {path}")
+        except OSError as e:
+            logger.error(f"Could not write the profile {path}: {e}")
+        finally:
+            self.discard()
+
+
+def _dump_on_signal(signum, frame):
+    if _profiler:
+        _profiler.dump()
+
+    # The runner and worker processes dump their own profile
+    for child in multiprocessing.active_children():
+        try:
+            os.kill(child.pid, signum)
+        except (OSError, TypeError):
+            pass
+
+
+def start_profiler(arguments: any, name: str) -> Optional[Profiler]:
+    """
+    Starts profiling this process if asked by --profile, dumping a snapshot of the profile on SIGUSR1
+    """
+    global _profiler
+
+    mode = getattr(arguments, "profile", None)
+    if not mode:
+        return None
+
+    if _profiler:
+        # A forked process inherits the profiler of its parent, which is about the parent
+        _profiler.discard()
+
+    _profiler = Profiler(mode, arguments.profile_dir, name)
+    _profiler.start()
+
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, _dump_on_signal)
+
+    return _profiler
+
+
+class SlowCallbackWatchdog:
+    """
+    Logs the stack of the event loop thread when a callback keeps it busy longer than a threshold. The loop
+    updates a heartbeat, and a thread checks that it keeps being updated, so that the stack is the one of the
+    callback still running rather than of the one that scheduled it
+    """
+    _loop: asyncio.AbstractEventLoop
+    _threshold: float
+    _interval: float
+    _heartbeat: float
+    _loop_thread: int
+    _running: bool
+    _thread: Optional[threading.Thread]
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float):
+        self._loop = loop
+        self._threshold = threshold
+        self._interval = threshold / 4
+        self._heartbeat = time.monotonic()
+        self._loop_thread = threading.get_ident()
+        self._running = False
+        self._thread = None
+
+    def _beat(self):
+        if self._running:
+            self._heartbeat = time.monotonic()
+            self._loop.call_later(self._interval, self._beat)
+
+    def _watch(self):
+        reported = None
+        while self._running:
+            time.sleep(self._interval)
+
+            heartbeat = self._heartbeat
+            # How late the next heartbeat is
+            stalled = time.monotonic() - heartbeat - self._interval
+            # Each stall is reported once
+            if stalled < self._threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                logger.warning(f"The event loop has been busy for {stalled:.3f}s, in:\n"
+                               + "".join(traceback.format_stack(frame)).rstrip())
+
+    def start(self):
+        """
+        Starts watching the loop, from the thread running it
+        """
+        self._running = True
+        self._loop_thread = threading.get_ident()
+        self._loop.call_soon(self._beat)
+        self._thread = threading.Thread(target=self._watch, name="slow-callback-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+
+def watch_slow_callbacks(arguments: any, loop: asyncio.AbstractEventLoop) -> Optional[SlowCallbackWatchdog]:
+    threshold = getattr(arguments, "slow_callback", None)
+    if threshold is None and getattr(arguments, "profile", None):
+        threshold = constants.DEFAULT_SLOW_CALLBACK
+    if not threshold:
+        return None
+
+    watchdog = SlowCallbackWatchdog(loop, threshold)
+    watchdog.start()
+    return watchdog
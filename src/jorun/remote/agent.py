@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+import os
+import platform
+import signal
+import socket
+from asyncio.subprocess import Process
+from typing import Dict, List, Optional, Tuple
+
+from .protocol import read_frame, write_message, write_data, decode_message, new_challenge, check_digest, \
+    ProtocolException, FRAME_MESSAGE, STREAM_STDOUT, STREAM_STDERR, TOKEN_ENVIRONMENT_VARIABLE
+from .. import constants
+from ..handler.base import BaseTaskHandler
+from ..handler.registry import load_handler
+from ..limits import ProcessLimits
+from ..logger import logger
+
+
+class Agent:
+    """
+    Spawns the tasks dispatched by a coordinator on the local machine, streaming back their output and status
+    """
+    _name: str
+    _capacity: int
+    _labels: List[str]
+    _token: str
+
+    def __init__(self, name: str, capacity: int, labels: List[str], token: str):
+        self._name = name
+        self._capacity = capacity
+        self._labels = labels
+        self._token = token
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        """
+        Starts listening, on a free port if `port` is 0
+        """
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        port = server.sockets[0].getsockname()[1]
+        logger.info(f"Agent {self._name} listening on {host}:{port} with capacity {self._capacity}")
+        return server
+
+    async def serve(self, host: str, port: int):
+        server = await self.start(host, port)
+
+        async with server:
+            await server.serve_forever()
+
+    async def _authenticate(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """
+        Challenges the coordinator to sign a random value with the shared token, before accepting any task
+        """
+        challenge = new_challenge()
+        write_message(writer, {"type": "challenge", "challenge": challenge})
+
+        frame = await asyncio.wait_for(read_frame(reader), constants.REMOTE_AUTH_TIMEOUT)
+        if not frame or frame[0] != FRAME_MESSAGE:
+            return False
+
+        message = decode_message(frame[1])
+        if message.get("type") != "hello" or not check_digest(self._token, challenge, message.get("auth", "")):
+            write_message(writer, {"type": "error", "error": "Authentication failed"})
+            return False
+
+        write_message(writer, {"type": "hello", "name": self._name, "capacity": self._capacity,
+                               "labels": self._labels})
+        return True
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername")
+
+        try:
+            authenticated = await self._authenticate(reader, writer)
+        except (ConnectionError, ValueError, ProtocolException, asyncio.TimeoutError):
+            authenticated = False
+        if not authenticated:
+            logger.warning(f"Refused the connection from {peer}: authentication failed")
+            writer.close()
+            return
+
+        logger.info(f"Coordinator connected from {peer}")
+
+        channels: Dict[int, Tuple[BaseTaskHandler, dict, Process]] = {}
+        channel_tasks = set()
+
+        def track(t: asyncio.Task):
+            channel_tasks.add(t)
+            t.add_done_callback(channel_tasks.discard)
+
+        try:
+            while frame := await read_frame(reader):
+                kind, payload = frame
+                if kind != FRAME_MESSAGE:
+                    continue
+
+                message = decode_message(payload)
+                logger.debug(f"Agent received {message.get('type')} for channel {message.get('channel')}")
+
+                if message["type"] == "spawn":
+                    track(asyncio.create_task(self._run_channel(message, channels, writer)))
+                elif message["type"] == "stop" and message["channel"] in channels:
+                    handler, task, process = channels[message["channel"]]
+                    track(asyncio.create_task(self._stop_process(handler, task, process)))
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            logger.info(f"Coordinator {peer} disconnected, stopping its {len(channels)} task(s)")
+            await asyncio.gather(*(self._stop_process(h, t, p) for h, t, p in list(channels.values())),
+                                 return_exceptions=True)
+            writer.close()
+
+    async def _run_channel(self, message: dict, channels: Dict[int, Tuple[BaseTaskHandler, dict, Process]],
+                           writer: asyncio.StreamWriter):
+        channel = message["channel"]
+        task = message["task"]
+
+        try:
+            handler = load_handler(task["type"])
+            limits = ProcessLimits(task["name"], task["limits"]) if task.get("limits") else None
+            await handler.prepare(task.get(task["type"]))
+            process = await handler.execute(task.get(task["type"]), None, message.get("stderr_redirect", False),
+                                            limits)
+        except Exception as e:
+            logger.error(f"Could not spawn task {task.get('name')}: {e}")
+            write_message(writer, {"type": "exit", "channel": channel, "returncode": None, "error": str(e)})
+            return
+
+        channels[channel] = (handler, task, process)
+        write_message(writer, {"type": "started", "channel": channel, "pid": process.pid})
+        logger.info(f"Started task {task['name']} (pid {process.pid}) on channel {channel}")
+
+        async def pump(stream: Optional[asyncio.StreamReader], stream_id: int):
+            if not stream:
+                return
+            while data := await stream.read(constants.REMOTE_READ_CHUNK_SIZE):
+                write_data(writer, channel, stream_id, data)
+                await writer.drain()
+
+        try:
+            await asyncio.gather(pump(process.stdout, STREAM_STDOUT), pump(process.stderr, STREAM_STDERR))
+            returncode = await process.wait()
+        except ConnectionError:
+            logger.info(f"Lost the coordinator while running task {task['name']}, stopping it")
+            await self._stop_process(handler, task, process)
+            return
+        finally:
+            channels.pop(channel, None)
+            try:
+                await handler.cleanup(task.get(task["type"]), process)
+            except Exception as e:
+                logger.error(f"Could not clean up after task {task['name']}: {e}")
+
+        logger.info(f"Task {task['name']} on channel {channel} exited with {returncode}")
+        if not writer.is_closing():
+            write_message(writer, {"type": "exit", "channel": channel, "returncode": returncode})
+
+    @staticmethod
+    async def _stop_process(handler: BaseTaskHandler, task: dict, process: Process):
+        if process.returncode is not None:
+            return
+
+        await handler.stop(task.get(task["type"]), process)
+
+        try:
+            process.send_signal(signal.CTRL_C_EVENT if platform.system() == "Windows" else signal.SIGTERM)
+            await asyncio.wait_for(process.wait(), constants.REMOTE_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.debug(f"Task {task['name']} still alive after {constants.REMOTE_STOP_TIMEOUT}s. Killing it")
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+def main(argv: List[str]):
+    parser = argparse.ArgumentParser(prog="jorun agent", description="Run the tasks dispatched by a jorun coordinator")
+    parser.add_argument("--host", help="The address to listen on", default="127.0.0.1", type=str)
+    parser.add_argument("--port", help="The TCP port to listen on", default=constants.AGENT_DEFAULT_PORT, type=int)
+    parser.add_argument("--name", help="The agent name", default=socket.gethostname(), type=str)
+    parser.add_argument("--capacity", help="The maximum number of concurrent tasks", default=os.cpu_count() or 1,
+                        type=int)
+    parser.add_argument("--label", help="A label advertised to the coordinator, can be repeated", action="append",
+                        default=[], dest="labels")
+    parser.add_argument("--token", help=f"The secret shared with the coordinators, defaults to the "
+                                        f"{TOKEN_ENVIRONMENT_VARIABLE} environment variable",
+                        default=os.environ.get(TOKEN_ENVIRONMENT_VARIABLE), type=str)
+    parser.add_argument("--level", help="The log level (DEBUG, INFO, ...)", default="INFO", type=str)
+
+    arguments = parser.parse_args(argv)
+    logger.setLevel(arguments.level)
+
+    # Anyone able to connect could run any command otherwise
+    if not arguments.token:
+        parser.error(f"A shared token is required, through --token or {TOKEN_ENVIRONMENT_VARIABLE}")
+
+    agent = Agent(arguments.name, arguments.capacity, arguments.labels, arguments.token)
+    try:
+        asyncio.run(agent.serve(arguments.host, arguments.port))
+    except KeyboardInterrupt:
+        logger.info("Agent terminated")
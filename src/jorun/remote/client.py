@@ -0,0 +1,303 @@
+import asyncio
+import itertools
+import os
+from typing import Dict, List, Optional, TypedDict, Union, Set, Callable, Coroutine
+
+from .protocol import read_frame, write_message, decode_message, decode_data, parse_address, auth_digest, \
+    FRAME_MESSAGE, FRAME_DATA, STREAM_STDERR, TOKEN_ENVIRONMENT_VARIABLE
+from .. import constants
+from ..errors import TaskBuildException, TaskRunException
+from ..logger import logger
+
+
+class AgentConfiguration(TypedDict):
+    address: str
+    labels: Optional[List[str]]
+    capacity: Optional[int]
+    # The secret shared with the agent, defaults to the JORUN_AGENT_TOKEN environment variable
+    token: Optional[str]
+
+
+class NodeSelector(TypedDict):
+    name: Optional[str]
+    labels: Optional[List[str]]
+
+
+class RemoteProcess:
+    """
+    Mimics an `asyncio.subprocess.Process` for a task running on an agent, so that it can be scanned and
+    stopped like a local one
+    """
+    pid: Optional[int]
+    returncode: Optional[int]
+    stdout: asyncio.StreamReader
+    stderr: Optional[asyncio.StreamReader]
+
+    _connection: "AgentConnection"
+    _channel: int
+    _started: asyncio.Future
+    _exited: asyncio.Event
+
+    def __init__(self, connection: "AgentConnection", channel: int, stderr_redirect: bool):
+        self.pid = None
+        self.returncode = None
+        self.stdout = asyncio.StreamReader(limit=constants.REMOTE_READ_CHUNK_SIZE * 4)
+        self.stderr = None if stderr_redirect else asyncio.StreamReader(limit=constants.REMOTE_READ_CHUNK_SIZE * 4)
+
+        self._connection = connection
+        self._channel = channel
+        self._started = asyncio.get_running_loop().create_future()
+        self._exited = asyncio.Event()
+
+    @property
+    def agent(self) -> str:
+        return self._connection.name
+
+    async def wait_started(self):
+        await self._started
+
+    async def wait(self) -> Optional[int]:
+        await self._exited.wait()
+        return self.returncode
+
+    def terminate(self):
+        self._connection.send_stop(self._channel)
+
+    def _on_data(self, stream: int, data: bytes):
+        reader = self.stderr if stream == STREAM_STDERR and self.stderr else self.stdout
+        reader.feed_data(data)
+
+    def _on_started(self, pid: int):
+        self.pid = pid
+        if not self._started.done():
+            self._started.set_result(pid)
+
+    def _on_exit(self, returncode: Optional[int], error: Optional[str] = None):
+        self.returncode = returncode if returncode is not None else -1
+        self.stdout.feed_eof()
+        if self.stderr:
+            self.stderr.feed_eof()
+
+        if not self._started.done():
+            self._started.set_exception(TaskRunException(error or f"Agent {self.agent} could not start the task"))
+        self._exited.set()
+
+
+class AgentConnection:
+    """
+    A single connection to an agent, multiplexing the output of all the tasks dispatched to it
+    """
+    name: str
+    labels: List[str]
+    capacity: Optional[int]
+    running: int
+    # Called once the connection is lost
+    disconnected_callback: Optional[Callable[[], None]]
+
+    _host: str
+    _port: int
+    _token: Optional[str]
+    _reader: Optional[asyncio.StreamReader]
+    _writer: Optional[asyncio.StreamWriter]
+    _processes: Dict[int, RemoteProcess]
+    _channels: itertools.count
+    _connect_lock: asyncio.Lock
+    _read_task: Optional[asyncio.Task]
+
+    def __init__(self, name: str, configuration: AgentConfiguration):
+        self.name = name
+        self.labels = list(configuration.get("labels") or [])
+        self.capacity = configuration.get("capacity")
+        self.running = 0
+        self.disconnected_callback = None
+
+        self._host, self._port = parse_address(configuration["address"])
+        self._token = configuration.get("token") or os.environ.get(TOKEN_ENVIRONMENT_VARIABLE)
+        self._reader = None
+        self._writer = None
+        self._processes = {}
+        self._channels = itertools.count(1)
+        self._connect_lock = asyncio.Lock()
+        self._read_task = None
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def ensure_connected(self) -> bool:
+        async with self._connect_lock:
+            if self.connected:
+                return True
+
+            if not self._token:
+                logger.warning(f"No token to authenticate to agent {self.name}, set its `token` "
+                               f"or {TOKEN_ENVIRONMENT_VARIABLE}")
+                return False
+
+            try:
+                self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+
+                challenge = await self._read_message()
+                if challenge.get("type") != "challenge":
+                    raise ConnectionError("Invalid handshake")
+                write_message(self._writer, {"type": "hello",
+                                             "auth": auth_digest(self._token, challenge.get("challenge", ""))})
+
+                hello = await self._read_message()
+                if hello.get("type") != "hello":
+                    raise ConnectionError(hello.get("error") or "Invalid handshake")
+
+                self.capacity = self.capacity or hello.get("capacity") or 1
+                self.labels = self.labels or hello.get("labels") or []
+                logger.info(f"Connected to agent {self.name} at {self._host}:{self._port} "
+                            f"(capacity {self.capacity}, labels {self.labels})")
+
+                # Kept referenced until the connection ends
+                self._read_task = asyncio.create_task(self._read_loop())
+                return True
+            except (OSError, ConnectionError, ValueError, asyncio.TimeoutError) as e:
+                logger.warning(f"Could not connect to agent {self.name} at {self._host}:{self._port}: {e}")
+                if self._writer:
+                    self._writer.close()
+                self._writer = None
+                return False
+
+    async def _read_message(self) -> dict:
+        frame = await asyncio.wait_for(read_frame(self._reader), constants.REMOTE_AUTH_TIMEOUT)
+        if not frame or frame[0] != FRAME_MESSAGE:
+            raise ConnectionError("Invalid handshake")
+        return decode_message(frame[1])
+
+    async def spawn(self, task: dict, stderr_redirect: bool) -> RemoteProcess:
+        channel = next(self._channels)
+        process = RemoteProcess(self, channel, stderr_redirect)
+        self._processes[channel] = process
+
+        write_message(self._writer, {"type": "spawn", "channel": channel, "task": task,
+                                     "stderr_redirect": stderr_redirect})
+        await process.wait_started()
+
+        return process
+
+    def send_stop(self, channel: int):
+        if self.connected and channel in self._processes:
+            write_message(self._writer, {"type": "stop", "channel": channel})
+
+    async def _read_loop(self):
+        try:
+            while frame := await read_frame(self._reader):
+                kind, payload = frame
+
+                if kind == FRAME_DATA:
+                    channel, stream, data = decode_data(payload)
+                    process = self._processes.get(channel)
+                    if process:
+                        process._on_data(stream, data)
+                elif kind == FRAME_MESSAGE:
+                    message = decode_message(payload)
+                    process = self._processes.get(message.get("channel"))
+                    if not process:
+                        continue
+
+                    if message["type"] == "started":
+                        process._on_started(message["pid"])
+                    elif message["type"] == "exit":
+                        del self._processes[message["channel"]]
+                        process._on_exit(message.get("returncode"), message.get("error"))
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            logger.warning(f"Connection to agent {self.name} closed")
+            if self._writer:
+                self._writer.close()
+            self._writer = None
+            self._read_task = None
+            for process in self._processes.values():
+                process._on_exit(None, f"Connection to agent {self.name} lost")
+            self._processes.clear()
+            if self.disconnected_callback:
+                self.disconnected_callback()
+
+
+class AgentPool:
+    """
+    Dispatches the remote tasks to the configured agents, according to the task node selector and the agents capacity
+    """
+    _agents: Dict[str, AgentConnection]
+    _capacity_changed: Optional[asyncio.Condition]
+    _background_tasks: Set[asyncio.Task]
+
+    def __init__(self, agents: Dict[str, AgentConfiguration]):
+        self._agents = {name: AgentConnection(name, conf) for name, conf in (agents or {}).items()}
+        self._capacity_changed = None
+        self._background_tasks = set()
+
+        for agent in self._agents.values():
+            agent.disconnected_callback = self._agent_disconnected
+
+    def _matching(self, selector: Union[str, NodeSelector], match_labels: bool = True) -> List[AgentConnection]:
+        if isinstance(selector, str):
+            selector = {"name": selector}
+
+        labels = set(selector.get("labels") or []) if match_labels else set()
+        return [a for a in self._agents.values()
+                if (not selector.get("name") or a.name == selector["name"]) and labels.issubset(a.labels)]
+
+    async def execute(self, task: dict, stderr_redirect: bool) -> RemoteProcess:
+        if not self._capacity_changed:
+            self._capacity_changed = asyncio.Condition()
+
+        candidates = self._matching(task["node"], match_labels=False)
+        if not candidates:
+            raise TaskBuildException(f"No agent matches the node selector of task '{task['name']}'")
+
+        connected = await asyncio.gather(*(a.ensure_connected() for a in candidates))
+        # Labels advertised by the agents are known only after connecting
+        candidates = [a for a, ok in zip(candidates, connected) if ok and a in self._matching(task["node"])]
+        if not candidates:
+            raise TaskRunException(f"No reachable agent for task '{task['name']}'")
+
+        def pick() -> Optional[AgentConnection]:
+            free = [a for a in candidates if a.connected and a.running < a.capacity]
+            return min(free, key=lambda a: a.running / a.capacity) if free else None
+
+        async with self._capacity_changed:
+            # The tasks waiting for an agent give up once none of the candidates is connected anymore
+            await self._capacity_changed.wait_for(lambda: pick() is not None
+                                                  or not any(a.connected for a in candidates))
+            agent = pick()
+            if not agent:
+                raise TaskRunException(f"The agents able to run task '{task['name']}' disconnected")
+            agent.running += 1
+
+        logger.debug(f"Dispatching task {task['name']} to agent {agent.name}")
+        try:
+            process = await agent.spawn(task, stderr_redirect)
+        except Exception:
+            await self._release(agent)
+            raise
+
+        async def release_on_exit():
+            await process.wait()
+            await self._release(agent)
+
+        self._in_background(release_on_exit())
+        return process
+
+    def _in_background(self, coroutine: Coroutine):
+        task = asyncio.create_task(coroutine)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _release(self, agent: AgentConnection):
+        async with self._capacity_changed:
+            agent.running -= 1
+            self._capacity_changed.notify_all()
+
+    async def _notify_waiting(self):
+        async with self._capacity_changed:
+            self._capacity_changed.notify_all()
+
+    def _agent_disconnected(self):
+        if self._capacity_changed:
+            self._in_background(self._notify_waiting())
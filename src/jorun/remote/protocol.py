@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import struct
+from typing import Tuple, Optional
+
+# Every frame is prefixed by its payload length and kind
+FRAME_HEADER = struct.Struct("!IB")
+# Data frames carry the channel (one per remote task) and the stream the bytes were read from
+DATA_HEADER = struct.Struct("!IB")
+
+FRAME_MESSAGE = 1
+FRAME_DATA = 2
+
+STREAM_STDOUT = 1
+STREAM_STDERR = 2
+
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# The shared secret of the agents and their coordinators, unless given explicitly
+TOKEN_ENVIRONMENT_VARIABLE = "JORUN_AGENT_TOKEN"
+
+
+class ProtocolException(Exception):
+    pass
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Tuple[int, bytes]]:
+    """
+    Reads the next frame, returning its kind and payload, or None if the connection was closed
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+
+    length, kind = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolException(f"Frame too large ({length} bytes)")
+
+    try:
+        return kind, await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        return None
+
+
+def write_message(writer: asyncio.StreamWriter, message: dict):
+    payload = json.dumps(message).encode("utf-8")
+    writer.write(FRAME_HEADER.pack(len(payload), FRAME_MESSAGE) + payload)
+
+
+def write_data(writer: asyncio.StreamWriter, channel: int, stream: int, data: bytes):
+    writer.write(FRAME_HEADER.pack(DATA_HEADER.size + len(data), FRAME_DATA) + DATA_HEADER.pack(channel, stream))
+    writer.write(data)
+
+
+def decode_message(payload: bytes) -> dict:
+    return json.loads(payload.decode("utf-8"))
+
+
+def decode_data(payload: bytes) -> Tuple[int, int, bytes]:
+    channel, stream = DATA_HEADER.unpack_from(payload)
+    return channel, stream, payload[DATA_HEADER.size:]
+
+
+def new_challenge() -> str:
+    return os.urandom(32).hex()
+
+
+def auth_digest(token: str, challenge: str) -> str:
+    """
+    Proves the knowledge of the shared token without sending it, by signing the challenge sent by the agent
+    """
+    return hmac.new(token.encode("utf-8"), challenge.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def check_digest(token: str, challenge: str, digest: str) -> bool:
+    return hmac.compare_digest(auth_digest(token, challenge), str(digest))
+
+
+def parse_address(address: str, default_host: str = "127.0.0.1") -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or default_host, int(port)
@@ -7,48 +7,82 @@ import time
 from asyncio.subprocess import Process
 from datetime import datetime
 from logging import Logger
-from typing import Optional, Callable, List, Union
+from typing import Optional, Callable, Union, Awaitable, Set
 
 import psutil
 from tinyioc import get_service
 
 from . import constants
+from .flow import FlowController
+from .grouped import GroupedOutputHandler
 from .handler.base import BaseTaskHandler
+from .limits import ProcessLimits
 from .logger import logger
+from .output_filter import OutputFilter
+from .remote.client import AgentPool, RemoteProcess
 from .scanner import AsyncScanner
 from .types.options import TaskOptions
 from .types.task import Task
+from .usage import TaskUsage, UsageRecorder
+from .api.ring import OutputRings, RingHandler
 from .configuration import AppConfiguration
+from .errors import TaskRunException
 
 
 class TaskRunner:
-    _handlers: List[BaseTaskHandler]
     _handler: BaseTaskHandler
 
     _task: Task
     _process: Optional[Process]
     _completion_callback: Optional[Callable]
+    _state_callback: Optional[Callable[[str], None]]
     _scanner: AsyncScanner
     _log_handler: logging.Handler
 
     _logger: Logger
     _err_logger: Logger
+    _flow: Optional[FlowController]
+
+    _file_handler: Optional[logging.FileHandler]
+    _direct_output: bool
+    _usage: Optional[TaskUsage]
+    _monitor_task: Optional[asyncio.Task]
+    _timeout_task: Optional[asyncio.Task]
+    _stop_task: Optional[asyncio.Task]
+    _hook_tasks: Set[asyncio.Task]
+    _cleaned_up: bool
+    # Stopped on purpose, which is not a failure
+    _stopped: bool
+    _failed: bool
+    _ready: bool
 
     def __init__(self, task: Task, file_output_dir: Optional[str], log_level: Union[int, str],
-                 log_handler: logging.Handler):
+                 log_handler: logging.Handler, direct_output: bool = False):
         configuration: AppConfiguration = get_service(AppConfiguration)
 
         self._task = task
-        self._handlers = configuration.handlers
         self._process = None
         self._running = True
         self._completion_callback = None
+        self._state_callback = None
         self._log_handler = log_handler
+        self._file_handler = None
+        self._direct_output = direct_output
+        self._usage = None
+        self._monitor_task = None
+        self._timeout_task = None
+        self._stop_task = None
+        self._hook_tasks = set()
+        self._cleaned_up = False
+        self._stopped = False
+        self._failed = False
+        self._ready = False
 
-        self._handler = next(h for h in self._handlers if h.task_type == task['type'])
+        self._flow = get_service(FlowController)
+        if self._flow:
+            self._flow.configure_task(task["name"], task.get("backpressure"), task["flow_slot"])
 
-        if not self._handler:
-            raise RuntimeError(f"Task type '{task['type']}' unrecognized")
+        self._handler = configuration.handler(task['type'])
 
         self._logger = logging.Logger(task["name"])
         self._logger.setLevel(log_level)
@@ -58,11 +92,18 @@ class TaskRunner:
         self._logger.addHandler(log_handler)
         self._err_logger.addHandler(log_handler)
 
+        rings: Optional[OutputRings] = get_service(OutputRings)
+        if rings:
+            ring_handler = RingHandler(rings)
+            self._logger.addHandler(ring_handler)
+            self._err_logger.addHandler(ring_handler)
+
         if file_output_dir and os.path.isdir(file_output_dir):
             now_time = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
             output_file = os.path.join(file_output_dir, f"{task['name']}_{now_time}.log")
             file_handler = logging.FileHandler(output_file)
             file_handler.terminator = ''
+            self._file_handler = file_handler
 
             self._logger.addHandler(file_handler)
             self._err_logger.addHandler(file_handler)
@@ -71,57 +112,278 @@ class TaskRunner:
     def name(self):
         return self._task["name"]
 
-    def _on_stop(self):
+    @property
+    def _options(self) -> Optional[TaskOptions]:
         # noinspection PyTypedDict
-        self._handler.on_exit(self._task[self._handler.task_type], self._process)
+        return self._task.get(self._handler.task_type)
 
-    def stop(self, timeout=1):
+    async def _run_hook(self, hook: str, hook_call: Awaitable):
+        try:
+            await hook_call
+        except Exception as e:
+            logger.error(f"Task {self.name}: the {hook} hook of the {self._handler.task_type} handler failed: {e}")
+
+    def stop(self, timeout: float = constants.TASK_STOP_TIMEOUT) -> Optional[asyncio.Task]:
+        """
+        Stops the task process, returns the asyncio task stopping it, if any, which runs in the current event loop
+        """
         if self._process and self._process.returncode is None:
-            logger.debug(f"Process {self.name} is alive. Killing it")
+            self._stopped = True
+
+        if isinstance(self._process, RemoteProcess) and self._process.returncode is None:
+            logger.debug(f"Process {self.name} is alive on agent {self._process.agent}. Stopping it")
+            self._process.terminate()
+        elif self._process and self._process.returncode is None and not self._stop_task:
+            self._stop_task = asyncio.ensure_future(self._stop(timeout))
 
-            self._on_stop()
-            pid = self._process.pid
+        return self._stop_task
 
+    async def _stop(self, timeout: float):
+        logger.debug(f"Process {self.name} is alive. Killing it")
+
+        await self._run_hook("stop", self._handler.stop(self._options, self._process))
+        pid = self._process.pid
+
+        if self._process.returncode is None:
             if platform.system() == "Windows":
                 os.kill(pid, signal.CTRL_C_EVENT)
             else:
-                os.kill(pid, signal.SIGTERM)
-
-            init_time = time.time()
-            while psutil.pid_exists(pid) and time.time() < init_time + timeout:
-                time.sleep(constants.PROCESS_KILL_POLLING_INTERVAL)
+                # The task leads its own session, its children are stopped with it
+                self._kill_group(pid, signal.SIGTERM)
 
-            if psutil.pid_exists(pid):
+            try:
+                await asyncio.wait_for(self._process.wait(), timeout)
+            except asyncio.TimeoutError:
                 logger.debug(f"Process {self.name} still alive after {timeout}s timeout. Sending SIGKILL")
                 if platform.system() == "Windows":
                     os.kill(pid, signal.CTRL_BREAK_EVENT)
                 else:
-                    os.kill(pid, signal.SIGKILL)
+                    self._kill_group(pid, signal.SIGKILL)
+                await self._process.wait()
 
-    async def start(self, completion_callback: Optional[Callable]):
+        await self._cleanup()
+
+    async def _cleanup(self):
+        if not self._cleaned_up and not isinstance(self._process, RemoteProcess):
+            self._cleaned_up = True
+            await self._run_hook("cleanup", self._handler.cleanup(self._options, self._process))
+
+    @staticmethod
+    def _kill_group(pid: int, sig: int):
         try:
-            self._completion_callback = completion_callback
+            os.killpg(pid, sig)
+        except (ProcessLookupError, PermissionError):
+            os.kill(pid, sig)
+
+    def _notify_state(self, state: str):
+        if isinstance(self._log_handler, GroupedOutputHandler):
+            self._log_handler.task_state(self.name, state)
+        if self._state_callback:
+            self._state_callback(state)
+
+    async def _process_exited(self):
+        returncode = await self._process.wait()
+        await self._cleanup()
+
+        if self._monitor_task:
+            self._monitor_task.cancel()
+        if self._usage:
+            self._usage["ended"] = time.time()
+            self._usage["returncode"] = returncode
+            self._record_usage()
+
+        if returncode != 0:
+            self._fail(f"exited with code {returncode}")
+
+        self._notify_state("completed")
+        if returncode == 0 and not self._failed:
+            self._notify_state("succeeded")
+
+    def _fail(self, reason: str):
+        """
+        Reports the failure of the task, before it completes, unless the task was stopped on purpose
+        """
+        if self._failed or self._stopped:
+            return
+
+        self._failed = True
+        logger.error(f"Task {self.name} {reason}")
+        self._notify_state("failed")
+
+    async def _enforce_timeouts(self):
+        """
+        Stops the task when it is not ready within its `ready_timeout`, or still running after its `timeout`
+        """
+        t = self._task
+        started = time.monotonic()
+        # Each deadline is checked when it expires, whichever comes first
+        deadlines = sorted((t[key], key) for key in ("ready_timeout", "timeout") if t.get(key) is not None)
+
+        for seconds, key in deadlines:
+            await asyncio.sleep(seconds - (time.monotonic() - started))
+            if self._process.returncode is not None:
+                return
+
+            if key == "ready_timeout":
+                if self._ready:
+                    continue
+                self._notify_state("timed_out")
+                self._fail(f"was not ready after {seconds}s, stopping it")
+            else:
+                self._notify_state("timed_out")
+                self._fail(f"still running after {seconds}s, stopping it")
+
+            self.stop()
+            return
+
+    def _output_fd(self, options: Optional[TaskOptions]) -> Optional[int]:
+        """
+        The log file the task writes to directly, when nothing needs to read its output: no completion pattern
+        to match, no output rules, no API subscribers and no remote agent in between
+        """
+        t = self._task
+        if not self._direct_output or not self._file_handler or t["type"] == "group":
+            return None
+        if t.get("completion_pattern") or t.get("output") or t.get("node") or (options or {}).get("tty"):
+            return None
+        if get_service(OutputRings):
+            return None
+
+        return self._file_handler.stream.fileno()
+
+    def _ready_callback(self, completion_callback: Optional[Callable]) -> Callable:
+        def cb():
+            self._ready = True
+            if self._process and not isinstance(self._process, RemoteProcess):
+                hook_task = asyncio.ensure_future(self._run_hook("ready", self._handler.ready(self._options,
+                                                                                              self._process)))
+                self._hook_tasks.add(hook_task)
+                hook_task.add_done_callback(self._hook_tasks.discard)
+            if self._usage and not self._usage["ready"]:
+                self._usage["ready"] = time.time()
+                self._record_usage()
+            if completion_callback:
+                completion_callback()
+
+        return cb
+
+    def _record_usage(self):
+        recorder: Optional[UsageRecorder] = get_service(UsageRecorder)
+        if recorder:
+            recorder.update(self.name, TaskUsage(**self._usage))
+
+    async def _monitor(self, pid: int):
+        """
+        Samples the CPU time and memory of the task process and its children until it exits
+        """
+        try:
+            process = psutil.Process(pid)
+        except psutil.Error:
+            return
+
+        while True:
+            try:
+                with process.oneshot():
+                    times = process.cpu_times()
+                    cpu = times.user + times.system + times.children_user + times.children_system
+                    rss = process.memory_info().rss
+                    children = process.children(recursive=True)
+            except psutil.Error:
+                return
+
+            for child in children:
+                try:
+                    with child.oneshot():
+                        times = child.cpu_times()
+                        cpu += times.user + times.system
+                        rss += child.memory_info().rss
+                except psutil.Error:
+                    pass
+
+            self._usage["cpu"] = max(self._usage["cpu"], cpu)
+            self._usage["peak_rss"] = max(self._usage["peak_rss"], rss)
+            self._record_usage()
+
+            await asyncio.sleep(constants.USAGE_SAMPLE_INTERVAL)
+
+    async def start(self, completion_callback: Optional[Callable],
+                    state_callback: Optional[Callable[[str], None]] = None):
+        """
+        Runs the task. `completion_callback` is called when the task is ready, while `state_callback` receives
+        the other states dependent tasks can wait for: started, completed and succeeded. A task that exits with
+        an error, never matches its completion pattern or times out is also `failed`, before being completed
+        """
+        try:
+            self._completion_callback = self._ready_callback(completion_callback)
+            self._state_callback = state_callback
             t = self._task
 
             stderr_redirect = t.get('pattern_in_stderr', False)
 
             # noinspection PyTypedDict
             task_options: Optional[TaskOptions] = t.get(self._handler.task_type)
+            limits = ProcessLimits(t['name'], t['limits'], t.get('shard_index')) if t.get('limits') else None
+
+            output = self._output_fd(task_options)
+            self._usage = TaskUsage(started=time.time(), ready=None, ended=None, returncode=None, cpu=0.0,
+                                    peak_rss=0, direct=output is not None)
 
-            self._process = await self._handler.execute(task_options, self._completion_callback,
-                                                        stderr_redirect)
+            if t.get('node') and t['type'] != "group":
+                agent_pool: AgentPool = get_service(AgentPool)
+                self._process = await agent_pool.execute(t, stderr_redirect)
+            else:
+                await self._handler.prepare(task_options)
+                self._process = await self._handler.execute(task_options, self._completion_callback,
+                                                            stderr_redirect, limits, output)
             if not self._process:
+                # Groups have no process, they go through all their states at once
                 self._running = False
+                for state in ("started", "completed", "succeeded"):
+                    self._notify_state(state)
                 return
 
-            run_mode = t.get("run_mode") or "await_completion"
+            self._notify_state("started")
+            self._record_usage()
+
+            if not isinstance(self._process, RemoteProcess):
+                self._monitor_task = asyncio.ensure_future(self._monitor(self._process.pid))
+            if t.get("ready_timeout") is not None or t.get("timeout") is not None:
+                self._timeout_task = asyncio.ensure_future(self._enforce_timeouts())
+
+            run_mode = t.get("run_mode") or "wait_completion"
             completion_pattern = t.get("completion_pattern")
+
+            if run_mode == "indefinite" and self._completion_callback:
+                # The dependent tasks only wait for the launch
+                self._completion_callback()
+                self._completion_callback = None
+
             self._scanner = AsyncScanner(self._logger, self._err_logger, self._process, self._completion_callback,
-                                         not stderr_redirect)
+                                         not stderr_redirect, self._flow,
+                                         OutputFilter(t['output']) if t.get('output') else None)
 
-            if run_mode == "await_completion" and completion_pattern:
-                await self._scanner.print_and_scan(completion_pattern, self._task['name'])
+            if output is not None:
+                logger.debug(f"Task {self.name} writes its output directly to {self._file_handler.baseFilename}")
+                await self._process.wait()
+                if self._completion_callback:
+                    self._completion_callback()
+                    self._completion_callback = None
+            elif run_mode != "indefinite" and completion_pattern:
+                try:
+                    await self._scanner.print_and_scan(completion_pattern, self._task['name'],
+                                                       t.get("pattern_stream") or "stdout")
+                except TaskRunException:
+                    self._fail("exited before matching its completion pattern")
+                    await self._process_exited()
+                    return
             else:
                 await self._scanner.print(self._task['name'])
+
+            await self._process_exited()
         except asyncio.CancelledError:
             pass
+        finally:
+            if self._monitor_task:
+                self._monitor_task.cancel()
+            if self._timeout_task:
+                self._timeout_task.cancel()
@@ -1,26 +1,33 @@
 import multiprocessing
+import os
 import sys
+import time
 import typing
 from collections import OrderedDict
-from logging.handlers import QueueHandler
 from multiprocessing.connection import Connection
 from queue import Empty
-from typing import List, Set, Dict, Optional
+from typing import List, Set, Dict, Optional, Union
 import asyncio
 import logging
 import traceback
 
-from tinyioc import module, IocModule, register_instance, unregister_service
-
-from . import constants
-from .configuration import AppConfiguration
-from .handler.docker import DockerTaskHandler
-from .handler.group import GroupTaskHandler
-from .handler.shell import ShellTaskHandler
-from .messaging.message import TaskCommandMessage, TaskCommand, TaskStatusMessage, TaskStatus
-from .types.task import Task
+from tinyioc import module, IocModule, register_instance, unregister_service, get_service
+
+from . import constants, profiling
+from .api.ring import OutputRings
+from .api.server import ApiServer
+from .configuration import AppConfiguration, task_hash, load_config, select_tasks, satisfied_states
+from .flow import OutputLedger, FlowController, FlowControlledQueueHandler, create_output_handler
+from .remote.client import AgentPool, AgentConfiguration
+from .messaging.message import TaskCommandMessage, TaskCommand, TaskStatusMessage, TaskStatus, \
+    ConfigurationMessage
+from .errors import TaskBuildException
+from .types.task import Task, Dependency, TasksConfiguration
+from .usage import UsageRecorder
 from .runner import TaskRunner
-from .logger import logger, NewlineStreamHandler
+from .spawn.client import start_spawn_client
+from .worker import WorkerPool, WorkerTaskProxy
+from .logger import logger
 
 
 @module()
@@ -35,11 +42,19 @@ class RunnerProcess(multiprocessing.Process):
 
     _config: Dict[str, Task]
     _arguments: any
-    _running_tasks: typing.OrderedDict[str, TaskRunner]
+    _running_tasks: typing.OrderedDict[str, Union[TaskRunner, WorkerTaskProxy]]
     _async_tasks: Set[asyncio.Task]
 
     _missing_tasks: Dict[str, Task]
-    _completed_tasks: Set[str]
+    # The states reached by each task (started, ready, completed, succeeded) and when
+    _task_states: Dict[str, Dict[str, float]]
+    _task_handles: Dict[str, asyncio.Task]
+    # The tasks being stopped by a configuration reload, whose states are stale
+    _reloading_tasks: Set[str]
+    # Without the GUI, the API or --watch, nothing can run anymore once all the tasks are done
+    _exit_when_done: bool
+    _failing_fast: bool
+    _exit_status: int
 
     _proc_output_queue: multiprocessing.Queue
     _commands_queue: multiprocessing.Queue
@@ -51,10 +66,22 @@ class RunnerProcess(multiprocessing.Process):
     _loop: asyncio.AbstractEventLoop
 
     _termination_pipe: Connection
+    _agents: Optional[Dict[str, AgentConfiguration]]
+    _worker_pool: Optional[WorkerPool]
+    _output_ledger: Optional[OutputLedger]
+    # The ledger slot of each task, kept across restarts and reloads
+    _flow_slots: Dict[str, int]
+    _console_lock: Optional[multiprocessing.Lock]
+    _api_server: Optional[ApiServer]
+    # The states of the tasks run by someone else, e.g. the daemon, which are not run here
+    _external_states: Dict[str, Dict[str, float]]
 
     def __init__(self, configuration: Dict[str, Task], arguments: any, is_gui: bool,
                  output_queue: Optional[multiprocessing.Queue], commands_queue: Optional[multiprocessing.Queue],
-                 task_updates_queue: Optional[multiprocessing.Queue], termination_pipe: Connection):
+                 task_updates_queue: Optional[multiprocessing.Queue], termination_pipe: Connection,
+                 agents: Optional[Dict[str, AgentConfiguration]] = None,
+                 output_ledger: Optional[OutputLedger] = None,
+                 external_states: Optional[Dict[str, Dict[str, float]]] = None):
         super(RunnerProcess, self).__init__()
 
         logger.setLevel(arguments.level)
@@ -68,11 +95,33 @@ class RunnerProcess(multiprocessing.Process):
 
         self._pipe_recv, self._pipe_emit = multiprocessing.Pipe()
         self._termination_pipe = termination_pipe
+        self._agents = agents
+        self._output_ledger = output_ledger
+        self._flow_slots = {}
+        # The workers print the grouped output of their tasks themselves, one task at a time
+        self._console_lock = multiprocessing.Lock() \
+            if arguments.workers and arguments.output == "grouped" and not is_gui else None
+        self._external_states = external_states or {}
+
+    def _failure_policy(self, task_name: str) -> str:
+        return (self._config.get(task_name) or {}).get("on_failure") or self._arguments.on_failure
+
+    def _dependency_met(self, dependency: Dependency) -> bool:
+        states = self._task_states.get(dependency["task"], ())
+        if dependency["when"] in states:
+            return True
+
+        # An ignored failure satisfies any condition once the task completed
+        return "failed" in states and "completed" in states and self._failure_policy(dependency["task"]) == "ignore"
+
+    def _dependencies_met(self, task: Task) -> bool:
+        return all(self._dependency_met(d) for d in task.get("depends") or [])
 
     def _run_missing_tasks(self):
-        tasks_to_run: List[Task] = [t for t in self._missing_tasks.values() if
-                                    (not t.get("depends") or len(t["depends"]) == 0) or set(t["depends"]).issubset(
-                                        self._completed_tasks)]
+        if self._failing_fast:
+            return
+
+        tasks_to_run: List[Task] = [t for t in self._missing_tasks.values() if self._dependencies_met(t)]
 
         for task in tasks_to_run:
             self._missing_tasks.pop(task["name"])
@@ -83,115 +132,404 @@ class RunnerProcess(multiprocessing.Process):
     def task_completed_callback(self, task_name: str, launch_deps: bool = False):
         def cb():
             logger.debug(f"Task {task_name} completed")
-            self._completed_tasks.add(task_name)
             self._task_updates_queue.put(TaskStatusMessage(task=task_name, status=TaskStatus.COMPLETED))
+            self._reach_state(task_name, "ready", launch_deps)
+
+        return cb
 
-            if launch_deps:
-                logger.debug(f"Launching task {task_name} dependencies")
-                self._run_missing_tasks()
+    def task_state_callback(self, task_name: str, launch_deps: bool = True):
+        def cb(state: str):
+            self._reach_state(task_name, state, launch_deps)
 
         return cb
 
-    def _run_task(self, task: Task):
-        t = TaskRunner(task, self._arguments.file_output, self._arguments.level,
-                       self._log_handler)
-        self._running_tasks[task["name"]] = t
+    def _reach_state(self, task_name: str, state: str, launch_deps: bool):
+        if task_name in self._reloading_tasks:
+            return
 
-        logger.debug(f"Running task {task['name']}")
-        async_t = self._loop.create_task(t.start(self.task_completed_callback(task['name'], launch_deps=True)))
+        states = self._task_states.setdefault(task_name, {})
+        if state in states:
+            return
+
+        logger.debug(f"Task {task_name} is {state}")
+        states[state] = time.time()
+
+        if state == "failed" and self._failure_policy(task_name) == "fail-fast":
+            self._fail_fast(task_name)
+
+        if launch_deps:
+            logger.debug(f"Launching the tasks depending on {task_name} being {state}")
+            self._run_missing_tasks()
+
+    def _fail_fast(self, task_name: str):
+        if self._failing_fast:
+            return
+
+        logger.error(f"Task {task_name} failed, stopping the run")
+        self._failing_fast = True
+        for name, runner in list(self._running_tasks.items()):
+            self._stop_by_command(name, runner)
+
+    def _flow_slot(self, name: str) -> int:
+        if name not in self._flow_slots:
+            if len(self._flow_slots) >= self._output_ledger.slots:
+                raise TaskBuildException(f"Too many tasks for the GUI output budgets, at most "
+                                         f"{self._output_ledger.slots}")
+            self._flow_slots[name] = len(self._flow_slots)
+        return self._flow_slots[name]
+
+    def _create_runner(self, task: Task) -> Union[TaskRunner, WorkerTaskProxy]:
+        if self._output_ledger:
+            task = Task(task, flow_slot=self._flow_slot(task["name"]))
+
+        if self._worker_pool:
+            if self._worker_pool.available:
+                return self._worker_pool.create_runner(task)
+            logger.warning(f"No worker process left, running task {task['name']} in the scheduler")
+
+        return TaskRunner(task, self._arguments.file_output, self._arguments.level, self._log_handler,
+                          self._arguments.direct_output and not self._show_gui)
+
+    def _start_runner(self, task: Task, completion_callback: Optional[typing.Callable],
+                      state_callback: typing.Callable[[str], None]):
+        name = task["name"]
+        t = self._create_runner(task)
+        async_t = self._loop.create_task(t.start(completion_callback, state_callback))
+        self._running_tasks[name] = t
+        self._task_handles[name] = async_t
         self._async_tasks.add(async_t)
 
         def async_task_done(as_t):
-            self._task_updates_queue.put(TaskStatusMessage(task=task["name"], status=TaskStatus.STOPPED))
+            self._task_updates_queue.put(TaskStatusMessage(task=name, status=TaskStatus.STOPPED))
             self._async_tasks.discard(as_t)
-            del self._running_tasks[task["name"]]
+
+            # The task may have been restarted meanwhile
+            if self._running_tasks.get(name) is t:
+                del self._running_tasks[name]
+                del self._task_handles[name]
+
+            self._stop_when_done()
 
         async_t.add_done_callback(async_task_done)
-        self._task_updates_queue.put(TaskStatusMessage(task=task["name"], status=TaskStatus.STARTED))
+        self._task_updates_queue.put(TaskStatusMessage(task=name, status=TaskStatus.STARTED))
+
+    def _run_task(self, task: Task):
+        logger.debug(f"Running task {task['name']}")
+        self._start_runner(task, self.task_completed_callback(task['name'], launch_deps=True),
+                           self.task_state_callback(task['name']))
 
     def _cancel_tasks(self):
         logger.debug("Killing running tasks...")
+        stopping = []
         for k in reversed(list(self._running_tasks.keys())):
             t = self._running_tasks[k]
             logger.debug(f"Killing task {t.name}")
             try:
-                t.stop()
+                stop_task = t.stop()
+                if stop_task:
+                    stopping.append(stop_task)
             except:
                 pass
             finally:
                 del self._running_tasks[k]
 
+        if stopping:
+            # The loop is not running anymore, it runs again until the tasks are stopped
+            self._loop.run_until_complete(asyncio.wait(stopping))
+
     def _cancel_async_tasks(self):
         logger.debug("Killing async tasks...")
         for t in self._async_tasks.copy():
             t.cancel()
 
+    def _start_by_command(self, name: str):
+        task_def = self._config.get(name)
+
+        if task_def:
+            logger.debug(f"Starting task {name}")
+            # The dependent tasks were launched by the first run already
+            self._task_states.pop(name, None)
+            self._start_runner(task_def, None, self.task_state_callback(name, launch_deps=False))
+
+    def _stop_by_command(self, name: str, task: Union[TaskRunner, WorkerTaskProxy]):
+        logger.debug(f"Stopping task {name}")
+        try:
+            task.stop()
+        except:
+            traceback.print_exc()
+        finally:
+            logger.debug("Stopped. Sending new status STOPPED")
+            self._task_updates_queue.put(TaskStatusMessage(task=name, status=TaskStatus.STOPPED))
+
+    async def _restart(self, name: str, task: Union[TaskRunner, WorkerTaskProxy]):
+        handle = self._task_handles.get(name)
+        self._stop_by_command(name, task)
+
+        if handle:
+            await asyncio.wait([handle])
+
+        if name not in self._running_tasks:
+            self._start_by_command(name)
+
+    def _stop_when_done(self):
+        if self._exit_when_done and not self._task_handles and self._loop.is_running():
+            logger.debug("No task left running")
+            self._loop.stop()
+
+    def _report_outcome(self, interrupted: bool):
+        """
+        Logs the failed tasks, the ones skipped because of a failure and the ones that never started, and sets the
+        exit status accordingly
+        """
+        usage = get_service(UsageRecorder).usage
+        failed: Dict[str, str] = {}
+        for name, states in self._task_states.items():
+            if "failed" not in states:
+                continue
+
+            returncode = usage.get(name, {}).get("returncode")
+            if "timed_out" in states:
+                reason = "timed out"
+            elif returncode:
+                reason = f"exit code {returncode}"
+            else:
+                reason = "completion pattern not matched"
+            failed[name] = reason + (", ignored" if self._failure_policy(name) == "ignore" else "")
+
+        # The tasks waiting for a failed task, directly or not
+        skipped: Set[str] = set()
+        blocking = {name for name, reason in failed.items() if not reason.endswith("ignored")}
+        while True:
+            newly_skipped = {name for name, t in self._missing_tasks.items()
+                             if name not in skipped and any(d["task"] in blocking for d in t.get("depends") or [])}
+            if not newly_skipped:
+                break
+            skipped |= newly_skipped
+            blocking |= newly_skipped
+        never_started = [name for name in self._missing_tasks if name not in skipped]
+
+        if not self._show_gui:
+            if failed:
+                logger.error("Failed: " + ", ".join(f"{name} ({reason})" for name, reason in failed.items()))
+            if skipped:
+                logger.warning("Skipped after a failure: " + ", ".join(n for n in self._missing_tasks if n in skipped))
+            if never_started:
+                logger.warning("Never started: " + ", ".join(never_started))
+
+        if interrupted:
+            self._exit_status = constants.EXIT_INTERRUPTED
+        elif any(not reason.endswith("ignored") for reason in failed.values()) or skipped \
+                or (never_started and self._exit_when_done):
+            self._exit_status = constants.EXIT_FAILURE
+
+    def _report_usage(self):
+        usage: UsageRecorder = get_service(UsageRecorder)
+        if not self._show_gui:
+            usage.log_summary()
+
+        if self._arguments.timings:
+            try:
+                usage.write_timings(self._arguments.timings)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not write the timings to {self._arguments.timings}: {e}")
+
+    def _handle_command(self, c: TaskCommandMessage) -> bool:
+        """
+        Runs a command coming from the GUI or the API, returns whether it applied to the task current state
+        """
+        logger.debug(f"Received command {c}")
+
+        task = self._running_tasks.get(c.task)
+
+        logger.debug(f"Found task {task}")
+
+        # Task should not be running when starting it
+        if c.command == TaskCommand.START and not task:
+            self._start_by_command(c.task)
+        # Task should be running if we want to stop it
+        elif c.command == TaskCommand.STOP and task:
+            self._stop_by_command(c.task, task)
+        elif c.command == TaskCommand.RESTART and task:
+            restart_task = self._loop.create_task(self._restart(c.task, task))
+            self._async_tasks.add(restart_task)
+            restart_task.add_done_callback(self._async_tasks.discard)
+        elif c.command == TaskCommand.RESTART:
+            self._start_by_command(c.task)
+        else:
+            return False
+
+        return True
+
+    def _list_tasks(self) -> List[dict]:
+        return [{
+            "name": name,
+            "type": task["type"],
+            "running": name in self._running_tasks,
+            "waiting": name in self._missing_tasks,
+            "states": self._task_states.get(name, {}),
+            "hash": task_hash(task),
+            "external": name in self._external_states,
+        } for name, task in self._config.items()]
+
+    @staticmethod
+    def _reruns_dependent(dependency: Dependency, task: Task) -> bool:
+        """
+        A task depending on the result of a finite task runs again when that task does. Services are restarted
+        in place, and `started` dependencies only order the tasks
+        """
+        return dependency["when"] != "started" and task.get("run_mode") != "indefinite"
+
+    def _tasks_to_restart(self, tasks: Dict[str, Task], changed: List[str]) -> List[str]:
+        dependents: Dict[str, List[str]] = {}
+        for name, t in tasks.items():
+            for d in t.get("depends") or []:
+                if d["task"] in tasks and self._reruns_dependent(d, tasks[d["task"]]):
+                    dependents.setdefault(d["task"], []).append(name)
+
+        affected = set(changed)
+        pending = list(changed)
+        while pending:
+            for dependent in dependents.get(pending.pop(), []):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    pending.append(dependent)
+
+        return [name for name in tasks if name in affected]
+
+    async def _reload(self, configuration: TasksConfiguration):
+        """
+        Applies a new configuration, restarting only the tasks whose definition changed and the tasks depending
+        on their result, stopping the removed tasks and running the new ones
+        """
+        tasks = configuration["tasks"]
+        removed = [name for name in self._config if name not in tasks]
+        added = [name for name in tasks if name not in self._config]
+        changed = [name for name in tasks
+                   if name in self._config and task_hash(tasks[name]) != task_hash(self._config[name])]
+        restarted = self._tasks_to_restart(tasks, changed)
+
+        logger.info(f"Configuration reloaded: {len(added)} added, {len(removed)} removed, {len(changed)} changed, "
+                    f"{len(restarted) - len(changed)} dependents to restart")
+
+        self._reloading_tasks = set(removed + restarted)
+        handles = []
+        for name in removed + restarted:
+            runner = self._running_tasks.get(name)
+            if runner:
+                self._stop_by_command(name, runner)
+                handles.append(self._task_handles[name])
+
+        try:
+            if handles:
+                await asyncio.wait(handles)
+        finally:
+            self._reloading_tasks = set()
+
+        self._config = tasks
+        for name in removed + restarted:
+            self._missing_tasks.pop(name, None)
+            self._task_states.pop(name, None)
+            self._external_states.pop(name, None)
+
+        for name in restarted + added:
+            self._missing_tasks[name] = tasks[name]
+        # The tasks still waiting for their dependencies will run with their new definition
+        self._missing_tasks = {name: tasks[name] for name in self._missing_tasks}
+
+        if self._show_gui:
+            self._task_updates_queue.put(ConfigurationMessage(
+                tasks=[name for name, t in tasks.items() if t["type"] != "group"],
+                panes=(configuration.get("gui") or {}).get("panes")))
+
+        self._run_missing_tasks()
+
+    async def _watch_configuration(self):
+        path = self._arguments.configuration_file
+
+        def signature():
+            try:
+                stat = os.stat(path)
+                return stat.st_mtime_ns, stat.st_size
+            except FileNotFoundError:
+                # Some editors replace the file when saving
+                return None
+
+        last_signature = signature()
+        while True:
+            await asyncio.sleep(constants.CONFIGURATION_WATCH_INTERVAL)
+
+            current_signature = signature()
+            if current_signature is None or current_signature == last_signature:
+                continue
+            last_signature = current_signature
+
+            try:
+                configuration, excluded = select_tasks(load_config(path), self._arguments.targets,
+                                                       self._arguments.exclude)
+            except Exception as e:
+                logger.error(f"Not reloading the configuration, it is invalid: {e}")
+                continue
+
+            for name in excluded:
+                self._task_states.setdefault(name, satisfied_states())
+
+            await self._reload(configuration)
+
     async def _poll_commands(self):
         while True:
             try:
-                c: TaskCommandMessage = self._commands_queue.get(False)
-                logger.debug(f"Received command {c}")
-
-                task = self._running_tasks.get(c.task)
-
-                logger.debug(f"Found task {task}")
-
-                # Task should not be running when restarting it
-                if c.command == TaskCommand.START and not task:
-                    logger.debug(f"Starting task {task}")
-                    task_def = self._config[c.task]
-
-                    if task_def:
-                        t = TaskRunner(task_def, self._arguments.file_output, self._arguments.level,
-                                       self._log_handler)
-                        async_t = self._loop.create_task(t.start(None))
-                        self._async_tasks.add(async_t)
-                        self._running_tasks[c.task] = t
-
-                        def async_task_done(as_t):
-                            self._task_updates_queue.put(TaskStatusMessage(task=c.task, status=TaskStatus.STOPPED))
-                            self._async_tasks.discard(as_t)
-
-                            if c.task in self._running_tasks:
-                                del self._running_tasks[c.task]
-
-                        async_t.add_done_callback(async_task_done)
-                        self._task_updates_queue.put(TaskStatusMessage(task=c.task, status=TaskStatus.STARTED))
-                # Task should be running if we want to stop it
-                elif c.command == TaskCommand.STOP and task:
-                    logger.debug(f"Stopping task {task}")
-                    try:
-                        task.stop()
-                    except:
-                        traceback.print_exc()
-                    finally:
-                        logger.debug("Stopped. Sending new status STOPPED")
-                        self._task_updates_queue.put(TaskStatusMessage(task=c.task, status=TaskStatus.STOPPED))
+                self._handle_command(self._commands_queue.get(False))
             except Empty:
                 pass
             await asyncio.sleep(constants.COMMANDS_DEQUEUE_INTERVAL)
 
     def run(self) -> None:
-        register_instance(AppConfiguration([
-            ShellTaskHandler(),
-            DockerTaskHandler(),
-            GroupTaskHandler()
-        ]))
-
-        self._log_handler = QueueHandler(self._proc_output_queue) if self._show_gui else NewlineStreamHandler(
-            sys.stdout)
+        profiler = profiling.start_profiler(self._arguments, "runner")
+
+        # Workers are started first, so that they don't inherit the services of the scheduler
+        self._worker_pool = None
+        if self._arguments.workers:
+            self._worker_pool = WorkerPool(self._arguments.workers, self._arguments, self._show_gui,
+                                           self._proc_output_queue, self._agents, self._output_ledger,
+                                           self._console_lock)
+            self._worker_pool.start()
+
+        register_instance(AppConfiguration())
+        register_instance(AgentPool(self._agents or {}))
+        register_instance(UsageRecorder())
+
+        if self._arguments.api_port or self._arguments.api_socket:
+            register_instance(OutputRings())
+
+        self._log_handler = create_output_handler(self._show_gui, self._proc_output_queue, self._output_ledger,
+                                                  self._arguments, self._console_lock)
         self._running_tasks = OrderedDict()
         self._async_tasks = set()
-        self._missing_tasks = self._config.copy()
-        self._completed_tasks = set()
+        self._missing_tasks = {k: v for k, v in self._config.items() if k not in self._external_states}
+        self._task_states = {k: dict(v) for k, v in self._external_states.items()}
+        self._task_handles = {}
+        self._reloading_tasks = set()
+        self._api_server = None
+        self._exit_when_done = not (self._show_gui or self._arguments.api_port or self._arguments.api_socket
+                                    or getattr(self._arguments, "watch", False))
+        self._failing_fast = False
+        self._exit_status = 0
+        interrupted = False
 
         self._running = True
 
         self._loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self._loop)
 
+        if self._worker_pool:
+            self._worker_pool.watch(self._loop)
+
         register_instance(self._loop, module=RunnerThreadModule, register_for=asyncio.AbstractEventLoop)
 
+        # With workers, the tasks are launched by them
+        spawner = None if self._worker_pool else start_spawn_client(self._arguments, self._loop)
+        watchdog = profiling.watch_slow_callbacks(self._arguments, self._loop)
+
         async def periodic_termination_checker():
             while self._running:
                 if self._pipe_recv.poll():
@@ -201,7 +539,20 @@ class RunnerProcess(multiprocessing.Process):
                 await asyncio.sleep(constants.TERMINATION_CHECK_INTERVAL)
 
         try:
+            if self._arguments.api_port or self._arguments.api_socket:
+                self._api_server = ApiServer(get_service(OutputRings), self._list_tasks,
+                                             lambda task, command: self._handle_command(
+                                                 TaskCommandMessage(task=task, command=command)),
+                                             lambda: self._loop.call_soon(self._loop.stop),
+                                             getattr(self._arguments, "api_token", None))
+                if self._arguments.api_port:
+                    self._loop.run_until_complete(self._api_server.start(self._arguments.api_host,
+                                                                         self._arguments.api_port))
+                if self._arguments.api_socket:
+                    self._loop.run_until_complete(self._api_server.start_unix(self._arguments.api_socket))
+
             self._run_missing_tasks()
+            self._loop.call_soon(self._stop_when_done)
 
             term_task = self._loop.create_task(periodic_termination_checker())
             self._async_tasks.add(term_task)
@@ -211,18 +562,55 @@ class RunnerProcess(multiprocessing.Process):
             self._async_tasks.add(commands_task)
             commands_task.add_done_callback(self._async_tasks.discard)
 
+            if getattr(self._arguments, "watch", False):
+                watch_task = self._loop.create_task(self._watch_configuration())
+                self._async_tasks.add(watch_task)
+                watch_task.add_done_callback(self._async_tasks.discard)
+
+            if isinstance(self._log_handler, FlowControlledQueueHandler):
+                flusher_task = self._loop.create_task(self._log_handler.run_backlog_flusher())
+                self._async_tasks.add(flusher_task)
+                flusher_task.add_done_callback(self._async_tasks.discard)
+
             self._loop.run_forever()
         except KeyboardInterrupt:
             logger.info("Requested termination")
+            interrupted = True
         except Exception as e:
             logger.error("An error occurred")
             traceback.print_exception(e)
+            self._exit_status = constants.EXIT_FAILURE
         finally:
+            if watchdog:
+                watchdog.stop()
+
             unregister_service(asyncio.AbstractEventLoop, module=RunnerThreadModule)
 
+            if self._api_server:
+                self._api_server.close()
+
             self._cancel_async_tasks()
             self._cancel_tasks()
 
+            if spawner:
+                spawner.close()
+
+            if self._worker_pool:
+                self._worker_pool.shutdown()
+
+            self._log_handler.close()
+
+            flow: FlowController = get_service(FlowController)
+            if flow:
+                flow.log_metrics()
+
+            self._report_usage()
+            self._report_outcome(interrupted)
+
+            if self._show_gui:
+                # The GUI is gone or going, don't wait for it to consume the queued output before exiting
+                self._proc_output_queue.cancel_join_thread()
+
             if self._loop.is_running():
                 logger.debug("Terminating the async loop...")
                 self._loop.stop()
@@ -230,10 +618,16 @@ class RunnerProcess(multiprocessing.Process):
             logger.debug("Closing the async loop...")
             self._loop.close()
 
+            if profiler:
+                profiler.stop()
+
         self._running = False
         logger.debug("Sending termination to main process")
         self._termination_pipe.send(1)
 
+        if self._exit_status:
+            sys.exit(self._exit_status)
+
     def stop(self, timeout: Optional[float] = None):
         self._pipe_emit.send(1)
         try:
@@ -1,111 +1,130 @@
 import asyncio
 import logging
-import re
+import time
 from asyncio.subprocess import Process
-from typing import Callable, Optional
+from typing import Callable, Optional, Literal
 
+from . import constants
 from .errors import TaskRunException
+from .flow import FlowController, OverflowPolicy
+from .matcher import PatternMatcher
+from .output_filter import OutputFilter
+
+PatternStream = Literal["stdout", "stderr", "both"]
 
 
 class AsyncScanner:
-    _read_timeout = 1
     _process: Process
     _completion_callback: Optional[Callable]
     _stderr_print: bool
     _logger: logging.Logger
     _err_logger: logging.Logger
+    _pattern_matched: bool
+    _flow: Optional[FlowController]
+    _output_filter: Optional[OutputFilter]
 
     def __init__(self, logger: logging.Logger, err_logger: logging.Logger, process: Process,
-                 completion_callback: Callable, print_stderr: bool = False):
+                 completion_callback: Callable, print_stderr: bool = False, flow: Optional[FlowController] = None,
+                 output_filter: Optional[OutputFilter] = None):
         self._process = process
         self._completion_callback = completion_callback
         self._stderr_print = print_stderr
         self._logger = logger
         self._err_logger = err_logger
+        self._pattern_matched = False
+        self._flow = flow
+        self._output_filter = output_filter
 
-    @staticmethod
-    async def _readline(stream: asyncio.StreamReader, timeout: float):
-        try:
-            return await asyncio.wait_for(stream.readline(), timeout=timeout)
-        except asyncio.TimeoutError:
-            return None
+    def _complete(self):
+        if self._completion_callback:
+            self._completion_callback()
+            self._completion_callback = None
 
-    async def print_and_scan(self, pattern: str, task_name: str = "unknown"):
-        if self._stderr_print:
-            return await asyncio.gather(self._print_and_scan_stdout(pattern, task_name), self._print_stderr(task_name))
-        else:
-            return await self._print_and_scan_stdout(pattern, task_name)
+    async def print_and_scan(self, pattern: str, task_name: str = "unknown", stream: PatternStream = "stdout"):
+        matcher = PatternMatcher(pattern)
+        # When stderr is redirected, its lines are matched as part of stdout
+        stdout_matcher = matcher if stream in ("stdout", "both") or not self._stderr_print else None
+        stderr_matcher = matcher if stream in ("stderr", "both") else None
 
-    async def print(self, task_name: str = "unknown"):
         if self._stderr_print:
-            return await asyncio.gather(self._print_stdout(task_name), self._print_stderr(task_name))
+            await asyncio.gather(self._consume(self._process.stdout, self._logger, task_name, stdout_matcher),
+                                 self._consume(self._process.stderr, self._err_logger, task_name, stderr_matcher))
         else:
-            return await self._print_stdout(task_name)
-
-    async def _print_and_scan_stdout(self, pattern: str, task_name: str):
-        reg = re.compile(pattern)
-        pattern_matched = False
-
-        try:
-            while self._process.returncode is None:
-                line_b = await self._readline(self._process.stdout, self._read_timeout)
-
-                if line_b is not None:
-                    line = line_b.decode('utf-8', errors='ignore')
-                    self._logger.info(line, extra={'subprocess': task_name})
-                    if reg.match(line):
-                        pattern_matched = True
-
-                        if self._completion_callback:
-                            self._completion_callback()
-                            self._completion_callback = None
-
-                        return await self._print_stdout(task_name)
-
-            if not pattern_matched:
-                while line_b := await self._process.stdout.readline():
-                    line = line_b.decode('utf-8', errors='ignore')
-                    self._logger.info(line, extra={'subprocess': task_name})
-                    if reg.match(line):
-                        pattern_matched = True
-
-                        if self._completion_callback:
-                            self._completion_callback()
-                            self._completion_callback = None
+            await self._consume(self._process.stdout, self._logger, task_name, stdout_matcher)
 
-                        return await self._print_stdout(task_name)
-        except Exception:
-            pass
-
-        if not pattern_matched:
+        if not self._pattern_matched:
             raise TaskRunException(f"Could not match given pattern on '{task_name}' before process exit")
 
-    async def _print_stdout(self, task_name: str):
-        try:
-            while self._process.returncode is None:
-                line_b = await self._readline(self._process.stdout, self._read_timeout)
-
-                if line_b is not None:
-                    self._logger.info(line_b.decode('utf-8', errors='ignore'), extra={'subprocess': task_name})
-
-            while line_b := await self._process.stdout.readline():
-                self._logger.info(line_b.decode('utf-8', errors='ignore'), extra={'subprocess': task_name})
-
-            if self._completion_callback:
-                self._completion_callback()
-                self._completion_callback = None
-        except:
-            pass
-
-    async def _print_stderr(self, task_name: str):
-        try:
-            while self._process.returncode is None:
-                line_b = await self._readline(self._process.stderr, self._read_timeout)
-
-                if line_b is not None:
-                    self._err_logger.info(line_b.decode('utf-8', errors='ignore'), extra={'subprocess': task_name})
-
-            while line_b := await self._process.stderr.readline():
-                self._err_logger.info(line_b.decode('utf-8', errors='ignore'), extra={'subprocess': task_name})
-        except:
-            pass
+    async def print(self, task_name: str = "unknown"):
+        if self._stderr_print:
+            await asyncio.gather(self._consume(self._process.stdout, self._logger, task_name),
+                                 self._consume(self._process.stderr, self._err_logger, task_name))
+        else:
+            await self._consume(self._process.stdout, self._logger, task_name)
+
+        self._complete()
+
+    async def _consume(self, stream: asyncio.StreamReader, logger: logging.Logger, task_name: str,
+                       matcher: Optional[PatternMatcher] = None):
+        """
+        Reads the stream in chunks, logging it line by line. The pattern is matched on the whole lines of every
+        chunk at once, until it matches once, before the output rules of the task drop any line.
+        The lines carry the time they were read, the time their first part was read for the lines split over chunks
+        """
+        pending = b""
+        pending_captured = 0.0
+        block = self._flow is not None and self._flow.policy(task_name) == OverflowPolicy.BLOCK
+
+        while True:
+            if block:
+                await self._flow.wait_for_capacity(task_name)
+
+            chunk = await stream.read(constants.SCANNER_READ_SIZE)
+            if not chunk:
+                break
+
+            now = time.time()
+            captured = pending_captured if pending else now
+            data = pending + chunk if pending else chunk
+            end = data.rfind(b"\n") + 1
+
+            if end == 0 and len(data) < constants.SCANNER_MAX_LINE_LENGTH:
+                pending = data
+                pending_captured = captured
+                continue
+            elif end == 0:
+                end = len(data)
+
+            lines, pending = data[:end], data[end:]
+            pending_captured = now
+            self._log_lines(lines, logger, task_name, captured)
+
+            if matcher and not self._pattern_matched and matcher.scan(lines):
+                self._pattern_matched = True
+                self._complete()
+
+        if pending:
+            self._log_lines(pending, logger, task_name, pending_captured)
+            if matcher and not self._pattern_matched and matcher.scan(pending):
+                self._pattern_matched = True
+                self._complete()
+
+        if self._output_filter:
+            for line in self._output_filter.flush():
+                logger.info(line, extra={'subprocess': task_name, 'captured': time.time()})
+
+    def _log_lines(self, lines: bytes, logger: logging.Logger, task_name: str, captured: float):
+        extra = {'subprocess': task_name, 'captured': captured}
+
+        if self._output_filter:
+            for line in self._output_filter.apply(lines):
+                logger.info(line, extra=extra)
+            return
+
+        parts = lines.decode('utf-8', errors='ignore').split("\n")
+        last = parts.pop()
+
+        for line in parts:
+            logger.info(line + "\n", extra=extra)
+        if last:
+            logger.info(last, extra=extra)
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+from typing import Optional, Dict, List
+
+from tinyioc import register_instance
+
+from ..logger import logger
+from . import server
+
+
+def spawn_server_supported() -> bool:
+    return hasattr(os, "posix_spawnp") and hasattr(socket, "send_fds")
+
+
+class SpawnedProcess:
+    """
+    A process launched by the spawn server, offering the subset of `asyncio.subprocess.Process` used by the runner
+    """
+    pid: int
+    returncode: Optional[int]
+    stdout: Optional[asyncio.StreamReader]
+    stderr: Optional[asyncio.StreamReader]
+
+    _fds: List[int]
+    _exited: asyncio.Event
+
+    def __init__(self, pid: int, fds: List[int]):
+        self.pid = pid
+        self.returncode = None
+        self.stdout = None
+        self.stderr = None
+        self._fds = fds
+        self._exited = asyncio.Event()
+
+    async def _connect(self, loop: asyncio.AbstractEventLoop):
+        readers = []
+        for fd in self._fds:
+            reader = asyncio.StreamReader(loop=loop)
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader, loop=loop),
+                                         os.fdopen(fd, "rb", 0))
+            readers.append(reader)
+
+        self.stdout = readers[0]
+        self.stderr = readers[1] if len(readers) > 1 else None
+
+    def _on_exit(self, returncode: int):
+        self.returncode = returncode
+        self._exited.set()
+
+    async def wait(self) -> int:
+        await self._exited.wait()
+        return self.returncode
+
+
+class SpawnClient:
+    """
+    Launches the tasks processes through the spawn server, a small helper process started once
+    """
+    _server: Optional[subprocess.Popen]
+    _socket: Optional[socket.socket]
+    _loop: Optional[asyncio.AbstractEventLoop]
+    _pending: Dict[int, asyncio.Future]
+    _processes: Dict[int, SpawnedProcess]
+    _next_id: int
+
+    def __init__(self):
+        self._server = None
+        self._socket = None
+        self._loop = None
+        self._pending = {}
+        self._processes = {}
+        self._next_id = 0
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._socket, server_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._server = subprocess.Popen([sys.executable, "-S", server.__file__, str(server_socket.fileno())],
+                                        pass_fds=[server_socket.fileno()], stdin=subprocess.DEVNULL)
+        server_socket.close()
+        self._socket.setblocking(False)
+
+        self._loop = loop
+        loop.add_reader(self._socket.fileno(), self._on_message)
+        logger.debug(f"Spawn server {self._server.pid} started")
+
+    def _on_message(self):
+        while True:
+            try:
+                data, fds, _, _ = socket.recv_fds(self._socket, server.MAX_MESSAGE_SIZE, 2)
+            except BlockingIOError:
+                return
+            except OSError:
+                data, fds = b"", []
+
+            if not data:
+                logger.error("The spawn server terminated")
+                self._loop.remove_reader(self._socket.fileno())
+                for future in self._pending.values():
+                    future.set_exception(OSError("The spawn server terminated"))
+                self._pending.clear()
+                return
+
+            message = json.loads(data)
+
+            if "exit" in message:
+                process = self._processes.pop(message["exit"], None)
+                if process:
+                    process._on_exit(message["returncode"])
+                continue
+
+            future = self._pending.pop(message["id"])
+            if "error" in message:
+                future.set_exception(OSError(message["error"]))
+            else:
+                # Registered right away, the exit message can be next in this same batch
+                process = self._processes[message["pid"]] = SpawnedProcess(message["pid"], fds)
+                future.set_result(process)
+
+    async def spawn(self, argv: List[str], cwd: Optional[str], env: Optional[Dict[str, str]],
+                    stderr_redirect: bool) -> SpawnedProcess:
+        request_id = self._next_id
+        self._next_id += 1
+
+        future = self._loop.create_future()
+        self._pending[request_id] = future
+        request = {"op": "spawn", "id": request_id, "argv": argv, "cwd": cwd, "env": env,
+                   "stderr_redirect": stderr_redirect}
+        await self._loop.sock_sendall(self._socket, json.dumps(request).encode("utf-8"))
+
+        process: SpawnedProcess = await future
+        await process._connect(self._loop)
+        return process
+
+    def close(self, timeout: float = 1):
+        if not self._server:
+            return
+
+        try:
+            self._loop.remove_reader(self._socket.fileno())
+            self._socket.send(json.dumps({"op": "exit"}).encode("utf-8"))
+            self._server.wait(timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self._server.kill()
+        finally:
+            self._socket.close()
+
+
+def start_spawn_client(arguments, loop: asyncio.AbstractEventLoop) -> Optional[SpawnClient]:
+    """
+    Starts and registers the spawn client if requested by the `--spawn-server` option and supported
+    """
+    if not getattr(arguments, "spawn_server", False):
+        return None
+
+    if not spawn_server_supported():
+        logger.warning("The spawn server is not supported on this platform, ignoring --spawn-server")
+        return None
+
+    spawner = SpawnClient()
+    spawner.start(loop)
+    register_instance(spawner)
+    return spawner
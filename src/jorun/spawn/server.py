@@ -0,0 +1,97 @@
+"""
+The spawn server, run as a script by a fresh interpreter so that it stays small: launching a process from it
+costs much less than forking the runner. It only depends on the standard library.
+
+Requests and replies are JSON datagrams on the socket passed as first argument. A spawn request is replied with
+the pid of the child and, as ancillary data, the read ends of its output pipes. Children are reaped here, and
+their exit code sent in an `exit` message.
+"""
+import json
+import os
+import selectors
+import signal
+import socket
+import sys
+
+MAX_MESSAGE_SIZE = 1024 * 1024
+PARENT_CHECK_INTERVAL = 1
+
+
+def spawn(request: dict):
+    stdout_read, stdout_write = os.pipe()
+    stderr_read, stderr_write = (None, None) if request.get("stderr_redirect") else os.pipe()
+
+    file_actions = [
+        (os.POSIX_SPAWN_OPEN, 0, os.devnull, os.O_RDONLY, 0),
+        (os.POSIX_SPAWN_DUP2, stdout_write, 1),
+        (os.POSIX_SPAWN_DUP2, stderr_write if stderr_write is not None else stdout_write, 2),
+    ]
+
+    cwd = request.get("cwd")
+    previous_cwd = os.getcwd() if cwd else None
+
+    try:
+        # The server is single threaded, changing its directory for the spawn is safe
+        if cwd:
+            os.chdir(cwd)
+        pid = os.posix_spawnp(request["argv"][0], request["argv"], request.get("env") or os.environ,
+                              file_actions=file_actions, setsid=True)
+    finally:
+        if previous_cwd:
+            os.chdir(previous_cwd)
+        os.close(stdout_write)
+        if stderr_write is not None:
+            os.close(stderr_write)
+
+    fds = [stdout_read] if stderr_read is None else [stdout_read, stderr_read]
+    return pid, fds
+
+
+def main():
+    sock = socket.socket(fileno=int(sys.argv[1]))
+    parent = os.getppid()
+
+    wakeup_read, wakeup_write = os.pipe()
+    os.set_blocking(wakeup_write, False)
+    signal.set_wakeup_fd(wakeup_write)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    selector.register(wakeup_read, selectors.EVENT_READ)
+
+    while os.getppid() == parent:
+        for key, _ in selector.select(PARENT_CHECK_INTERVAL):
+            if key.fileobj is sock:
+                data = sock.recv(MAX_MESSAGE_SIZE)
+                request = json.loads(data) if data else {"op": "exit"}
+
+                if request["op"] == "exit":
+                    return
+
+                try:
+                    pid, fds = spawn(request)
+                except OSError as e:
+                    sock.send(json.dumps({"id": request["id"], "error": str(e)}).encode("utf-8"))
+                    continue
+
+                socket.send_fds(sock, [json.dumps({"id": request["id"], "pid": pid}).encode("utf-8")], fds)
+                for fd in fds:
+                    os.close(fd)
+            else:
+                os.read(wakeup_read, 4096)
+
+                while True:
+                    try:
+                        pid, status = os.waitpid(-1, os.WNOHANG)
+                    except ChildProcessError:
+                        break
+                    if pid == 0:
+                        break
+                    sock.send(json.dumps({"exit": pid, "returncode": os.waitstatus_to_exitcode(status)})
+                              .encode("utf-8"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import asyncio
+import errno
+import os
+import platform
+from typing import Tuple, Optional, Dict
+
+from . import constants
+
+
+def tty_supported() -> bool:
+    return platform.system() != "Windows"
+
+
+def open_tty() -> Tuple[int, int]:
+    """
+    Opens a pseudo-terminal for the output of a task, returning its master and slave ends. Output processing is
+    disabled, so that lines end with a plain newline
+    """
+    import fcntl
+    import pty
+    import struct
+    import termios
+
+    master, slave = pty.openpty()
+
+    attributes = termios.tcgetattr(slave)
+    attributes[1] &= ~termios.OPOST
+    attributes[3] &= ~termios.ECHO
+    termios.tcsetattr(slave, termios.TCSANOW, attributes)
+
+    fcntl.ioctl(master, termios.TIOCSWINSZ, struct.pack("HHHH", constants.TTY_ROWS, constants.TTY_COLUMNS, 0, 0))
+    return master, slave
+
+
+def tty_environment(environment: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """
+    The environment of a task run on a pseudo-terminal, given the variables set by the task. It describes
+    a terminal without cursor control, so that programs don't redraw their output, unless the task sets
+    these variables itself
+    """
+    return {
+        **os.environ,
+        "TERM": constants.TTY_TERM,
+        "COLUMNS": str(constants.TTY_COLUMNS),
+        "LINES": str(constants.TTY_ROWS),
+        **{k: str(v) for k, v in (environment or {}).items()},
+    }
+
+
+class TtyReaderProtocol(asyncio.StreamReaderProtocol):
+    """
+    Reading the master end of a pseudo-terminal fails with EIO once the task and its children closed the slave end,
+    which is the end of the output
+    """
+
+    def connection_lost(self, exc: Optional[Exception]):
+        if isinstance(exc, OSError) and exc.errno == errno.EIO:
+            exc = None
+        super(TtyReaderProtocol, self).connection_lost(exc)
+
+
+async def read_tty(master: int) -> asyncio.StreamReader:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=constants.SCANNER_MAX_LINE_LENGTH, loop=loop)
+    await loop.connect_read_pipe(lambda: TtyReaderProtocol(reader, loop=loop), os.fdopen(master, "rb", 0))
+    return reader
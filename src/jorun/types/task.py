@@ -1,19 +1,50 @@
-from typing import TypedDict, List, Literal, Optional, Dict
+from typing import TypedDict, List, Literal, Optional, Dict, Union, Any
 from dataclasses import dataclass
 
+from ..flow import BackpressureConfiguration
 from ..handler.docker import DockerTask
 from ..handler.shell import ShellTask
+from ..limits import TaskLimits
+from ..output_filter import OutputConfiguration
+from ..remote.client import AgentConfiguration, NodeSelector
+
+
+DependencyCondition = Literal["started", "ready", "completed", "succeeded"]
+FailurePolicy = Literal["fail-fast", "continue", "ignore"]
+
+
+class Dependency(TypedDict):
+    task: str
+    when: Optional[DependencyCondition]
 
 
 class Task(TypedDict):
     name: str
-    type: Literal["shell", "docker", "group"]
+    # shell, docker, group, or the type of a handler declared by another package
+    type: str
     shell: Optional[ShellTask]
     docker: Optional[DockerTask]
     run_mode: Literal["wait_completion", "indefinite"]
     completion_pattern: Optional[str]
     pattern_in_stderr: Optional[bool]
-    depends: Optional[List[str]]
+    pattern_stream: Optional[Literal["stdout", "stderr", "both"]]
+    depends: Optional[List[Union[str, Dependency]]]
+    limits: Optional[TaskLimits]
+    node: Optional[Union[str, NodeSelector]]
+    backpressure: Optional[BackpressureConfiguration]
+    output: Optional[OutputConfiguration]
+    shards: Optional[Union[int, Literal["auto"]]]
+    matrix: Optional[Dict[str, List[Any]]]
+    on_failure: Optional[FailurePolicy]
+    # Seconds
+    ready_timeout: Optional[float]
+    timeout: Optional[float]
+    # The expected duration in seconds, for `jorun plan`
+    estimate: Optional[float]
+    # Set on the tasks generated from `shards` or `matrix`
+    shard_index: Optional[int]
+    # Set by the scheduler with the GUI, the output ledger slot of the task
+    flow_slot: Optional[int]
 
 
 class PaneConfiguration(TypedDict):
@@ -29,6 +60,7 @@ class GuiConfiguration(TypedDict):
 class TasksConfiguration(TypedDict):
     tasks: Dict[str, Task]
     gui: Optional[GuiConfiguration]
+    agents: Optional[Dict[str, AgentConfiguration]]
 
 
 @dataclass
@@ -3,13 +3,16 @@ import time
 from multiprocessing.connection import Connection
 from queue import Queue, Empty
 from threading import Thread
-from typing import List, Callable, Optional, Dict
+from typing import List, Callable, Optional, Dict, Union
 
 from PySide6.QtWidgets import QApplication
+from tinyioc import get_service
 
 from .main_window import MainWindow
+from .theme import install_theme
 from ..logger import logger
-from ..messaging.message import TaskStatusMessage
+from ..messaging.message import TaskStatusMessage, ConfigurationMessage
+from ..palette.base import BaseColorPalette
 from ..types.task import PaneConfiguration
 
 
@@ -80,7 +83,12 @@ class UiApplication:
         while self._dequeue_running:
             if self._window:
                 try:
-                    status: TaskStatusMessage = self._task_status_queue.get(block=True, timeout=0.5)
+                    status: Union[TaskStatusMessage, ConfigurationMessage] = self._task_status_queue.get(
+                        block=True, timeout=0.5)
+                    if isinstance(status, ConfigurationMessage):
+                        self._window.dispatch_configuration(status)
+                        continue
+
                     logger.debug(f"Task status dequeued: {status}")
                     self._window.dispatch_task_status(status)
                 except Empty:
@@ -102,9 +110,12 @@ class UiApplication:
     def _run_ui_thread(self):
         self._app = QApplication(sys.argv)
         self._app.setQuitOnLastWindowClosed(True)
+        install_theme(self._app, get_service(BaseColorPalette))
 
+        start = time.perf_counter()
         self._window = MainWindow(self._task_list, gui_config=self._config)
         self._window.show()
+        logger.debug(f"Main window shown in {1000 * (time.perf_counter() - start):.0f} ms")
 
         self._app.exec()
         self._running = False
@@ -2,8 +2,8 @@ from PySide6.QtCore import QObject, Signal
 
 
 class MainWindowSignals(QObject):
-    data_received = Signal(object)
     task_status_received = Signal(object)
+    configuration_received = Signal(object)
     app_terminated = Signal()
 
 
@@ -1,98 +1,195 @@
+import time
+from collections import deque, defaultdict
 from logging import LogRecord
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Deque, Tuple
 
-from PySide6.QtCore import Slot
+from PySide6.QtCore import Slot, QTimer
 from PySide6.QtWidgets import QMainWindow, QTabWidget
 from tinyioc import get_service
 
 from .data_signals import DataUpdateSignalEmitter, MainWindowSignals
 from .pane import TasksPane
+from .task_panel import TaskPanel
+from .timeline import TimelineBuffer, TimelinePane
 from .. import constants
-from ..messaging.message import TaskStatusMessage
-from ..palette.base import BaseColorPalette
+from ..flow import OutputLedger
+from ..logger import logger
+from ..messaging.message import TaskStatusMessage, ConfigurationMessage
 from ..types.task import PaneConfiguration
 
+# The pane of the tasks not listed in the configured panes
+OTHER_TASKS_PANE = "-"
+
 
 class MainWindow(QMainWindow, DataUpdateSignalEmitter):
     _tab_widget: QTabWidget
-    _panes: List[TasksPane]
+    _panes: Dict[str, TasksPane]
+    _task_panes: Dict[str, TasksPane]
+    # The output of every task with the time it was read, for the timeline
+    _timeline_buffers: Dict[str, TimelineBuffer]
+    _timeline: TimelinePane
     signals = MainWindowSignals()
 
+    # Written by the stream dequeue thread, drained by the UI thread once per frame
+    _pending_records: Deque[LogRecord]
+    _flush_timer: QTimer
+
+    _ui_busy_time: float
+    _ui_busy_records: int
+    _ui_stats_start: float
+
     def __init__(self, tasks: List[str], gui_config: Optional[Dict[str, PaneConfiguration]]):
         super(MainWindow, self).__init__()
 
-        palette: BaseColorPalette = get_service(BaseColorPalette)
-
         self.signals.app_terminated.connect(self.close)
-        self._panes = []
+        self.signals.configuration_received.connect(self._handle_configuration)
+        self._panes = {}
 
-        self.setStyleSheet(f"""
-            background-color: {palette.background};
-        """)
         self.setMinimumSize(300, 300)
 
         self.setWindowTitle(constants.APP_NAME)
 
         self._tab_widget = QTabWidget(self)
-        self._tab_widget.setStyleSheet(f"""
-            QTabWidget::pane
-            {{
-                background: {palette.selection};
-            }}
-            
-            QTabBar::tab {{
-                background: {palette.selection};
-                color: {palette.foreground};
-                border-top-left-radius: 8px;
-                border-top-right-radius: 8px;
-                padding: 6px;
-                margin: 0 1px 0 1px;
-            }}
-            
-            QTabBar::tab:selected {{
-                font-weight: bold;
-            }}
-        """)
 
         self.setCentralWidget(self._tab_widget)
 
-        tasks_bucket = set(tasks)
+        self._apply_configuration(tasks, gui_config)
 
-        if gui_config:
-            for pane_name, pane_options in gui_config.items():
-                pane = TasksPane(None, pane_options.get("tasks"), columns=pane_options.get("columns") or 3)
-                pane.setAutoFillBackground(True)
-                self._tab_widget.addTab(pane, pane_name)
-                self._panes.append(pane)
+        self._timeline_buffers = {}
+        self._timeline = TimelinePane(None, self._timeline_buffers, tasks)
+        self._tab_widget.addTab(self._timeline, constants.TIMELINE_TAB)
 
-                for t in pane_options["tasks"]:
-                    tasks_bucket.discard(t)
-
-        if len(tasks_bucket) > 0:
-            extra_pane = TasksPane(None, list(tasks_bucket))
-            extra_pane.setAutoFillBackground(True)
-            self._tab_widget.addTab(extra_pane, "-")
-            self._panes.append(extra_pane)
-
-        self.signals.data_received.connect(self._handle_stream_record)
         self.signals.task_status_received.connect(self._handle_task_status)
 
-    @Slot(LogRecord)
-    def _handle_stream_record(self, record: LogRecord):
-        for p in self._panes:
-            p.dispatch_log_record(record)
+        self._pending_records = deque()
+        self._ui_busy_time = 0
+        self._ui_busy_records = 0
+        self._ui_stats_start = time.monotonic()
+
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setInterval(constants.UI_FRAME_INTERVAL)
+        self._flush_timer.timeout.connect(self._flush_stream_records)
+        self._flush_timer.start()
+
+    def _apply_configuration(self, tasks: List[str], gui_config: Optional[Dict[str, PaneConfiguration]]):
+        """
+        Creates, updates and removes the panes to match the configuration. The panes that didn't change are left
+        alone, and the panels of the tasks still shown are moved along with their output
+        """
+        layout: Dict[str, Tuple[List[str], int]] = {}
+        for pane_name, pane_options in (gui_config or {}).items():
+            layout[pane_name] = (pane_options.get("tasks") or [], pane_options.get("columns") or 3)
+
+        shown = {t for pane_tasks, _ in layout.values() for t in pane_tasks}
+        other_tasks = [t for t in tasks if t not in shown]
+        if other_tasks:
+            layout[OTHER_TASKS_PANE] = (other_tasks, 3)
+
+        panels: Dict[str, TaskPanel] = {}
+        for pane_name, pane in list(self._panes.items()):
+            if pane_name not in layout:
+                panels.update(pane.detach_panels())
+                self._tab_widget.removeTab(self._tab_widget.indexOf(pane))
+                pane.deleteLater()
+                del self._panes[pane_name]
+            elif layout[pane_name] != (pane.tasks, pane.columns):
+                panels.update(pane.detach_panels())
+
+        for position, (pane_name, (pane_tasks, columns)) in enumerate(layout.items()):
+            pane = self._panes.get(pane_name)
+            if not pane:
+                pane = TasksPane(None, [], columns=columns)
+                pane.setAutoFillBackground(True)
+                pane.set_tasks(pane_tasks, columns, panels)
+                self._tab_widget.insertTab(position, pane, pane_name)
+                self._panes[pane_name] = pane
+                continue
+
+            if self._tab_widget.indexOf(pane) != position:
+                self._tab_widget.tabBar().moveTab(self._tab_widget.indexOf(pane), position)
+            if (pane.tasks, pane.columns) != (pane_tasks, columns):
+                pane.set_tasks(pane_tasks, columns, panels)
+
+        # The panels of the tasks no longer shown
+        for panel in panels.values():
+            panel.deleteLater()
+
+        self._task_panes = {t: p for p in self._panes.values() for t in p.tasks}
+
+    @Slot(ConfigurationMessage)
+    def _handle_configuration(self, configuration: ConfigurationMessage):
+        logger.debug("Updating the panes to the new configuration")
+        self._apply_configuration(configuration.tasks, configuration.panes)
+        self._timeline.set_tasks(configuration.tasks)
+
+    @Slot()
+    def _flush_stream_records(self):
+        if not self._pending_records:
+            return
+
+        start = time.perf_counter()
+        batches: Dict[str, List[LogRecord]] = defaultdict(list)
+        count = 0
+
+        try:
+            while True:
+                record = self._pending_records.popleft()
+                batches[record.subprocess].append(record)
+                count += 1
+        except IndexError:
+            pass
+
+        ledger: Optional[OutputLedger] = get_service(OutputLedger)
+
+        for task, records in batches.items():
+            text = "".join(r.message for r in records)
+
+            pane = self._task_panes.get(task)
+            if pane:
+                pane.dispatch_output(task, text)
+
+            buffer = self._timeline_buffers.get(task)
+            if buffer is None:
+                buffer = self._timeline_buffers[task] = TimelineBuffer()
+            for r in records:
+                # The records of the runner, e.g. the dropped lines markers, have no capture time
+                buffer.append(getattr(r, "captured", r.created), r.message)
+
+            if ledger:
+                # Lets the runner send more output of this task, counted as it was by the runner
+                for r in records:
+                    if hasattr(r, "flow_slot"):
+                        ledger.consumed(r.flow_slot, r.flow_size)
+
+        self._track_ui_time(time.perf_counter() - start, count)
+
+    def _track_ui_time(self, elapsed: float, records: int):
+        self._ui_busy_time += elapsed
+        self._ui_busy_records += records
+
+        now = time.monotonic()
+        if now - self._ui_stats_start >= constants.UI_STATS_INTERVAL:
+            window = now - self._ui_stats_start
+            logger.debug(f"UI thread busy {1000 * self._ui_busy_time / window:.1f} ms/s "
+                         f"displaying {self._ui_busy_records / window:.0f} records/s")
+            self._ui_busy_time = 0
+            self._ui_busy_records = 0
+            self._ui_stats_start = now
 
     @Slot(TaskStatusMessage)
     def _handle_task_status(self, status: TaskStatusMessage):
-        for p in self._panes:
+        for p in self._panes.values():
             p.dispatch_task_status(status)
 
-    # noinspection PyUnresolvedReferences
     def dispatch_stream_record(self, record: LogRecord):
-        self.signals.data_received.emit(record)
+        # Safe to call from any thread, the records are displayed on the next frame
+        self._pending_records.append(record)
 
     def dispatch_task_status(self, status: TaskStatusMessage):
         self.signals.task_status_received.emit(status)
 
+    def dispatch_configuration(self, configuration: ConfigurationMessage):
+        self.signals.configuration_received.emit(configuration)
+
     def dispatch_app_termination(self):
         self.signals.app_terminated.emit()
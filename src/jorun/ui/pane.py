@@ -1,13 +1,13 @@
-from logging import LogRecord
-from typing import Optional, List, Dict
+from collections import deque
+from typing import Optional, List, Dict, Deque
 
 from PySide6.QtCore import Qt
+from PySide6.QtGui import QShowEvent
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QSplitter
-from tinyioc import get_service
 
+from .. import constants
 from ..logger import logger
-from ..messaging.message import TaskStatusMessage
-from ..palette.base import BaseColorPalette
+from ..messaging.message import TaskStatusMessage, TaskStatus
 from .task_panel import TaskPanel
 
 
@@ -19,48 +19,119 @@ class TasksPane(QWidget):
     _task_widgets: Dict[str, TaskPanel]
     _splitters: List[QSplitter]
 
+    # Until the pane is first shown, the status and the latest output lines of its tasks are only kept here
+    _built: bool
+    _pending_output: Dict[str, Deque[str]]
+    _pending_status: Dict[str, TaskStatus]
+    # The panels taken from other panes when the configuration changed, laid out on the next build
+    _reused_panels: Dict[str, TaskPanel]
+
     def __init__(self, parent: Optional[QWidget], tasks: List[str], columns: int = 3):
         super(TasksPane, self).__init__(parent)
 
-        palette: BaseColorPalette = get_service(BaseColorPalette)
-
         self._tasks = tasks
         self._total_columns = columns
         self._task_widgets = {}
         self._splitters = []
 
-        self._central_widget = QSplitter(Qt.Orientation.Vertical, self)
-        self._central_widget.setStyleSheet(f"""
-            background-color: {palette.background};
-        """)
+        self._built = False
+        self._pending_output = {}
+        self._pending_status = {}
+        self._reused_panels = {}
 
         self._layout = QVBoxLayout(self)
         self.setLayout(self._layout)
         self.setContentsMargins(4, 4, 4, 4)
 
+    @property
+    def tasks(self) -> List[str]:
+        return self._tasks
+
+    @property
+    def columns(self) -> int:
+        return self._total_columns
+
+    def detach_panels(self) -> Dict[str, TaskPanel]:
+        """
+        Removes the panels of the tasks from the pane and returns them, keeping their output, so that they can be
+        laid out again by `set_tasks`
+        """
+        panels = {**self._reused_panels, **self._task_widgets}
+        for panel in panels.values():
+            panel.setParent(None)
+
+        if self._built:
+            self._layout.removeWidget(self._central_widget)
+            self._central_widget.deleteLater()
+
+        self._built = False
+        self._splitters = []
+        self._task_widgets = {}
+        self._reused_panels = {}
+        return panels
+
+    def set_tasks(self, tasks: List[str], columns: int, panels: Dict[str, TaskPanel]):
+        """
+        Lays out a new list of tasks, taking the existing panels of the tasks from `panels`
+        """
+        self._tasks = tasks
+        self._total_columns = columns
+        self._reused_panels = {t: panels.pop(t) for t in tasks if t in panels}
+        self._pending_output = {t: o for t, o in self._pending_output.items() if t in tasks}
+        self._pending_status = {t: s for t, s in self._pending_status.items() if t in tasks}
+
+        if self.isVisible():
+            self._build()
+
+    def showEvent(self, event: QShowEvent):
+        if not self._built:
+            self._build()
+        super(TasksPane, self).showEvent(event)
+
+    def _build(self):
+        logger.debug(f"Building the panels of tasks {', '.join(self._tasks)}")
+        self._built = True
+
+        self._splitters = []
+        self._central_widget = QSplitter(Qt.Orientation.Vertical, self)
         self._layout.addWidget(self._central_widget)
 
         col = 0
         for task in self._tasks:
             if col % self._total_columns == 0:
                 last_splitter = QSplitter(Qt.Orientation.Horizontal, self._central_widget)
-                last_splitter.setStyleSheet(f"""
-                    background-color: {palette.background};
-                """)
                 self._central_widget.addWidget(last_splitter)
                 self._splitters.append(last_splitter)
 
-            task_panel = TaskPanel(self._splitters[-1], task)
+            task_panel = self._reused_panels.pop(task, None) or TaskPanel(self._splitters[-1], task)
             self._splitters[-1].addWidget(task_panel)
+            task_panel.show()
             self._task_widgets[task] = task_panel
 
             col += 1
 
-    # noinspection PyUnresolvedReferences
-    def dispatch_log_record(self, record: LogRecord):
-        if record.subprocess in self._task_widgets:
-            self._task_widgets[record.subprocess].append_text(record)
+        for task, status in self._pending_status.items():
+            self._task_widgets[task].update_status(status)
+        for task, output in self._pending_output.items():
+            self._task_widgets[task].append_output("".join(output))
+
+        self._pending_status.clear()
+        self._pending_output.clear()
+
+    def dispatch_output(self, task: str, text: str):
+        if self._built:
+            self._task_widgets[task].append_output(text)
+        else:
+            pending = self._pending_output.get(task)
+            if pending is None:
+                pending = self._pending_output[task] = deque(maxlen=constants.PANE_PENDING_LINES)
+            pending.extend(text.splitlines(keepends=True))
 
     def dispatch_task_status(self, status: TaskStatusMessage):
-        if status.task in self._task_widgets:
+        if status.task not in self._tasks:
+            return
+
+        if self._built:
             self._task_widgets[status.task].update_status(status.status)
+        else:
+            self._pending_status[status.task] = status.status
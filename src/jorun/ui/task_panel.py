@@ -1,20 +1,21 @@
 import re
-from logging import LogRecord
 from typing import Optional
 
-from PySide6.QtCore import Slot
+from PySide6.QtCore import Slot, Qt
+from PySide6.QtGui import QTextCursor, QShowEvent
 from PySide6.QtWidgets import QGroupBox, QVBoxLayout, QWidget, QPlainTextEdit, QLabel, QLineEdit, QSizePolicy, \
     QPushButton, QHBoxLayout, QStyle
 from tinyioc import get_service
 
 from .command_handler import TaskCommandHandler
-from .utils import icon_from_standard_pixmap
+from .theme import Theme
 from ..logger import logger
 from ..messaging.message import TaskStatus, TaskCommand
-from ..palette.base import BaseColorPalette
 
 from .. import constants
 
+_ANSI_ESCAPE = re.compile(r'\x1b\[([0-9,A-Z]{1,2}(;[0-9]{1,2})?(;[0-9]{3})?)?[m|K]?')
+
 
 class TaskPanel(QGroupBox):
     _layout: QVBoxLayout
@@ -25,6 +26,8 @@ class TaskPanel(QGroupBox):
     _output_stream_edit_text: QPlainTextEdit
 
     _output_stream: str
+    # Whether the output changed while the panel was hidden
+    _output_stale: bool
 
     _task_name: str
     _task_label: QLabel
@@ -33,23 +36,22 @@ class TaskPanel(QGroupBox):
     _filter_edit_text: QLineEdit
 
     _current_status: TaskStatus
+    _theme: Theme
 
     def __init__(self, parent: Optional[QWidget], task_name: str):
         super(TaskPanel, self).__init__(parent)
 
-        palette: BaseColorPalette = get_service(BaseColorPalette)
+        self._theme = get_service(Theme)
 
         self._task_name = task_name
         self._output_stream = ""
+        self._output_stale = False
         self._current_status = TaskStatus.STOPPED
 
         self._layout = QVBoxLayout(self)
         self.setLayout(self._layout)
-
-        self.setStyleSheet(f"""
-            background-color: {palette.current_line};
-            border: 0;
-        """)
+        # Styled by the application stylesheet of the theme
+        self.setObjectName("taskPanel")
 
         self._actions_group_widget = QWidget(self)
         self._actions_group_layout = QVBoxLayout(self)
@@ -66,21 +68,14 @@ class TaskPanel(QGroupBox):
         self._task_label = QLabel(self._task_header_widget)
         self._task_label.setText(self._task_name)
         self._task_label.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
-        self._task_label.setStyleSheet(f"""
-            color: {palette.foreground};
-            font-weight: bold;
-        """)
+        self._task_label.setObjectName("taskName")
         self._task_header_layout.addWidget(self._task_label)
 
         self._task_command_btn = QPushButton(self._task_header_widget)
 
-        self._task_command_btn.setIcon(
-            icon_from_standard_pixmap(self.style(), QStyle.StandardPixmap.SP_MediaPlay, palette.foreground))
-        self._task_command_btn.setStyleSheet(f"""
-            color: {palette.foreground};
-            background-color: {palette.background};
-            cursor: pointer;
-        """)
+        self._task_command_btn.setIcon(self._theme.icon(QStyle.StandardPixmap.SP_MediaPlay))
+        self._task_command_btn.setObjectName("taskCommand")
+        self._task_command_btn.setCursor(Qt.CursorShape.PointingHandCursor)
         self._task_command_btn.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed)
         self._task_command_btn.setFixedSize(24, 24)
         self._task_command_btn.clicked.connect(self.task_state_command_click)
@@ -88,25 +83,25 @@ class TaskPanel(QGroupBox):
 
         self._filter_edit_text = QLineEdit(self)
         self._filter_edit_text.setPlaceholderText("Filter")
-        self._filter_edit_text.setStyleSheet(f"""
-            background-color: {palette.background};
-            color: {palette.foreground};
-        """)
+        self._filter_edit_text.setObjectName("taskFilter")
         self._filter_edit_text.textChanged.connect(self._filter_changed)
         self._actions_group_layout.addWidget(self._filter_edit_text)
 
         self._output_stream_edit_text = QPlainTextEdit(self)
         self._output_stream_edit_text.setReadOnly(True)
         self._output_stream_edit_text.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
-        self._output_stream_edit_text.setStyleSheet(f"""
-            background-color: {palette.background}; 
-            color: {palette.foreground}; 
-            font-family: monospace;
-        """)
+        self._output_stream_edit_text.setObjectName("taskOutput")
         self._layout.addWidget(self._output_stream_edit_text, 1)
 
-    # noinspection PyUnresolvedReferences
-    def append_text(self, record: LogRecord):
+    def append_output(self, text: str):
+        processed_text = _ANSI_ESCAPE.sub('', text)
+        self._output_stream += processed_text
+
+        # Hidden panels skip the rendering, they catch up when shown
+        if not self.isVisible():
+            self._output_stale = True
+            return
+
         scroll_bottom = False
         previous_scrollbar_pos = self._output_stream_edit_text.verticalScrollBar().value()
 
@@ -114,9 +109,7 @@ class TaskPanel(QGroupBox):
                 self._output_stream_edit_text.verticalScrollBar().maximum() - constants.SCROLL_TOLERANCE:
             scroll_bottom = True
 
-        processed_message = re.sub(r'\x1b\[([0-9,A-Z]{1,2}(;[0-9]{1,2})?(;[0-9]{3})?)?[m|K]?', '', record.message)
-        self._output_stream += processed_message
-        self._update_output_edit_text()
+        self._append_output_edit_text(processed_text)
 
         if scroll_bottom:
             self._output_stream_edit_text.verticalScrollBar().setValue(
@@ -126,6 +119,15 @@ class TaskPanel(QGroupBox):
                 min(self._output_stream_edit_text.verticalScrollBar().maximum(),
                     max(self._output_stream_edit_text.verticalScrollBar().minimum(), previous_scrollbar_pos)))
 
+    def showEvent(self, event: QShowEvent):
+        super(TaskPanel, self).showEvent(event)
+
+        if self._output_stale:
+            self._output_stale = False
+            self._update_output_edit_text()
+            self._output_stream_edit_text.verticalScrollBar().setValue(
+                self._output_stream_edit_text.verticalScrollBar().maximum())
+
     @Slot()
     def task_state_command_click(self):
         command_handler: TaskCommandHandler = get_service(TaskCommandHandler)
@@ -137,18 +139,27 @@ class TaskPanel(QGroupBox):
 
     def update_status(self, status: TaskStatus):
         logger.debug(f"task_panel.update_status: Update status for task {self._task_name}: {status}")
-        palette: BaseColorPalette = get_service(BaseColorPalette)
+        if status == self._current_status:
+            return
 
         if status == TaskStatus.STOPPED:
-            self._task_command_btn.setIcon(
-                icon_from_standard_pixmap(self.style(), QStyle.StandardPixmap.SP_MediaPlay, palette.foreground))
+            self._task_command_btn.setIcon(self._theme.icon(QStyle.StandardPixmap.SP_MediaPlay))
         elif status == TaskStatus.STARTED:
-            self._task_command_btn.setIcon(
-                icon_from_standard_pixmap(self.style(), QStyle.StandardPixmap.SP_MediaStop, palette.foreground))
+            self._task_command_btn.setIcon(self._theme.icon(QStyle.StandardPixmap.SP_MediaStop))
 
-        self._task_command_btn.update()
         self._current_status = status
 
+    def _append_output_edit_text(self, text: str):
+        filter_input = self._filter_edit_text.text()
+
+        if filter_input:
+            text = "".join(line for line in text.splitlines(keepends=True) if filter_input in line)
+
+        if text:
+            cursor = QTextCursor(self._output_stream_edit_text.document())
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.insertText(text)
+
     def _update_output_edit_text(self):
         filter_input = self._filter_edit_text.text()
 
@@ -0,0 +1,99 @@
+from typing import Dict
+
+from PySide6.QtGui import QIcon
+from PySide6.QtWidgets import QStyle, QApplication
+from tinyioc import register_instance
+
+from .utils import icon_from_standard_pixmap
+from ..palette.base import BaseColorPalette
+
+
+class Theme:
+    """
+    The look of the interface for a palette: a single stylesheet for the whole application, selecting the widgets by
+    object name, and the tinted icons, rendered once and shared by all the panels
+    """
+    palette: BaseColorPalette
+    stylesheet: str
+    _style: QStyle
+    _icons: Dict[QStyle.StandardPixmap, QIcon]
+
+    def __init__(self, palette: BaseColorPalette, style: QStyle):
+        self.palette = palette
+        self._style = style
+        self._icons = {}
+        # The rules cascade like the stylesheets of the widgets they replace: the task panel sets the background of
+        # all its children, its output the background of its viewport and scrollbars
+        self.stylesheet = f"""
+            QMainWindow, QMainWindow QWidget {{
+                background-color: {palette.background};
+            }}
+
+            QTabWidget::pane {{
+                background: {palette.selection};
+            }}
+
+            QTabBar::tab {{
+                background: {palette.selection};
+                color: {palette.foreground};
+                border-top-left-radius: 8px;
+                border-top-right-radius: 8px;
+                padding: 6px;
+                margin: 0 1px 0 1px;
+            }}
+
+            QTabBar::tab:selected {{
+                font-weight: bold;
+            }}
+
+            #taskPanel, #taskPanel QWidget {{
+                background-color: {palette.current_line};
+                border: 0;
+            }}
+
+            #taskPanel #taskName {{
+                color: {palette.foreground};
+                font-weight: bold;
+            }}
+
+            #taskPanel #taskCommand, #taskPanel #taskFilter {{
+                color: {palette.foreground};
+                background-color: {palette.background};
+            }}
+
+            #timeline QLineEdit, #timeline QToolButton, #timeline QPushButton {{
+                color: {palette.foreground};
+                background-color: {palette.current_line};
+                border: 0;
+                padding: 2px 6px;
+            }}
+
+            #timeline #timelineView {{
+                color: {palette.foreground};
+                font-family: monospace;
+                border: 0;
+            }}
+
+            #timeline #timelineView::item:selected {{
+                background-color: {palette.selection};
+            }}
+
+            #taskPanel #taskOutput, #taskPanel #taskOutput QWidget {{
+                background-color: {palette.background};
+                color: {palette.foreground};
+                font-family: monospace;
+            }}
+        """
+
+    def icon(self, pixmap: QStyle.StandardPixmap) -> QIcon:
+        icon = self._icons.get(pixmap)
+        if icon is None:
+            icon = self._icons[pixmap] = icon_from_standard_pixmap(self._style, pixmap, self.palette.foreground)
+        return icon
+
+
+def install_theme(app: QApplication, palette: BaseColorPalette) -> Theme:
+    theme = Theme(palette, app.style())
+    app.setStyleSheet(theme.stylesheet)
+    register_instance(theme)
+    return theme
@@ -0,0 +1,242 @@
+import heapq
+from array import array
+from datetime import datetime
+from typing import List, Dict, Optional, Iterator, Tuple, Any
+
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt, Slot, QTimer
+from PySide6.QtGui import QShowEvent, QAction
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QListView, QToolButton, QMenu, \
+    QPushButton
+
+from .. import constants
+
+
+class TimelineBuffer:
+    """
+    The latest output lines of a task, with the time the runner read them. The lines are numbered from the first
+    one of the task, the ones before `start` have been dropped
+    """
+    start: int
+    times: array
+    lines: List[str]
+    _max_lines: int
+
+    def __init__(self, max_lines: int = constants.TIMELINE_MAX_LINES):
+        self.start = 0
+        self.times = array("d")
+        self.lines = []
+        self._max_lines = max_lines
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.lines)
+
+    def append(self, captured: float, line: str):
+        self.times.append(captured)
+        self.lines.append(line)
+
+        # Dropped in bulk, which keeps appending O(1)
+        if len(self.lines) >= 2 * self._max_lines:
+            del self.times[:self._max_lines]
+            del self.lines[:self._max_lines]
+            self.start += self._max_lines
+
+    def line(self, number: int) -> Optional[str]:
+        return self.lines[number - self.start] if number >= self.start else None
+
+    def time(self, number: int) -> Optional[float]:
+        return self.times[number - self.start] if number >= self.start else None
+
+
+def _entries(buffer: TimelineBuffer, index: int, end: int) -> Iterator[Tuple[float, int, int]]:
+    number = buffer.start
+    while number < end:
+        # The lines dropped while the merge is going on are skipped
+        number = max(number, buffer.start)
+        if number < end:
+            yield buffer.times[number - buffer.start], index, number
+        number += 1
+
+
+class TimelineModel(QAbstractListModel):
+    """
+    The lines of several tasks in the order they were read, merged lazily from the buffers of the tasks as the view
+    scrolls. The rows only reference the lines of the buffers, by task and line number
+    """
+    _tasks: List[str]
+    _buffers: List[TimelineBuffer]
+    _merged: Optional[Iterator[Tuple[float, int, int]]]
+    _filter: str
+    _row_tasks: array
+    _row_lines: array
+
+    def __init__(self, parent: Optional[QWidget] = None):
+        super(TimelineModel, self).__init__(parent)
+        self._tasks = []
+        self._buffers = []
+        self._merged = None
+        self._filter = ""
+        self._row_tasks = array("H")
+        self._row_lines = array("Q")
+
+    def set_buffers(self, buffers: Dict[str, TimelineBuffer], text_filter: str = ""):
+        """
+        Merges the lines the buffers hold at this time, keeping those containing the filter
+        """
+        self.beginResetModel()
+        self._tasks = list(buffers.keys())
+        self._buffers = list(buffers.values())
+        # The buffers keep growing, the merge stops at their current end
+        self._merged = heapq.merge(*(_entries(b, i, b.end) for i, b in enumerate(self._buffers)))
+        self._filter = text_filter
+        self._row_tasks = array("H")
+        self._row_lines = array("Q")
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._row_lines)
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return not parent.isValid() and self._merged is not None
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._merged is None:
+            return
+
+        merged = self._merged
+        batch = []
+        scanned = 0
+        for entry in merged:
+            line = self._buffers[entry[1]].line(entry[2])
+            if line is not None and (not self._filter or self._filter in line):
+                batch.append(entry)
+                if len(batch) == constants.TIMELINE_FETCH_SIZE:
+                    break
+
+            scanned += 1
+            if scanned == constants.TIMELINE_FETCH_SCAN:
+                # The view only fetches again once the new rows are shown, the scan goes on without blocking it
+                if len(batch) < constants.TIMELINE_FETCH_SIZE:
+                    QTimer.singleShot(0, lambda: self._merged is merged and self.fetchMore())
+                break
+        else:
+            self._merged = None
+
+        if batch:
+            first = len(self._row_lines)
+            self.beginInsertRows(QModelIndex(), first, first + len(batch) - 1)
+            for _, task, line in batch:
+                self._row_tasks.append(task)
+                self._row_lines.append(line)
+            self.endInsertRows()
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+
+        buffer = self._buffers[self._row_tasks[index.row()]]
+        number = self._row_lines[index.row()]
+        line = buffer.line(number)
+        if line is None:
+            return f"[{self._tasks[self._row_tasks[index.row()]]}] (dropped)"
+
+        captured = datetime.fromtimestamp(buffer.time(number)).strftime("%H:%M:%S.%f")[:-3]
+        return f"{captured} [{self._tasks[self._row_tasks[index.row()]]}] {line.rstrip()}"
+
+
+class TimelinePane(QWidget):
+    """
+    Shows the output of the selected tasks merged in the order it was read, e.g. to follow the startup of services
+    depending on each other. It is merged again when shown, or refreshed, to include the latest output
+    """
+    _buffers: Dict[str, TimelineBuffer]
+    _tasks: List[str]
+    _selected: Dict[str, bool]
+
+    _layout: QVBoxLayout
+    _tasks_button: QToolButton
+    _tasks_menu: QMenu
+    _filter_edit_text: QLineEdit
+    _filter_timer: QTimer
+    _view: QListView
+    _model: TimelineModel
+
+    def __init__(self, parent: Optional[QWidget], buffers: Dict[str, TimelineBuffer], tasks: List[str]):
+        super(TimelinePane, self).__init__(parent)
+
+        self._buffers = buffers
+        self._tasks = []
+        self._selected = {}
+
+        self._layout = QVBoxLayout(self)
+        self.setLayout(self._layout)
+        self.setObjectName("timeline")
+
+        header = QWidget(self)
+        header_layout = QHBoxLayout(header)
+        header_layout.setContentsMargins(0, 0, 0, 0)
+        self._layout.addWidget(header)
+
+        self._tasks_menu = QMenu(self)
+        self._tasks_button = QToolButton(header)
+        self._tasks_button.setText("Tasks")
+        self._tasks_button.setMenu(self._tasks_menu)
+        self._tasks_button.setPopupMode(QToolButton.ToolButtonPopupMode.InstantPopup)
+        header_layout.addWidget(self._tasks_button)
+
+        self._filter_edit_text = QLineEdit(header)
+        self._filter_edit_text.setPlaceholderText("Filter")
+        self._filter_edit_text.setObjectName("timelineFilter")
+        header_layout.addWidget(self._filter_edit_text, 1)
+
+        # Merged again once the typing pauses, rather than on every key
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(constants.TIMELINE_FILTER_DELAY)
+        self._filter_timer.timeout.connect(self.refresh)
+        self._filter_edit_text.textChanged.connect(lambda _: self._filter_timer.start())
+
+        refresh_btn = QPushButton("Refresh", header)
+        refresh_btn.setObjectName("timelineRefresh")
+        refresh_btn.clicked.connect(self.refresh)
+        header_layout.addWidget(refresh_btn)
+
+        self._model = TimelineModel(self)
+        self._view = QListView(self)
+        self._view.setObjectName("timelineView")
+        # The rows are not measured one by one, which keeps millions of them fast to scroll
+        self._view.setUniformItemSizes(True)
+        self._view.setModel(self._model)
+        self._layout.addWidget(self._view, 1)
+
+        self.set_tasks(tasks)
+
+    def set_tasks(self, tasks: List[str]):
+        # The new tasks are selected, the others keep their selection
+        self._selected = {t: self._selected.get(t, True) for t in tasks}
+        self._tasks = tasks
+
+        self._tasks_menu.clear()
+        for task in tasks:
+            action = QAction(task, self._tasks_menu)
+            action.setCheckable(True)
+            action.setChecked(self._selected[task])
+            action.toggled.connect(lambda checked, t=task: self._select(t, checked))
+            self._tasks_menu.addAction(action)
+
+        if self.isVisible():
+            self.refresh()
+
+    def _select(self, task: str, selected: bool):
+        self._selected[task] = selected
+        self.refresh()
+
+    @Slot()
+    def refresh(self):
+        self._filter_timer.stop()
+        self._model.set_buffers({t: self._buffers[t] for t in self._tasks if self._selected[t] and t in self._buffers},
+                                self._filter_edit_text.text())
+
+    def showEvent(self, event: QShowEvent):
+        super(TimelinePane, self).showEvent(event)
+        self.refresh()
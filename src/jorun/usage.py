@@ -0,0 +1,77 @@
+import json
+import os
+import time
+from typing import TypedDict, Optional, Dict, List
+
+from . import constants
+from .logger import logger
+
+
+class TaskUsage(TypedDict):
+    started: float
+    ready: Optional[float]
+    ended: Optional[float]
+    returncode: Optional[int]
+    # CPU seconds of the task process and its children
+    cpu: float
+    peak_rss: int
+    # Whether the output went straight to the log file
+    direct: bool
+
+
+def _format_size(size: int) -> str:
+    for unit in ("", "K", "M", "G"):
+        if size < 1024 or unit == "G":
+            return f"{size:.0f}{unit}" if unit == "" else f"{size:.1f}{unit}"
+        size /= 1024
+
+
+class UsageRecorder:
+    """
+    Collects the timings and resource usage of the tasks, sampled by their runners
+    """
+    usage: Dict[str, TaskUsage]
+
+    def __init__(self):
+        self.usage = {}
+
+    def update(self, task: str, usage: TaskUsage):
+        self.usage[task] = usage
+
+    def summary(self) -> List[str]:
+        now = time.time()
+        width = max([len(name) for name in self.usage] + [4])
+        lines = [f"{'Task':<{width}}  {'Wall':>9}  {'Ready':>9}  {'CPU':>9}  {'Peak RSS':>9}  {'Exit':>5}"]
+
+        for name, u in self.usage.items():
+            wall = (u["ended"] or now) - u["started"]
+            ready = f"{u['ready'] - u['started']:.2f}s" if u["ready"] else "-"
+            returncode = "-" if u["returncode"] is None else str(u["returncode"])
+            lines.append(f"{name:<{width}}  {wall:>8.2f}s  {ready:>9}  {u['cpu']:>8.2f}s  "
+                         f"{_format_size(u['peak_rss']):>9}  {returncode:>5}")
+
+        return lines
+
+    def log_summary(self):
+        if self.usage:
+            logger.info("Tasks usage:\n" + "\n".join(self.summary()))
+
+    def write_timings(self, path: str):
+        """
+        Adds the time each task took to be ready, or to exit, to a timings history file usable by `jorun plan`
+        """
+        history: Dict[str, List[float]] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                history = json.load(f)
+
+        for name, u in self.usage.items():
+            end = u["ready"] or u["ended"]
+            if end:
+                durations = history.get(name)
+                durations = durations if isinstance(durations, list) else [durations] if durations else []
+                history[name] = (durations + [round(end - u["started"], 3)])[-constants.TIMINGS_HISTORY_LENGTH:]
+
+        with open(path, "w") as f:
+            json.dump(history, f, indent=2)
+        logger.debug(f"Timings written to {path}")
@@ -1,7 +1,14 @@
+import asyncio
 import platform
+import shutil
 import subprocess
 import sys
 import os
+from multiprocessing.connection import Connection
+from typing import Optional, Callable, List
+
+from . import constants
+from .limits import ProcessLimits
 
 
 def get_process_group_args():
@@ -20,3 +27,64 @@ def get_process_group_args():
         kwargs.update(start_new_session=True)
 
     return kwargs
+
+
+def get_process_limits_args(limits: Optional[ProcessLimits], client_only: bool = False) -> dict:
+    """
+    This function will generate the `preexec_fn` argument applying the task resource limits in the child process,
+    right before the command is executed.
+    """
+    kwargs = {}
+    if limits:
+        preexec_fn = limits.preexec_fn(client_only)
+        if preexec_fn:
+            kwargs.update(preexec_fn=preexec_fn)
+
+    return kwargs
+
+
+def watch_connection(loop: asyncio.AbstractEventLoop, connection: Connection, callback: Callable[[], None]) \
+        -> Callable[[], None]:
+    """
+    This function will call `callback` on the event loop whenever `connection` has data to read.
+    The selector is used where available, while on Windows the connection is polled.
+    The callback is expected to close the connection once it reaches EOF.
+    Returns a function that stops watching the connection.
+    """
+    if platform.system() != "Windows":
+        fd = connection.fileno()
+        loop.add_reader(fd, callback)
+        return lambda: loop.remove_reader(fd)
+
+    async def poll():
+        while not connection.closed:
+            while not connection.closed and connection.poll():
+                callback()
+            await asyncio.sleep(constants.COMMANDS_DEQUEUE_INTERVAL)
+
+    task = loop.create_task(poll())
+    return task.cancel
+
+
+# Characters changing the meaning of a command line when run through the shell
+SHELL_METACHARACTERS = frozenset("|&;<>()$`\\\"'*?[]#~{}!\n")
+SHELL_BUILTINS = frozenset([".", ":", "alias", "bg", "break", "case", "cd", "command", "continue", "declare", "do",
+                            "done", "elif", "else", "esac", "eval", "exec", "exit", "export", "fc", "fg", "fi", "for",
+                            "function", "getopts", "hash", "if", "in", "jobs", "local", "read", "readonly", "return",
+                            "set", "shift", "source", "then", "time", "times", "trap", "type", "ulimit", "umask",
+                            "unalias", "unset", "until", "wait", "while"])
+
+
+def direct_argv(command: str) -> Optional[List[str]]:
+    """
+    Returns the arguments to run a command line without going through the shell, if the shell would do nothing
+    but split it on whitespace and look the program up in the PATH
+    """
+    if platform.system() == "Windows" or not SHELL_METACHARACTERS.isdisjoint(command):
+        return None
+
+    argv = command.split()
+    if not argv or argv[0] in SHELL_BUILTINS or "=" in argv[0] or not shutil.which(argv[0]):
+        return None
+
+    return argv
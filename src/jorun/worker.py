@@ -0,0 +1,414 @@
+import asyncio
+import logging
+import multiprocessing
+from collections import defaultdict
+from multiprocessing.connection import Connection
+from typing import Dict, List, Optional, Callable
+
+from tinyioc import register_instance, get_service
+
+from . import constants, profiling
+from .api.ring import OutputRings
+from .configuration import AppConfiguration
+from .errors import TaskRunException
+from .flow import OutputLedger, FlowController, FlowControlledQueueHandler, create_output_handler
+from .logger import logger
+from .messaging.message import WorkerCommandMessage, WorkerCommand, WorkerEventMessage, WorkerEvent
+from .remote.client import AgentPool, AgentConfiguration
+from .runner import TaskRunner
+from .spawn.client import start_spawn_client
+from .types.task import Task
+from .usage import TaskUsage, UsageRecorder
+from .utils import watch_connection
+
+
+class OutputVolumeFilter(logging.Filter):
+    """
+    Counts the bytes of output logged by every task, without filtering anything
+    """
+    volume: Dict[str, int]
+
+    def __init__(self):
+        super(OutputVolumeFilter, self).__init__()
+        self.volume = defaultdict(int)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        task = getattr(record, "subprocess", None)
+        if task:
+            self.volume[task] += len(record.msg)
+        return True
+
+
+class OutputForwarder:
+    """
+    Stands for the output rings of the scheduler in a worker process, collecting the output lines to be sent
+    to the scheduler in batches
+    """
+    pending: Dict[str, List[str]]
+
+    def __init__(self):
+        self.pending = defaultdict(list)
+
+    def append(self, task: str, line: str):
+        self.pending[task].append(line)
+
+
+class UsageForwarder:
+    """
+    Stands for the usage recorder of the scheduler in a worker process, keeping the last usage of the tasks
+    to be sent to the scheduler
+    """
+    pending: Dict[str, TaskUsage]
+
+    def __init__(self):
+        self.pending = {}
+
+    def update(self, task: str, usage: TaskUsage):
+        self.pending[task] = usage
+
+
+class WorkerProcess(multiprocessing.Process):
+    """
+    Owns the subprocess pipes, output scanning and sinks of the tasks the scheduler assigns to it
+    """
+    index: int
+    connection: Connection
+
+    _worker_connection: Connection
+    _arguments: any
+    _show_gui: bool
+    _output_queue: Optional[multiprocessing.Queue]
+    _agents: Optional[Dict[str, AgentConfiguration]]
+    _output_ledger: Optional[OutputLedger]
+    _console_lock: Optional[multiprocessing.Lock]
+
+    _loop: asyncio.AbstractEventLoop
+    _runners: Dict[str, TaskRunner]
+    _volume_filter: OutputVolumeFilter
+    _usage_forwarder: UsageForwarder
+
+    def __init__(self, index: int, arguments: any, is_gui: bool, output_queue: Optional[multiprocessing.Queue],
+                 agents: Optional[Dict[str, AgentConfiguration]], output_ledger: Optional[OutputLedger],
+                 console_lock: Optional[multiprocessing.Lock] = None):
+        super(WorkerProcess, self).__init__(name=f"jorun-worker-{index}")
+
+        self.index = index
+        self.connection, self._worker_connection = multiprocessing.Pipe()
+        self._arguments = arguments
+        self._show_gui = is_gui
+        self._output_queue = output_queue
+        self._agents = agents
+        self._output_ledger = output_ledger
+        self._console_lock = console_lock
+
+    def close_worker_end(self):
+        # Once started, only the worker holds its end, so that the scheduler sees EOF if the worker dies
+        self._worker_connection.close()
+
+    def _send(self, message: WorkerEventMessage):
+        try:
+            self._worker_connection.send(message)
+        except (OSError, EOFError):
+            logger.debug(f"Worker {self.index} could not reach the scheduler")
+
+    def _start_task(self, definition: Task, log_handler: logging.Handler):
+        name = definition["name"]
+        runner = TaskRunner(definition, self._arguments.file_output, self._arguments.level, log_handler,
+                            self._arguments.direct_output and not self._show_gui)
+        self._runners[name] = runner
+
+        async_t = self._loop.create_task(
+            runner.start(lambda: self._send(WorkerEventMessage(event=WorkerEvent.READY, task=name)),
+                         lambda state: self._send(WorkerEventMessage(event=WorkerEvent.STATE, task=name, state=state))))
+
+        def task_done(_):
+            if self._runners.get(name) is runner:
+                del self._runners[name]
+            self._send_usage()
+            self._send(WorkerEventMessage(event=WorkerEvent.EXITED, task=name))
+
+        async_t.add_done_callback(task_done)
+
+    def _stop_tasks(self):
+        stopping = []
+        for name, runner in reversed(list(self._runners.items())):
+            logger.debug(f"Worker {self.index}: killing task {name}")
+            try:
+                stop_task = runner.stop()
+                if stop_task:
+                    stopping.append(stop_task)
+            except Exception:
+                pass
+
+        if stopping:
+            self._loop.run_until_complete(asyncio.wait(stopping))
+
+    def _send_usage(self):
+        if self._usage_forwarder.pending:
+            usage = dict(self._usage_forwarder.pending)
+            self._usage_forwarder.pending.clear()
+            self._send(WorkerEventMessage(event=WorkerEvent.USAGE, usage=usage))
+
+    async def _report_volume(self):
+        while True:
+            await asyncio.sleep(constants.WORKER_VOLUME_REPORT_INTERVAL)
+            self._send_usage()
+            if self._volume_filter.volume:
+                volume = dict(self._volume_filter.volume)
+                self._volume_filter.volume.clear()
+                self._send(WorkerEventMessage(event=WorkerEvent.OUTPUT_VOLUME, volume=volume))
+
+    async def _forward_output(self, forwarder: OutputForwarder):
+        while True:
+            await asyncio.sleep(constants.API_FORWARD_INTERVAL)
+            if forwarder.pending:
+                output = dict(forwarder.pending)
+                forwarder.pending.clear()
+                self._send(WorkerEventMessage(event=WorkerEvent.OUTPUT, output=output))
+
+    def run(self) -> None:
+        profiler = profiling.start_profiler(self._arguments, f"worker{self.index}")
+
+        register_instance(AppConfiguration())
+        register_instance(AgentPool(self._agents or {}))
+
+        self._usage_forwarder = UsageForwarder()
+        register_instance(self._usage_forwarder, register_for=UsageRecorder)
+
+        forwarder = None
+        if self._arguments.api_port or self._arguments.api_socket:
+            forwarder = OutputForwarder()
+            register_instance(forwarder, register_for=OutputRings)
+
+        log_handler = create_output_handler(self._show_gui, self._output_queue, self._output_ledger, self._arguments,
+                                            self._console_lock)
+        self._volume_filter = OutputVolumeFilter()
+        log_handler.addFilter(self._volume_filter)
+
+        self._runners = {}
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        spawner = start_spawn_client(self._arguments, self._loop)
+        watchdog = profiling.watch_slow_callbacks(self._arguments, self._loop)
+
+        def on_command():
+            try:
+                c: WorkerCommandMessage = self._worker_connection.recv()
+            except (EOFError, OSError):
+                self._worker_connection.close()
+                self._loop.stop()
+                return
+
+            if c.command == WorkerCommand.START:
+                self._start_task(c.definition, log_handler)
+            elif c.command == WorkerCommand.STOP and c.task in self._runners:
+                self._runners[c.task].stop()
+            elif c.command == WorkerCommand.SHUTDOWN:
+                self._loop.stop()
+
+        unwatch = watch_connection(self._loop, self._worker_connection, on_command)
+        background_tasks = [self._loop.create_task(self._report_volume())]
+        if isinstance(log_handler, FlowControlledQueueHandler):
+            background_tasks.append(self._loop.create_task(log_handler.run_backlog_flusher()))
+        if forwarder:
+            background_tasks.append(self._loop.create_task(self._forward_output(forwarder)))
+
+        try:
+            self._loop.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if watchdog:
+                watchdog.stop()
+            unwatch()
+            for t in background_tasks:
+                t.cancel()
+            self._loop.run_until_complete(asyncio.gather(*background_tasks, return_exceptions=True))
+            self._stop_tasks()
+            log_handler.close()
+            if spawner:
+                spawner.close()
+            self._loop.close()
+
+            flow: FlowController = get_service(FlowController)
+            if flow:
+                flow.log_metrics()
+
+            if self._show_gui:
+                self._output_queue.cancel_join_thread()
+
+            if profiler:
+                profiler.stop()
+
+
+class WorkerTaskProxy:
+    """
+    Stands for a `TaskRunner` running in a worker process, so that the scheduler can treat both the same way
+    """
+    _task: Task
+    _worker: WorkerProcess
+    _completion_callback: Optional[Callable]
+    _state_callback: Optional[Callable[[str], None]]
+    _exited: Optional[asyncio.Future]
+
+    def __init__(self, task: Task, worker: WorkerProcess):
+        self._task = task
+        self._worker = worker
+        self._completion_callback = None
+        self._state_callback = None
+        self._exited = None
+
+    @property
+    def name(self):
+        return self._task["name"]
+
+    @property
+    def worker(self) -> WorkerProcess:
+        return self._worker
+
+    async def start(self, completion_callback: Optional[Callable],
+                    state_callback: Optional[Callable[[str], None]] = None):
+        self._completion_callback = completion_callback
+        self._state_callback = state_callback
+        self._exited = asyncio.get_running_loop().create_future()
+        self._worker.connection.send(
+            WorkerCommandMessage(command=WorkerCommand.START, task=self.name, definition=dict(self._task)))
+
+        try:
+            await self._exited
+        except asyncio.CancelledError:
+            pass
+
+    def stop(self, timeout=1):
+        try:
+            self._worker.connection.send(WorkerCommandMessage(command=WorkerCommand.STOP, task=self.name))
+        except OSError:
+            pass
+
+    def on_ready(self):
+        if self._completion_callback:
+            self._completion_callback()
+            self._completion_callback = None
+
+    def on_state(self, state: str):
+        if self._state_callback:
+            self._state_callback(state)
+
+    def on_exit(self):
+        if self._exited and not self._exited.done():
+            self._exited.set_result(None)
+
+
+class WorkerPool:
+    """
+    Spreads the tasks over a fixed set of worker processes, assigning each new task to the worker with the lowest
+    observed output rate
+    """
+    _workers: List[WorkerProcess]
+    _proxies: Dict[str, WorkerTaskProxy]
+    _task_rates: Dict[str, float]
+    _unwatch: List[Callable[[], None]]
+
+    def __init__(self, count: int, arguments: any, is_gui: bool, output_queue: Optional[multiprocessing.Queue],
+                 agents: Optional[Dict[str, AgentConfiguration]], output_ledger: Optional[OutputLedger],
+                 console_lock: Optional[multiprocessing.Lock] = None):
+        self._workers = [WorkerProcess(i, arguments, is_gui, output_queue, agents, output_ledger, console_lock)
+                         for i in range(max(1, count))]
+        self._proxies = {}
+        self._task_rates = {}
+        self._unwatch = []
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+            worker.close_worker_end()
+
+        logger.debug(f"Started {len(self._workers)} worker processes")
+
+    def watch(self, loop: asyncio.AbstractEventLoop):
+        for worker in self._workers:
+            self._unwatch.append(watch_connection(loop, worker.connection, self._event_callback(worker)))
+
+    def _event_callback(self, worker: WorkerProcess):
+        def on_event():
+            try:
+                e: WorkerEventMessage = worker.connection.recv()
+            except (EOFError, OSError):
+                logger.debug(f"Worker {worker.index} terminated")
+                worker.connection.close()
+                for proxy in [p for p in self._proxies.values() if p.worker is worker]:
+                    proxy.on_exit()
+                return
+
+            proxy = self._proxies.get(e.task)
+            if e.event == WorkerEvent.READY and proxy:
+                proxy.on_ready()
+            elif e.event == WorkerEvent.STATE and proxy:
+                proxy.on_state(e.state)
+            elif e.event == WorkerEvent.EXITED and proxy:
+                if proxy.worker is worker:
+                    del self._proxies[e.task]
+                proxy.on_exit()
+            elif e.event == WorkerEvent.OUTPUT_VOLUME:
+                self._update_rates(e.volume)
+            elif e.event == WorkerEvent.USAGE:
+                recorder: Optional[UsageRecorder] = get_service(UsageRecorder)
+                if recorder:
+                    for task, usage in e.usage.items():
+                        recorder.update(task, usage)
+            elif e.event == WorkerEvent.OUTPUT:
+                rings: Optional[OutputRings] = get_service(OutputRings)
+                if rings:
+                    for task, lines in e.output.items():
+                        rings.extend(task, lines)
+
+        return on_event
+
+    def _update_rates(self, volume: Dict[str, int]):
+        alpha = constants.WORKER_VOLUME_RATE_SMOOTHING
+        for task, n_bytes in volume.items():
+            rate = n_bytes / constants.WORKER_VOLUME_REPORT_INTERVAL
+            self._task_rates[task] = alpha * rate + (1 - alpha) * self._task_rates.get(task, rate)
+
+    def _worker_load(self, worker: WorkerProcess, default_rate: float) -> float:
+        return sum(self._task_rates.get(name, default_rate) for name, proxy in self._proxies.items()
+                   if proxy.worker is worker)
+
+    def _alive(self) -> List[WorkerProcess]:
+        return [w for w in self._workers if not w.connection.closed]
+
+    @property
+    def available(self) -> bool:
+        return bool(self._alive())
+
+    def create_runner(self, task: Task) -> WorkerTaskProxy:
+        alive = self._alive()
+        if not alive:
+            raise TaskRunException(f"Can't run task {task['name']}: all the worker processes terminated")
+
+        # Tasks never observed so far are assumed to be as chatty as the average one
+        default_rate = sum(self._task_rates.values()) / len(self._task_rates) if self._task_rates else 1.0
+
+        worker = min(alive, key=lambda w: (self._worker_load(w, default_rate),
+                                           sum(1 for p in self._proxies.values() if p.worker is w)))
+        logger.debug(f"Assigning task {task['name']} to worker {worker.index}")
+
+        proxy = WorkerTaskProxy(task, worker)
+        self._proxies[task["name"]] = proxy
+        return proxy
+
+    def shutdown(self, timeout: float = constants.WORKER_SHUTDOWN_TIMEOUT):
+        for unwatch in self._unwatch:
+            unwatch()
+
+        for worker in self._workers:
+            try:
+                worker.connection.send(WorkerCommandMessage(command=WorkerCommand.SHUTDOWN))
+            except OSError:
+                pass
+
+        for worker in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                logger.debug(f"Worker {worker.index} still alive after {timeout}s. Terminating it")
+                worker.terminate()
@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+# The GUI tests run without a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+@pytest.fixture(scope="session")
+def qt_app():
+    """
+    The application the widgets are created in, styled like jorun styles it
+    """
+    pytest.importorskip("PySide6")
+    from PySide6.QtWidgets import QApplication
+
+    from jorun.palette.darcula import DarculaColorPalette
+    from jorun.ui.theme import install_theme
+
+    app = QApplication.instance() or QApplication([])
+    install_theme(app, DarculaColorPalette())
+    return app
@@ -0,0 +1,72 @@
+import asyncio
+import json
+from typing import Dict, Optional, Tuple
+
+from jorun.api.ring import OutputRings
+from jorun.api.server import ApiServer
+from jorun.messaging.message import TaskCommand
+
+
+def create_server(token: Optional[str] = None) -> Tuple[ApiServer, list]:
+    commands = []
+    server = ApiServer(OutputRings(), lambda: [{"name": "web", "type": "shell"}],
+                       lambda task, command: commands.append((task, command)) or True, token=token)
+    return server, commands
+
+
+async def request(port: int, method: str, path: str, headers: Dict[str, str]) -> Tuple[int, dict]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    head = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: 0\r\n{head}\r\n".encode("latin-1"))
+    response = await reader.read()
+    writer.close()
+
+    status_line, _, rest = response.partition(b"\r\n")
+    body = rest.partition(b"\r\n\r\n")[2]
+    return int(status_line.split()[1]), json.loads(body) if body else None
+
+
+def run_requests(token: Optional[str], *requests) -> Tuple[list, list]:
+    async def scenario():
+        server, commands = create_server(token)
+        port = await server.start("127.0.0.1", 0)
+        try:
+            return [await request(port, *r) for r in requests], commands
+        finally:
+            server.close()
+
+    return asyncio.run(scenario())
+
+
+def test_command_needs_the_client_header():
+    (refused, accepted), commands = run_requests(None, ("POST", "/tasks/web/stop", {}),
+                                                 ("POST", "/tasks/web/stop", {"X-Jorun-Api": "1"}))
+
+    assert refused[0] == 403
+    assert accepted[0] == 202
+    assert commands == [("web", TaskCommand.STOP)]
+
+
+def test_foreign_origin_is_refused():
+    (foreign, local), _ = run_requests(None,
+                                       ("GET", "/tasks", {"Origin": "https://evil.example"}),
+                                       ("GET", "/tasks", {"Origin": "http://localhost:3000"}))
+
+    assert foreign[0] == 403
+    assert local == (200, [{"name": "web", "type": "shell"}])
+
+
+def test_websocket_upgrade_needs_the_client_header():
+    (refused,), _ = run_requests(None, ("GET", "/tasks/web/output", {"Upgrade": "websocket",
+                                                                     "Sec-WebSocket-Key": "dGhlIHNhbXBsZQ=="}))
+    assert refused[0] == 403
+
+
+def test_token():
+    results, _ = run_requests("secret",
+                              ("GET", "/tasks", {}),
+                              ("GET", "/tasks", {"Authorization": "Bearer wrong"}),
+                              ("GET", "/tasks", {"Authorization": "Bearer secret"}),
+                              ("GET", "/tasks?token=secret", {}))
+
+    assert [status for status, _ in results] == [401, 401, 200, 200]
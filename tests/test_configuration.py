@@ -0,0 +1,149 @@
+import textwrap
+
+import pytest
+
+from jorun.configuration import load_config, expand_shards, parse_dependency, select_tasks
+from jorun.errors import TaskBuildException
+
+
+def write_config(tmp_path, content: str) -> str:
+    path = tmp_path / "config.yml"
+    path.write_text(textwrap.dedent(content))
+    return str(path)
+
+
+def test_shards_are_named_after_their_index(tmp_path):
+    config = load_config(write_config(tmp_path, """
+        tasks:
+          test:
+            type: shell
+            shards: 2
+            shell:
+              command: run $shard_index/${shard_total}
+          report:
+            type: shell
+            depends: [test]
+            shell:
+              command: report
+    """))
+
+    assert list(config["tasks"]) == ["test_0", "test_1", "report"]
+    assert config["tasks"]["test_1"]["shell"]["command"] == "run 1/2"
+    assert config["tasks"]["test_1"]["shell"]["environment"] == {"JORUN_SHARD_INDEX": "1", "JORUN_SHARD_TOTAL": "2"}
+    assert [d["task"] for d in config["tasks"]["report"]["depends"]] == ["test_0", "test_1"]
+
+
+def test_only_the_shard_variables_are_substituted():
+    shards = expand_shards({"name": "t", "type": "shell", "depends": [], "matrix": {"python": ["3.11"]},
+                            "shell": {"command": "echo $$ $HOME ${python} $python_x $$python"}})
+
+    assert shards[0]["shell"]["command"] == "echo $$ $HOME 3.11 $python_x $$python"
+    assert shards[0]["shell"]["environment"]["JORUN_MATRIX_PYTHON"] == "3.11"
+
+
+def test_matrix_combinations():
+    shards = expand_shards({"name": "t", "type": "shell", "depends": [],
+                            "matrix": {"os": ["a", "b"], "v": [1, 2, 3]}, "shell": {"command": "$os-$v"}})
+
+    assert [s["shell"]["command"] for s in shards] == ["a-1", "a-2", "a-3", "b-1", "b-2", "b-3"]
+    assert [s["shard_index"] for s in shards] == list(range(6))
+
+
+@pytest.mark.parametrize("options", ["shards: 0", "shards: -1", "shards: many", "matrix: {}",
+                                     "matrix: {os: []}", "shards: 2\n    matrix: {os: [a]}"])
+def test_invalid_shards(tmp_path, options):
+    with pytest.raises(TaskBuildException):
+        load_config(write_config(tmp_path, f"""
+tasks:
+  test:
+    type: shell
+    {options}
+    shell:
+      command: "true"
+"""))
+
+
+@pytest.mark.parametrize("order", [("test", "test_0"), ("test_0", "test")])
+def test_shard_name_collision(tmp_path, order):
+    tasks = {"test": "    shards: 2\n", "test_0": ""}
+    content = "tasks:\n" + "".join(f"  {name}:\n    type: shell\n{tasks[name]}    shell:\n      command: 'true'\n"
+                                   for name in order)
+
+    with pytest.raises(TaskBuildException, match="test_0"):
+        load_config(write_config(tmp_path, content))
+
+
+def test_dependency_conditions():
+    assert parse_dependency("b", "a") == {"task": "a", "when": "ready"}
+    assert parse_dependency("b", {"task": "a", "when": "succeeded"}) == {"task": "a", "when": "succeeded"}
+    assert parse_dependency("b", {"task": "a"}) == {"task": "a", "when": "ready"}
+
+
+@pytest.mark.parametrize("dependency", [{"when": "started"}, {"task": None}, ["a"], 1])
+def test_dependency_without_task(dependency):
+    with pytest.raises(TaskBuildException, match="'b'"):
+        parse_dependency("b", dependency)
+
+
+def test_dependency_with_unknown_condition():
+    with pytest.raises(TaskBuildException, match="sometimes"):
+        parse_dependency("b", {"task": "a", "when": "sometimes"})
+
+
+SELECTION_CONFIG = """
+    tasks:
+      db:
+        type: shell
+        shell: {command: db}
+      build:
+        type: shell
+        shell: {command: build}
+      test:
+        type: shell
+        shards: 2
+        depends: [build, db]
+        shell: {command: test}
+      docs:
+        type: shell
+        shell: {command: docs}
+    gui:
+      panes:
+        main: {tasks: [db, build, test_0, test_1]}
+        docs: {tasks: [docs]}
+"""
+
+
+def test_selected_tasks_keep_their_dependencies(tmp_path):
+    config = load_config(write_config(tmp_path, SELECTION_CONFIG))
+
+    selection, excluded = select_tasks(config, ["test"], ["db"])
+    assert list(selection["tasks"]) == ["build", "test_0", "test_1"]
+    assert excluded == ["db"]
+    # The panes without a selected task are left out
+    assert selection["gui"]["panes"] == {"main": {"tasks": ["build", "test_0", "test_1"]}}
+    assert list(config["tasks"]) == ["db", "build", "test_0", "test_1", "docs"]
+
+
+def test_selection(tmp_path):
+    config = load_config(write_config(tmp_path, SELECTION_CONFIG))
+
+    assert select_tasks(config, [], []) == (config, [])
+    assert list(select_tasks(config, ["test_1"], [])[0]["tasks"]) == ["db", "build", "test_1"]
+    assert list(select_tasks(config, [], ["test", "docs"])[0]["tasks"]) == ["db", "build"]
+
+    with pytest.raises(TaskBuildException):
+        select_tasks(config, ["nothing"], [])
+
+
+@pytest.mark.parametrize("rules", ["{rate_limit: 0}", "{rate_limit: -1}", "{burst: many}", "{burst: true}"])
+def test_invalid_output_rules(tmp_path, rules):
+    path = write_config(tmp_path, f"""
+        tasks:
+          t:
+            type: shell
+            output: {rules}
+            shell: {{command: run}}
+    """)
+
+    with pytest.raises(TaskBuildException):
+        load_config(path)
@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+import socket
+import socketserver
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from jorun import daemon
+from jorun.configuration import task_hash
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="the daemon listens on a Unix socket")
+
+
+def task(name: str, *depends, **options) -> dict:
+    return {"name": name, "type": "shell", "shell": {"command": name},
+            "depends": [{"task": d, "when": "ready"} for d in depends], **options}
+
+
+def test_persistent_tasks():
+    tasks = {t["name"]: t for t in [task("db"), task("cache"), task("api", "db", run_mode="indefinite"),
+                                     task("test", "api")]}
+
+    assert list(daemon.persistent_tasks(tasks)) == ["db", "api"]
+
+
+def test_socket_path_is_per_configuration(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+
+    assert daemon.socket_path("jorun.yml") == daemon.socket_path(str(tmp_path / "jorun.yml"))
+    assert daemon.socket_path("jorun.yml") != daemon.socket_path("other.yml")
+    assert daemon.socket_path("jorun.yml").startswith(str(tmp_path / "jorun"))
+
+
+class FakeDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Answers GET /tasks with the given tasks, like the API of a daemon
+    """
+    daemon_threads = True
+
+    def __init__(self, path: str, tasks: list):
+        self.tasks = tasks
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                body = json.dumps(self.tasks).encode()
+                handler.send_response(200)
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def address_string(handler):
+                return "unix"
+
+            def log_message(handler, *args):
+                pass
+
+        super(FakeDaemon, self).__init__(path, Handler)
+
+
+@pytest.fixture
+def runtime_dir(monkeypatch):
+    # Unix socket paths are short, unlike those of tmp_path
+    directory = tempfile.mkdtemp(prefix="jorun-")
+    monkeypatch.setenv("XDG_RUNTIME_DIR", directory)
+    os.makedirs(os.path.join(directory, "jorun"))
+    yield directory
+    shutil.rmtree(directory)
+
+
+def test_up_to_date_tasks_are_adopted(runtime_dir):
+    tasks = {t["name"]: t for t in [task("db"), task("api"), task("worker"), task("local")]}
+    changed = dict(tasks["api"], shell={"command": "changed"})
+    running = [{"name": "db", "hash": task_hash(tasks["db"]), "running": True, "states": {"ready": 1.0}},
+               {"name": "api", "hash": task_hash(changed), "running": True, "states": {"ready": 1.0}},
+               {"name": "worker", "hash": task_hash(tasks["worker"]), "running": False, "states": {"failed": 1.0}}]
+
+    server = FakeDaemon(daemon.socket_path("jorun.yml"), running)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        assert daemon.adopt_tasks("jorun.yml", tasks) == {"db": {"ready": 1.0}}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stale_socket_is_removed(runtime_dir):
+    path = daemon.socket_path("jorun.yml")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    assert daemon.DaemonClient(path).tasks() is None
+    assert not os.path.exists(path)
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+import stat
+import sys
+
+import pytest
+
+from jorun.handler.docker import DockerTaskHandler
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="the fake docker is a script run through its shebang")
+
+# Records its arguments, and answers `inspect` from the state of the fake container and its image
+FAKE_DOCKER = f"""\
+#!{sys.executable}
+import json, os, sys
+
+directory = os.path.dirname(os.path.abspath(__file__))
+with open(os.path.join(directory, "calls"), "a") as f:
+    f.write(json.dumps(sys.argv[1:]) + "\\n")
+
+state_path = os.path.join(directory, "state.json")
+state = json.load(open(state_path)) if os.path.exists(state_path) else None
+command = sys.argv[1:]
+
+if command[:2] == ["image", "inspect"]:
+    # The image is local once pulled by a run
+    if not os.path.exists(os.path.join(directory, "image")):
+        sys.exit(1)
+    print(open(os.path.join(directory, "image")).read())
+elif command[0] == "inspect":
+    if state is None:
+        sys.exit(1)
+    if command[2] == "{{{{.State.StartedAt}}}}":
+        print("restarted-at")
+    else:
+        print(("true" if state["running"] else "false"), "started-at", state["image"], state["hash"])
+elif command[0] == "run":
+    with open(os.path.join(directory, "image"), "w") as f:
+        f.write("sha256:image")
+elif command[0] == "logs":
+    print("output")
+"""
+
+
+@pytest.fixture
+def docker(tmp_path):
+    path = tmp_path / "docker"
+    path.write_text(FAKE_DOCKER)
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    (tmp_path / "image").write_text("sha256:image")
+    return tmp_path
+
+
+def set_container(directory, running: bool, container_hash: str, image: str = "sha256:image"):
+    (directory / "state.json").write_text(json.dumps({"running": running, "image": image, "hash": container_hash}))
+
+
+def calls(directory) -> list:
+    path = directory / "calls"
+    commands = [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+    if path.exists():
+        os.remove(path)
+    return commands
+
+
+def run_task(directory) -> list:
+    async def scenario():
+        process = await DockerTaskHandler().execute({"container_name": "web", "image": "nginx", "reuse": True,
+                                                     "docker_arguments": ["--rm", "-p", "80:80"],
+                                                     "docker_executable": str(directory / "docker")},
+                                                    lambda: None, True)
+        stdout, _ = await process.communicate()
+        assert stdout == b"output\n"
+
+    asyncio.run(scenario())
+    # Only the commands changing the container, and the one following its output
+    return [c for c in calls(directory) if "inspect" not in c[:2]]
+
+
+def created_hash(docker) -> str:
+    """
+    The configuration hash of the container created by the task, read back from its label
+    """
+    set_container(docker, False, "")
+    run = run_task(docker)[1]
+    return run[run.index("--label") + 1].split("=", 1)[1]
+
+
+def test_missing_container_is_created(docker):
+    run, logs = run_task(docker)
+
+    assert run[:4] == ["run", "--detach", "--name", "web"]
+    # A reused container outlives the task
+    assert "--rm" not in run
+    assert run[-3:] == ["-p", "80:80", "nginx"]
+    assert logs == ["logs", "--follow", "web"]
+
+
+def test_running_container_is_attached_to(docker):
+    set_container(docker, True, created_hash(docker))
+
+    assert run_task(docker) == [["logs", "--follow", "--since", "started-at", "web"]]
+
+
+def test_stopped_container_is_started(docker):
+    set_container(docker, False, created_hash(docker))
+
+    assert run_task(docker) == [["start", "web"], ["logs", "--follow", "--since", "restarted-at", "web"]]
+
+
+def test_changed_container_is_replaced(docker):
+    set_container(docker, True, "outdated")
+
+    remove, run, logs = run_task(docker)
+    assert remove == ["rm", "--force", "web"]
+    assert run[:2] == ["run", "--detach"]
+    assert logs == ["logs", "--follow", "web"]
+
+
+def test_changed_image_replaces_the_container(docker):
+    set_container(docker, True, created_hash(docker), image="sha256:previous")
+
+    remove, run, _ = run_task(docker)
+    assert remove == ["rm", "--force", "web"]
+    assert run[:2] == ["run", "--detach"]
+
+
+def test_container_of_a_pulled_image_is_reused(docker):
+    os.remove(docker / "image")
+    configuration_hash = created_hash(docker)
+
+    # The first run pulled the image, the container created from it is kept
+    set_container(docker, True, configuration_hash)
+    assert run_task(docker) == [["logs", "--follow", "--since", "started-at", "web"]]
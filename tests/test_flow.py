@@ -0,0 +1,101 @@
+import logging
+import queue
+from argparse import Namespace
+
+from jorun.flow import OutputLedger, FlowController, FlowControlledQueueHandler, OverflowPolicy
+
+
+def create_handler(policy: str = "block", task_budget: str = "10", budget: str = "1m"):
+    ledger = OutputLedger(4)
+    flow = FlowController(ledger, Namespace(output_budget=budget, task_output_budget=task_budget,
+                                            overflow_policy=policy))
+    output = queue.Queue()
+    return ledger, flow, FlowControlledQueueHandler(output, flow), output
+
+
+def record(task: str, line: str) -> logging.LogRecord:
+    r = logging.LogRecord(task, logging.INFO, __file__, 0, line, None, None)
+    r.subprocess = task
+    return r
+
+
+def drain(output: queue.Queue) -> list:
+    records = []
+    while not output.empty():
+        records.append(output.get())
+    return records
+
+
+def test_tasks_have_their_own_budget():
+    ledger, flow, handler, output = create_handler()
+    flow.configure_task("a", None, 0)
+    flow.configure_task("b", None, 1)
+
+    handler.emit(record("a", "x" * 20))
+
+    assert flow.over_budget("a")
+    assert not flow.over_budget("b")
+
+
+def test_encoded_bytes_are_counted_and_reported_back():
+    ledger, flow, handler, output = create_handler()
+    flow.configure_task("a", None, 2)
+
+    handler.emit(record("a", "é€\n"))
+    r, = drain(output)
+
+    assert (r.flow_slot, r.flow_size) == (2, 6)
+    assert ledger.in_flight(2) == 6
+
+    ledger.consumed(r.flow_slot, r.flow_size)
+    assert ledger.in_flight(2) == 0
+    assert ledger.total_in_flight() == 0
+
+
+def test_drop_oldest_keeps_the_latest_lines():
+    ledger, flow, handler, output = create_handler("drop-oldest", task_budget="4")
+    flow.configure_task("a", None, 0)
+
+    for i in range(10):
+        handler.emit(record("a", f"{i}\n"))
+    assert [r.msg for r in drain(output)] == ["0\n", "1\n", "2\n"]
+
+    ledger.consumed(0, ledger.in_flight(0))
+    handler.flush_backlog()
+
+    assert [r.msg for r in drain(output)] == ["[jorun] 5 lines dropped\n"]
+
+    ledger.consumed(0, ledger.in_flight(0))
+    handler.flush_backlog()
+    assert [r.msg for r in drain(output)] == ["8\n", "9\n"]
+
+
+def test_sample_keeps_one_line_out_of_ten():
+    ledger, flow, handler, output = create_handler("sample", task_budget="1")
+    flow.configure_task("a", None, 0)
+    handler.emit(record("a", "first\n"))
+
+    for i in range(1, 30):
+        handler.emit(record("a", f"{i}\n"))
+
+    assert [r.msg for r in drain(output)] == ["first\n", "10\n", "20\n"]
+
+
+def test_task_override():
+    ledger, flow, handler, output = create_handler()
+    flow.configure_task("a", {"policy": "sample", "budget": "1k"}, 0)
+
+    assert flow.policy("a") == OverflowPolicy.SAMPLE
+    assert flow.task_budget("a") == 1024
+
+
+def test_sample_stays_within_the_global_budget():
+    ledger, flow, handler, output = create_handler("sample", task_budget="1", budget="16")
+    flow.configure_task("a", None, 0)
+
+    for i in range(1000):
+        handler.emit(record("a", f"line {i}\n"))
+
+    # The budget is exceeded by one line at most, the GUI never consuming anything
+    assert 16 < ledger.total_in_flight() <= 16 + len("line 999\n")
+    assert [r.msg for r in drain(output)] == ["line 0\n", "line 10\n", "line 20\n"]
@@ -0,0 +1,54 @@
+import io
+import logging
+
+from jorun.grouped import GroupedOutputHandler, TaskOutputBuffer
+
+
+def record(task, message: str) -> logging.LogRecord:
+    r = logging.LogRecord("jorun", logging.INFO, __file__, 0, message, None, None)
+    if task:
+        r.subprocess = task
+    return r
+
+
+def test_buffer_spills():
+    buffer = TaskOutputBuffer(10)
+    buffer.write("12345\n")
+    buffer.write("67890\n")
+    buffer.write("end\n")
+    assert buffer._spill is not None
+
+    stream = io.StringIO()
+    buffer.copy_to(stream)
+    assert stream.getvalue() == "12345\n67890\nend\n"
+
+
+def test_tasks_printed_when_completed():
+    stream = io.StringIO()
+    handler = GroupedOutputHandler(stream, 1024, follow=["server"])
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    handler.emit(record("a", "a1\n"))
+    handler.emit(record("b", "b1\n"))
+    handler.emit(record("server", "listening\n"))
+    handler.emit(record(None, "jorun message"))
+    handler.emit(record("a", "a2\n"))
+    assert stream.getvalue() == "[server]: listening\njorun message\n"
+
+    handler.task_state("b", "completed")
+    handler.task_state("a", "completed")
+    assert stream.getvalue() == "[server]: listening\njorun message\n[b]: b1\n[a]: a1\n[a]: a2\n"
+
+
+def test_unfinished_tasks_printed_on_close():
+    stream = io.StringIO()
+    handler = GroupedOutputHandler(stream, 4)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    handler.emit(record("slow", "still going\n"))
+    handler.emit(record("broken", "error\n"))
+    handler.task_state("broken", "failed")
+    handler.close()
+
+    # The failed tasks first
+    assert stream.getvalue() == "[broken]: error\n[slow]: still going\n"
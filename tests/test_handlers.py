@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import pytest
+from tinyioc import register_instance, unregister_service
+
+from jorun.configuration import AppConfiguration
+from jorun.errors import TaskBuildException
+from jorun.handler import registry
+from jorun.handler.registry import load_handler, handler_exists
+from jorun.handler.shell import ShellTaskHandler
+from jorun.runner import TaskRunner
+
+
+class RecordingHandler(ShellTaskHandler):
+    """
+    Runs shell commands, recording the hooks it goes through
+    """
+    hooks = []
+
+    @property
+    def task_type(self) -> str:
+        return "recorded"
+
+    async def prepare(self, options):
+        self.hooks.append("prepare")
+
+    async def ready(self, options, process):
+        self.hooks.append("ready")
+
+    async def stop(self, options, process):
+        self.hooks.append("stop")
+        raise RuntimeError("stop hook failure")
+
+    async def cleanup(self, options, process):
+        self.hooks.append("cleanup")
+
+
+class OtherTypeHandler(RecordingHandler):
+    @property
+    def task_type(self) -> str:
+        return "other"
+
+
+def entry_point(loaded) -> SimpleNamespace:
+    def load():
+        if isinstance(loaded, Exception):
+            raise loaded
+        return loaded
+
+    return SimpleNamespace(value="plugin:Handler", load=load)
+
+
+@pytest.fixture
+def entry_points(monkeypatch):
+    declared = {"recorded": entry_point(RecordingHandler), "broken": entry_point(ImportError("no module")),
+                "invalid": entry_point(object), "mismatch": entry_point(OtherTypeHandler)}
+    monkeypatch.setattr(registry, "_entry_points", lambda: declared)
+
+
+def test_builtin_handlers():
+    assert handler_exists("shell") and handler_exists("group")
+    assert not handler_exists("nothing")
+    assert isinstance(load_handler("shell"), ShellTaskHandler)
+
+    with pytest.raises(TaskBuildException):
+        load_handler("nothing")
+
+
+def test_declared_handlers(entry_points):
+    assert handler_exists("recorded")
+    assert isinstance(load_handler("recorded"), RecordingHandler)
+
+
+@pytest.mark.parametrize("task_type", ["broken", "invalid", "mismatch"])
+def test_invalid_declared_handlers(entry_points, task_type):
+    with pytest.raises(TaskBuildException):
+        load_handler(task_type)
+
+
+@pytest.fixture
+def recorded():
+    RecordingHandler.hooks = []
+    register_instance(AppConfiguration([RecordingHandler()]))
+    yield RecordingHandler.hooks
+    unregister_service(AppConfiguration)
+
+
+def runner(command: str, **options) -> TaskRunner:
+    task = {"name": "t", "type": "recorded", "flow_slot": 0, "recorded": {"command": command}, **options}
+    return TaskRunner(task, None, logging.INFO, logging.NullHandler())
+
+
+def test_hooks_of_a_completed_task(recorded):
+    states = []
+    asyncio.run(runner("true").start(None, states.append))
+
+    assert states == ["started", "completed", "succeeded"]
+    assert sorted(recorded) == ["cleanup", "prepare", "ready"]
+    assert recorded[0] == "prepare"
+
+
+def test_hooks_of_a_stopped_task(recorded):
+    async def run():
+        task = runner("sleep 30", run_mode="indefinite")
+        started = asyncio.ensure_future(task.start(None))
+        while "ready" not in recorded:
+            await asyncio.sleep(0.01)
+
+        # A failing hook doesn't keep the task from stopping
+        await task.stop(timeout=1)
+        await started
+
+    asyncio.run(asyncio.wait_for(run(), 10))
+    assert recorded == ["prepare", "ready", "stop", "cleanup"]
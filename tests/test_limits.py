@@ -0,0 +1,61 @@
+import subprocess
+import sys
+
+import pytest
+
+from jorun import limits
+from jorun.errors import TaskBuildException
+from jorun.limits import parse_size, parse_cpu_list, ProcessLimits
+
+
+@pytest.mark.parametrize("value,size", [(512, 512), ("512", 512), ("64k", 64 * 1024), ("512m", 512 * 1024 ** 2),
+                                        ("2G", 2 * 1024 ** 3), ("1.5g", int(1.5 * 1024 ** 3)), ("8MiB", 8 * 1024 ** 2),
+                                        ("10b", 10)])
+def test_parse_size(value, size):
+    assert parse_size(value) == size
+
+
+@pytest.mark.parametrize("value", ["", "m", "12x", "lots", "inf", "1e400", "nan", "-1m", "0", 0, -512, True])
+def test_invalid_size(value):
+    with pytest.raises(TaskBuildException):
+        parse_size(value)
+
+
+def test_parse_cpu_list():
+    assert parse_cpu_list("0-3,6") == [0, 1, 2, 3, 6]
+    assert parse_cpu_list("1, 2,") == [1, 2]
+    assert parse_cpu_list([3, "4"]) == [3, 4]
+
+
+def test_cpu_affinity(monkeypatch):
+    monkeypatch.setattr(limits, "_available_cpus", lambda: [0, 1, 2, 3])
+
+    assert ProcessLimits("t", {"cpu_affinity": "1-2,7"}).cpu_affinity == [1, 2]
+    assert ProcessLimits("t", {"cpu_affinity": [9]}).cpu_affinity is None
+    # Shards are spread over the cores by their index
+    assert [ProcessLimits("t", {"cpu_affinity": "auto"}, slot).cpu_affinity for slot in range(5)] == \
+           [[0], [1], [2], [3], [0]]
+
+
+def test_invalid_ionice_class():
+    with pytest.raises(TaskBuildException):
+        ProcessLimits("t", {"ionice": "fast"})
+
+
+def test_docker_arguments(monkeypatch):
+    monkeypatch.setattr(limits, "_available_cpus", lambda: [0, 1, 2, 3])
+
+    assert ProcessLimits("t", {"cpus": 1.5, "memory": "1g", "cpu_affinity": "0,2"}).docker_arguments() == \
+           ["--cpus", "1.5", "--memory", str(1024 ** 3), "--cpuset-cpus", "0,2"]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="rlimits are POSIX only")
+def test_limits_are_applied_in_the_child():
+    preexec = ProcessLimits("t", {"open_files": 64, "nice": 3}).preexec_fn()
+    output = subprocess.check_output([sys.executable, "-c", "import os, resource; "
+                                      "print(resource.getrlimit(resource.RLIMIT_NOFILE)[0], os.nice(0))"],
+                                     preexec_fn=preexec)
+
+    limit, niceness = output.split()
+    assert int(limit) == 64
+    assert int(niceness) >= 3
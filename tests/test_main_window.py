@@ -0,0 +1,30 @@
+import logging
+
+from jorun.ui.main_window import MainWindow, OTHER_TASKS_PANE
+
+
+def record(task: str, line: str) -> logging.LogRecord:
+    r = logging.LogRecord(task, logging.INFO, __file__, 0, line, None, None)
+    r.subprocess = task
+    r.message = line
+    return r
+
+
+def test_records_are_displayed_once_per_frame_and_task(qt_app):
+    window = MainWindow(["a", "b"], None)
+    pane = window._panes[OTHER_TASKS_PANE]
+    dispatched = []
+    pane.dispatch_output = lambda task, text: dispatched.append((task, text))
+
+    for line in ("a1\n", "a2\n"):
+        window.dispatch_stream_record(record("a", line))
+    window.dispatch_stream_record(record("b", "b1\n"))
+    window.dispatch_stream_record(record("a", "a3\n"))
+
+    # Nothing is displayed before the next frame
+    assert dispatched == []
+
+    window._flush_stream_records()
+    assert dispatched == [("a", "a1\na2\na3\n"), ("b", "b1\n")]
+    assert not window._pending_records
+
@@ -0,0 +1,67 @@
+import re
+
+import pytest
+
+from jorun.matcher import PatternMatcher, required_literal
+
+
+@pytest.mark.parametrize("pattern,literal", [
+    ("Server started", "Server started"),
+    (r"listening on port \d+", "listening on port "),
+    (r"a\.b\\c", "a.b\\c"),
+    ("ready\n", "ready\n"),
+    # Alternation
+    ("ready|started", None),
+    ("x(ready|started)yz", "yz"),
+    # Optional atoms and groups
+    ("colou?r", "colo"),
+    ("abc(def)?gh", "abc"),
+    ("ab*cd", "cd"),
+    ("ab{0,2}cd", "cd"),
+    ("ab{2}cd", "ab"),
+    ("abc+?d", "abc"),
+    ("a{x}", "a{x}"),
+    # Character classes
+    ("[abc]def", "def"),
+    ("[]x]yz", "yz"),
+    ("[^]a-z]+done", "done"),
+    (r"[\]]ok", "ok"),
+    (r"\w+ started", " started"),
+    # Case-insensitive and verbose flags
+    ("(?i)ready", None),
+    ("(?x)ready", None),
+    ("(?i:ready) now", " now"),
+    # Escapes that aren't literals
+    (r"(a)\1", None),
+    (r"\x41BC", None),
+    (".*", None),
+    ("", None),
+])
+def test_required_literal(pattern, literal):
+    assert required_literal(pattern) == literal
+
+
+@pytest.mark.parametrize("pattern", ["colou?r", "x(ready|started)yz", "ab{0,2}cd", "[^]a-z]+done", r"\w+ started"])
+def test_required_literal_is_in_every_match(pattern):
+    regex = re.compile(pattern)
+    for text in ["color", "colour", "xreadyyz", "xstartedyz", "acd", "abbcd", "]]done", "é started"]:
+        if regex.search(text):
+            assert required_literal(pattern) in text
+
+
+def test_unicode_semantics():
+    assert PatternMatcher(r"^\w+$").match_line("héllo".encode())
+    assert PatternMatcher(r"a.b").match_line("aéb".encode())
+    assert PatternMatcher(r"ready in \d+s", search=True).scan("ready in ١٢s\n".encode())
+
+
+def test_scan_finds_the_matching_line():
+    matcher = PatternMatcher(r"port (\d+)$", search=True)
+    assert matcher.literal == b"port "
+
+    assert matcher.scan(b"the port is\nlistening on port 80\n")
+    assert not matcher.scan(b"port 80 is busy\nlistening on port\n")
+
+
+def test_invalid_bytes_dont_make_up_a_literal():
+    assert not PatternMatcher("abc", search=True).match_line(b"ab\xffc")
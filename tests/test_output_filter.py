@@ -0,0 +1,45 @@
+from jorun import output_filter
+from jorun.output_filter import OutputFilter
+
+
+def test_include_and_exclude():
+    f = OutputFilter({"include": ["error", "warn"], "exclude": "ignored"})
+
+    assert f.apply(b"info: a\nerror: b\nwarn: ignored c\nwarning: d\npartial error") == \
+           ["error: b\n", "warning: d\n", "partial error"]
+
+
+def test_no_line_can_match_the_include_patterns():
+    assert OutputFilter({"include": "error"}).apply(b"a\nb\n") == []
+
+
+def test_repeats_are_collapsed():
+    f = OutputFilter({"collapse_repeats": True})
+
+    assert f.apply(b"same\nsame\nsame\nother\n") == ["same\n", "[jorun] last line repeated 2 times\n", "other\n"]
+    assert f.apply(b"other\n") == []
+    assert f.flush() == ["[jorun] last line repeated 1 times\n"]
+
+
+def test_rate_limit(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(output_filter.time, "monotonic", lambda: now[0])
+    f = OutputFilter({"rate_limit": 2, "burst": 3})
+
+    assert f.apply(b"1\n2\n3\n4\n5\n") == ["1\n", "2\n", "3\n"]
+
+    # One second later, two more lines are let through, after the count of the suppressed ones
+    now[0] += 1
+    assert f.apply(b"6\n7\n8\n") == ["[jorun] 2 lines suppressed by the rate limit\n", "6\n", "7\n"]
+    assert f.flush() == ["[jorun] 1 lines suppressed by the rate limit\n"]
+
+
+def test_fractional_rate_limit(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(output_filter.time, "monotonic", lambda: now[0])
+    f = OutputFilter({"rate_limit": 0.5})
+
+    assert f.apply(b"1\n2\n") == ["1\n"]
+
+    now[0] += 2
+    assert f.apply(b"3\n") == ["[jorun] 1 lines suppressed by the rate limit\n", "3\n"]
@@ -0,0 +1,65 @@
+from jorun import constants
+from jorun.messaging.message import TaskStatusMessage, TaskStatus
+from jorun.ui.pane import TasksPane
+from jorun.ui.task_panel import TaskPanel
+
+
+def test_panels_are_built_when_the_pane_is_first_shown(qt_app):
+    pane = TasksPane(None, ["a", "b"], columns=1)
+    pane.dispatch_output("a", "one\n")
+    pane.dispatch_output("a", "two\n")
+    pane.dispatch_task_status(TaskStatusMessage(task="b", status=TaskStatus.STARTED))
+    pane.dispatch_task_status(TaskStatusMessage(task="other", status=TaskStatus.STARTED))
+
+    assert pane._task_widgets == {}
+
+    pane.show()
+    try:
+        assert set(pane._task_widgets) == {"a", "b"}
+        assert pane._task_widgets["a"]._output_stream == "one\ntwo\n"
+        assert pane._task_widgets["b"]._current_status == TaskStatus.STARTED
+    finally:
+        pane.close()
+
+
+def test_hidden_panel_renders_when_shown(qt_app):
+    panel = TaskPanel(None, "a")
+    panel.append_output("\x1b[32mgreen\x1b[0m line\n")
+
+    assert panel._output_stale
+    assert panel._output_stream_edit_text.toPlainText() == ""
+
+    panel.show()
+    try:
+        assert not panel._output_stale
+        assert panel._output_stream_edit_text.toPlainText() == "green line\n"
+
+        panel.append_output("visible\n")
+        assert panel._output_stream_edit_text.toPlainText() == "green line\nvisible\n"
+    finally:
+        panel.close()
+
+
+def test_filter(qt_app):
+    panel = TaskPanel(None, "a")
+    panel.show()
+    try:
+        panel.append_output("error: a\ninfo: b\nerror: c\n")
+        panel._filter_edit_text.setText("error")
+
+        assert panel._output_stream_edit_text.toPlainText() == "error: a\nerror: c\n"
+    finally:
+        panel.close()
+
+
+def test_hidden_pane_keeps_the_latest_lines(qt_app, monkeypatch):
+    monkeypatch.setattr(constants, "PANE_PENDING_LINES", 3)
+    pane = TasksPane(None, ["a"], columns=1)
+    for i in range(10):
+        pane.dispatch_output("a", f"{i}\n")
+
+    pane.show()
+    try:
+        assert pane._task_widgets["a"]._output_stream == "7\n8\n9\n"
+    finally:
+        pane.close()
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from jorun import constants
+from jorun.plan import TaskGraph, find_cycles, runnable_order, critical_path, redundant_edges, simulate, \
+    level_widths, load_durations
+
+
+def graph(tasks: dict, durations: dict = None, **options) -> TaskGraph:
+    """
+    `tasks` maps the task names to their dependencies, as names or (name, condition) pairs
+    """
+    config = {name: {"name": name, "type": "shell",
+                     "depends": [{"task": d, "when": "ready"} if isinstance(d, str) else {"task": d[0], "when": d[1]}
+                                 for d in depends],
+                     **options.get(name, {})}
+              for name, depends in tasks.items()}
+    return TaskGraph(config, {name: (durations or {}).get(name, 1.0) for name in tasks})
+
+
+def names(g: TaskGraph, nodes) -> list:
+    return [g.names[n] for n in nodes]
+
+
+def test_cycles():
+    g = graph({"a": ["b"], "b": ["a"], "c": ["c"], "d": ["a"], "e": []})
+
+    assert sorted(sorted(c) for c in find_cycles(g)) == [["a", "b"], ["c"]]
+
+
+def test_blocked_tasks():
+    g = graph({"a": ["b"], "b": ["a"], "after_cycle": ["a"], "missing": ["nothing"], "after_missing": ["missing"],
+               "service": [], "never": [("service", "completed")], "ok": [("service", "started")]},
+              service={"run_mode": "indefinite"})
+
+    order, blocked = runnable_order(g)
+    assert sorted(names(g, order)) == ["ok", "service"]
+    assert sorted(names(g, blocked)) == ["a", "after_cycle", "after_missing", "b", "missing", "never"]
+    assert g.unknown == [("missing", "nothing")]
+    assert g.never_satisfied == [("never", "service", "completed")]
+
+
+def test_critical_path():
+    g = graph({"build": [], "test": ["build"], "lint": [], "watch": [("build", "started")]},
+              {"build": 2, "test": 3, "lint": 4, "watch": 1})
+    order, _ = runnable_order(g)
+
+    path, length = critical_path(g, order)
+    assert names(g, path) == ["build", "test"]
+    assert length == 5
+
+
+def test_level_widths():
+    g = graph({"a": [], "b": [], "c": ["a"], "d": ["a", "b"], "e": ["d"]})
+    order, _ = runnable_order(g)
+
+    assert level_widths(g, order) == [2, 2, 1]
+
+
+@pytest.mark.parametrize("tasks,redundant", [
+    ({"a": [], "b": ["a"], "c": ["a", "b"]}, [("c", "a")]),
+    # b only starts once a is ready
+    ({"a": [], "b": ["a"], "c": [("b", "started"), "a"]}, [("c", "a")]),
+    # The start of b doesn't imply that a is ready
+    ({"a": [], "b": [("a", "started")], "c": ["b", "a"]}, []),
+    ({"a": [], "b": ["a"], "c": ["b", ("a", "started")]}, [("c", "a")]),
+    ({"a": [], "b": ["a", ("a", "started")]}, [("b", "a")]),
+    ({"a": [], "b": ["a"], "c": ["b"], "d": ["c", "a"]}, [("d", "a")]),
+])
+def test_redundant_edges(tasks, redundant):
+    g = graph(tasks)
+    order, _ = runnable_order(g)
+
+    assert redundant_edges(g, order) == redundant
+
+
+def test_simulation_slots():
+    g = graph({name: [] for name in "abcd"})
+    order, _ = runnable_order(g)
+
+    limited = simulate(g, order, 2, "fifo")
+    assert (limited.makespan, limited.utilisation, limited.peak) == (2.0, 1.0, 2)
+
+    unlimited = simulate(g, order, None, "fifo")
+    assert (unlimited.makespan, unlimited.peak) == (1.0, 4)
+
+
+@pytest.mark.parametrize("policy,makespan", [("critical-path", 4.0), ("shortest-first", 5.0),
+                                             ("longest-first", 6.0)])
+def test_simulation_policies(policy, makespan):
+    g = graph({"x": [], "y": ["x"], "z": [], "w": []}, {"x": 1, "y": 3, "z": 2, "w": 2})
+    order, _ = runnable_order(g)
+
+    assert simulate(g, order, 2, policy).makespan == makespan
+
+
+def test_started_dependencies_overlap():
+    g = graph({"server": [], "client": [("server", "started")]}, {"server": 5, "client": 2})
+    order, _ = runnable_order(g)
+
+    assert simulate(g, order, None, "fifo").makespan == 5.0
+
+
+def test_durations(tmp_path):
+    history = tmp_path / "timings.json"
+    history.write_text(json.dumps({"measured": [1, 3], "single": 4}))
+    tasks = {"measured": {"type": "shell", "estimate": 10}, "single": {"type": "shell"},
+             "estimated": {"type": "shell", "estimate": 7}, "group": {"type": "group"}, "unknown": {"type": "shell"}}
+
+    durations, missing = load_durations(tasks, str(history))
+    assert durations == {"measured": 2.0, "single": 4.0, "estimated": 7.0, "group": 0.0,
+                         "unknown": constants.PLAN_DEFAULT_ESTIMATE}
+    assert missing == ["unknown"]
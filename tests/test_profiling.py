@@ -0,0 +1,26 @@
+import pstats
+import threading
+from argparse import Namespace
+
+from jorun import profiling
+
+
+def busy_thread_function():
+    return sum(i * i for i in range(10000))
+
+
+def test_cpu_profile_includes_the_threads(tmp_path):
+    profiler = profiling.start_profiler(Namespace(profile="cpu", profile_dir=str(tmp_path)), "test")
+    try:
+        thread = threading.Thread(target=busy_thread_function)
+        thread.start()
+        thread.join()
+    finally:
+        profiler.stop()
+        profiling._profiler = None
+
+    path, = tmp_path.glob("jorun-test-*.pstats")
+    functions = {name for _, _, name in pstats.Stats(str(path)).stats}
+    assert "busy_thread_function" in functions
+    # Called from the thread starting the profile
+    assert "start" in functions
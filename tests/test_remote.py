@@ -0,0 +1,159 @@
+import asyncio
+import time
+
+import pytest
+
+from jorun.errors import TaskRunException
+from jorun.remote.agent import Agent
+from jorun.remote.client import AgentPool, AgentConnection
+
+TOKEN = "test-token"
+
+
+def shell_task(name: str, command: str, node) -> dict:
+    return {"name": name, "type": "shell", "shell": {"command": command}, "node": node}
+
+
+async def start_agents():
+    """
+    Two agents on ephemeral localhost ports: `a` runs one task at a time, `b` two and has the `gpu` label
+    """
+    servers = [await Agent("a", 1, ["linux"], TOKEN).start("127.0.0.1", 0),
+               await Agent("b", 2, ["linux", "gpu"], TOKEN).start("127.0.0.1", 0)]
+    addresses = [f"127.0.0.1:{s.sockets[0].getsockname()[1]}" for s in servers]
+    pool = AgentPool({"a": {"address": addresses[0], "token": TOKEN},
+                      "b": {"address": addresses[1], "token": TOKEN}})
+    return servers, addresses, pool
+
+
+async def close(servers):
+    for server in servers:
+        server.close()
+        await server.wait_closed()
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 30))
+
+
+def test_dispatch_by_name_and_label():
+    async def scenario():
+        servers, _, pool = await start_agents()
+        try:
+            by_name = await pool.execute(shell_task("t1", "echo one", "a"), True)
+            by_label = await pool.execute(shell_task("t2", "echo two", {"labels": ["gpu"]}), True)
+
+            assert by_name.agent == "a"
+            assert by_label.agent == "b"
+            assert await by_name.stdout.read() == b"one\n"
+            assert await by_label.stdout.read() == b"two\n"
+            assert await by_name.wait() == 0
+            assert await by_label.wait() == 0
+        finally:
+            await close(servers)
+
+    run(scenario())
+
+
+def test_no_matching_agent():
+    async def scenario():
+        servers, _, pool = await start_agents()
+        try:
+            with pytest.raises(TaskRunException):
+                await pool.execute(shell_task("t", "true", {"labels": ["windows"]}), True)
+        finally:
+            await close(servers)
+
+    run(scenario())
+
+
+def test_capacity_is_respected():
+    async def scenario():
+        servers, _, pool = await start_agents()
+        try:
+            async def timed(name: str):
+                process = await pool.execute(shell_task(name, "sleep 0.5", "a"), True)
+                started = time.monotonic()
+                await process.stdout.read()
+                await process.wait()
+                return started, time.monotonic()
+
+            (start_1, end_1), (start_2, end_2) = sorted(await asyncio.gather(timed("t1"), timed("t2")))
+            # Agent `a` runs a single task at a time
+            assert start_2 >= end_1 - 0.05
+        finally:
+            await close(servers)
+
+    run(scenario())
+
+
+def test_stop_is_propagated():
+    async def scenario():
+        servers, _, pool = await start_agents()
+        try:
+            process = await pool.execute(shell_task("t", "sleep 30", "b"), True)
+            started = time.monotonic()
+            process.terminate()
+            await process.stdout.read()
+            returncode = await process.wait()
+
+            assert returncode != 0
+            assert time.monotonic() - started < 10
+        finally:
+            await close(servers)
+
+    run(scenario())
+
+
+def test_output_is_multiplexed():
+    async def scenario():
+        servers, _, pool = await start_agents()
+        try:
+            processes = await asyncio.gather(*(
+                pool.execute(shell_task(f"t{i}", f"for i in $(seq 1 2000); do echo task{i}-$i; done; "
+                                                 f"echo err{i} >&2", "b"), False)
+                for i in range(2)))
+
+            for i, process in enumerate(processes):
+                stdout, stderr = await asyncio.gather(process.stdout.read(), process.stderr.read())
+                assert stdout.decode().splitlines() == [f"task{i}-{n}" for n in range(1, 2001)]
+                assert stderr == f"err{i}\n".encode()
+                assert await process.wait() == 0
+        finally:
+            await close(servers)
+
+    run(scenario())
+
+
+def test_wrong_token_is_refused():
+    async def scenario():
+        servers, addresses, _ = await start_agents()
+        try:
+            connection = AgentConnection("a", {"address": addresses[0], "token": "wrong"})
+            assert not await connection.ensure_connected()
+        finally:
+            await close(servers)
+
+    run(scenario())
+
+
+def test_waiting_task_fails_when_the_agent_disconnects():
+    async def scenario():
+        servers, _, pool = await start_agents()
+        try:
+            running = await pool.execute(shell_task("t1", "sleep 30", "a"), True)
+            waiting = asyncio.create_task(pool.execute(shell_task("t2", "true", "a"), True))
+            await asyncio.sleep(0.2)
+            assert not waiting.done()
+
+            pool._agents["a"]._writer.transport.abort()
+
+            with pytest.raises(TaskRunException):
+                await waiting
+            assert await running.wait() != 0
+            # Lets the agent stop the orphaned task
+            await asyncio.sleep(0.2)
+        finally:
+            await close(servers)
+
+    run(scenario())
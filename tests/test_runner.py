@@ -0,0 +1,89 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from jorun.runner import TaskRunner
+
+
+class TimeoutsStub:
+    """
+    The state `TaskRunner._enforce_timeouts` works on, recording what it does to the task
+    """
+    _enforce_timeouts = TaskRunner._enforce_timeouts
+
+    def __init__(self, ready: bool = False, **timeouts):
+        self.name = "t"
+        self._task = {"name": "t", **timeouts}
+        self._process = SimpleNamespace(returncode=None)
+        self._ready = ready
+        self.events = []
+
+    def _notify_state(self, state: str):
+        self.events.append(state)
+
+    def _fail(self, reason: str):
+        self.events.append(reason)
+
+    def stop(self):
+        self.events.append("stopped")
+
+
+def enforce(stub: TimeoutsStub) -> float:
+    start = time.monotonic()
+    asyncio.run(stub._enforce_timeouts())
+    return time.monotonic() - start
+
+
+def test_total_timeout_before_ready_timeout():
+    stub = TimeoutsStub(ready_timeout=5, timeout=0.1)
+
+    assert enforce(stub) < 1
+    assert stub.events == ["timed_out", "still running after 0.1s, stopping it", "stopped"]
+
+
+def test_ready_timeout():
+    stub = TimeoutsStub(ready_timeout=0.1, timeout=5)
+
+    assert enforce(stub) < 1
+    assert stub.events == ["timed_out", "was not ready after 0.1s, stopping it", "stopped"]
+
+
+def test_ready_task_runs_until_its_timeout():
+    stub = TimeoutsStub(ready=True, ready_timeout=0.1, timeout=0.3)
+
+    assert 0.25 < enforce(stub) < 1
+    assert stub.events == ["timed_out", "still running after 0.3s, stopping it", "stopped"]
+
+
+def test_exited_task_is_left_alone():
+    stub = TimeoutsStub(timeout=0.1)
+    stub._process.returncode = 0
+
+    enforce(stub)
+    assert stub.events == []
+
+
+class OutputStub:
+    """
+    The state `TaskRunner._output_fd` decides on
+    """
+    _output_fd = TaskRunner._output_fd
+
+    def __init__(self, stream, direct_output: bool = True, **task):
+        self._task = {"name": "t", "type": "shell", **task}
+        self._direct_output = direct_output
+        self._file_handler = SimpleNamespace(stream=stream) if stream else None
+
+
+def test_direct_output(tmp_path):
+    with open(tmp_path / "t.log", "w") as stream:
+        assert OutputStub(stream)._output_fd({"command": "true"}) == stream.fileno()
+
+        assert OutputStub(stream, direct_output=False)._output_fd({}) is None
+        assert OutputStub(None)._output_fd({}) is None
+        assert OutputStub(stream, type="group")._output_fd({}) is None
+        # The output is read when something needs it
+        assert OutputStub(stream, completion_pattern="ready")._output_fd({}) is None
+        assert OutputStub(stream, output=[{"pattern": "x", "action": "drop"}])._output_fd({}) is None
+        assert OutputStub(stream, node="remote")._output_fd({}) is None
+        assert OutputStub(stream)._output_fd({"tty": True}) is None
@@ -0,0 +1,163 @@
+import logging
+import queue
+from argparse import Namespace
+from types import SimpleNamespace
+
+import pytest
+from tinyioc import register_instance, unregister_service
+
+from jorun import constants
+from jorun.configuration import parse_dependency
+from jorun.logger import logger
+from jorun.runner_process import RunnerProcess
+from jorun.usage import UsageRecorder, TaskUsage
+
+
+def task(name: str, *depends, **options) -> dict:
+    return {"name": name, "type": "shell", "shell": {"command": "true"},
+            "depends": [parse_dependency(name, d) for d in depends], **options}
+
+
+def create_runner_process(tasks: list, **arguments) -> RunnerProcess:
+    """
+    A scheduler that is not started, to test its decisions on given task states
+    """
+    arguments = Namespace(**{"level": "INFO", "workers": 0, "output": "stream",
+                             "on_failure": constants.DEFAULT_FAILURE_POLICY, **arguments})
+    process = RunnerProcess({t["name"]: t for t in tasks}, arguments, False, None, None, None, None)
+    process._task_states = {}
+    process._missing_tasks = {t["name"]: t for t in tasks}
+    process._running_tasks = {}
+    process._reloading_tasks = set()
+    process._failing_fast = False
+    process._task_updates_queue = queue.Queue()
+    process._exit_when_done = True
+    process._exit_status = 0
+    return process
+
+
+def test_dependency_conditions():
+    process = create_runner_process([task("db"), task("web", "db")])
+    process._task_states = {"db": {"started": 1.0}}
+
+    assert process._dependency_met({"task": "db", "when": "started"})
+    assert not process._dependency_met({"task": "db", "when": "ready"})
+    assert not process._dependency_met({"task": "other", "when": "started"})
+
+    process._task_states["db"].update(ready=2.0, completed=3.0, failed=3.0)
+    assert process._dependency_met({"task": "db", "when": "completed"})
+    assert not process._dependency_met({"task": "db", "when": "succeeded"})
+
+
+def test_ignored_failure_satisfies_any_condition():
+    process = create_runner_process([task("lint", on_failure="ignore"), task("build", {"task": "lint",
+                                                                                       "when": "succeeded"})])
+    process._task_states = {"lint": {"started": 1.0, "failed": 2.0}}
+    assert not process._dependencies_met(process._config["build"])
+
+    process._task_states["lint"]["completed"] = 2.0
+    assert process._dependencies_met(process._config["build"])
+
+
+def test_reload_restarts_dependents():
+    tasks = [task("build"), task("test", "build"), task("report", "test"), task("lint"),
+             task("watch", {"task": "build", "when": "started"})]
+    process = create_runner_process(tasks)
+
+    assert process._tasks_to_restart({t["name"]: t for t in tasks}, ["build"]) == ["build", "test", "report"]
+    assert process._tasks_to_restart({t["name"]: t for t in tasks}, ["test", "lint"]) == ["test", "report", "lint"]
+
+
+def test_reload_keeps_dependents_of_services():
+    tasks = [task("db", run_mode="indefinite"), task("api", "db"), task("migrate", {"task": "db", "when": "ready"},
+                                                                          run_mode="indefinite")]
+    process = create_runner_process(tasks)
+
+    assert process._tasks_to_restart({t["name"]: t for t in tasks}, ["db"]) == ["db"]
+
+
+@pytest.fixture
+def usage():
+    recorder = UsageRecorder()
+    register_instance(recorder)
+    yield recorder
+    unregister_service(UsageRecorder)
+
+
+@pytest.fixture
+def messages():
+    records = []
+    handler = logging.Handler()
+    handler.emit = lambda record: records.append(record.getMessage())
+    logger.addHandler(handler)
+    yield records
+    logger.removeHandler(handler)
+
+
+def ended(returncode: int) -> TaskUsage:
+    return TaskUsage(started=1.0, ready=None, ended=2.0, returncode=returncode, cpu=0.0, peak_rss=0, direct=False)
+
+
+def test_failure_reported(usage, messages):
+    process = create_runner_process([task("build"), task("test", "build"), task("report", "test"), task("lint"),
+                                     task("deploy", {"task": "lint", "when": "succeeded"})])
+    process._task_states = {"build": {"started": 1.0, "failed": 2.0, "completed": 2.0},
+                            "lint": {"started": 1.0, "failed": 2.0, "timed_out": 2.0}}
+    process._missing_tasks = {name: process._config[name] for name in ("test", "report", "deploy")}
+    usage.update("build", ended(2))
+
+    process._report_outcome(interrupted=False)
+    assert process._exit_status == constants.EXIT_FAILURE
+    assert messages == ["Failed: build (exit code 2), lint (timed out)",
+                        "Skipped after a failure: test, report, deploy"]
+
+
+def test_ignored_failure_reported(usage, messages):
+    process = create_runner_process([task("lint", on_failure="ignore"), task("build", "lint")])
+    process._task_states = {"lint": {"started": 1.0, "failed": 2.0, "completed": 2.0}}
+    process._missing_tasks = {}
+
+    process._report_outcome(interrupted=False)
+    assert process._exit_status == 0
+    assert messages == ["Failed: lint (completion pattern not matched, ignored)"]
+
+
+def test_never_started(usage, messages):
+    process = create_runner_process([task("db", run_mode="indefinite"), task("migrate", {"task": "db",
+                                                                                         "when": "completed"})])
+    process._task_states = {"db": {"started": 1.0}}
+    process._missing_tasks = {"migrate": process._config["migrate"]}
+
+    process._report_outcome(interrupted=False)
+    assert messages == ["Never started: migrate"]
+    assert process._exit_status == constants.EXIT_FAILURE
+
+    process._exit_status = 0
+    process._exit_when_done = False
+    process._report_outcome(interrupted=False)
+    assert process._exit_status == 0
+
+    process._report_outcome(interrupted=True)
+    assert process._exit_status == constants.EXIT_INTERRUPTED
+
+
+def test_fail_fast():
+    process = create_runner_process([task("build", on_failure="fail-fast"), task("lint"), task("test", "lint")])
+    stopped = []
+    process._running_tasks = {"build": SimpleNamespace(stop=lambda: stopped.append("build")),
+                              "lint": SimpleNamespace(stop=lambda: stopped.append("lint"))}
+    process._missing_tasks = {"test": process._config["test"]}
+    process._run_task = lambda t: pytest.fail(f"{t['name']} started after the failure")
+
+    process._reach_state("lint", "ready", launch_deps=False)
+    process._reach_state("build", "failed", launch_deps=True)
+
+    assert stopped == ["build", "lint"]
+    assert process._task_updates_queue.qsize() == 2
+
+
+def test_failure_policy_default():
+    process = create_runner_process([task("build"), task("lint", on_failure="ignore")], on_failure="fail-fast")
+
+    assert process._failure_policy("build") == "fail-fast"
+    assert process._failure_policy("lint") == "ignore"
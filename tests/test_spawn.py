@@ -0,0 +1,52 @@
+import asyncio
+import sys
+
+import pytest
+
+from jorun.spawn.client import SpawnClient, spawn_server_supported
+from jorun.utils import direct_argv
+
+
+@pytest.mark.parametrize("command,argv", [
+    ("echo hello  world", ["echo", "hello", "world"]),
+    ("echo $HOME", None),
+    ("echo a | cat", None),
+    ("cd /tmp", None),
+    ("FOO=1 env", None),
+    ("ls *.py", None),
+    ("no-such-program-here", None),
+    ("", None),
+])
+def test_direct_argv(command, argv):
+    if sys.platform == "win32":
+        argv = None
+    assert direct_argv(command) == argv
+
+
+@pytest.mark.skipif(not spawn_server_supported(), reason="the spawn server needs posix_spawn and fd passing")
+def test_spawn_server(tmp_path):
+    async def scenario():
+        client = SpawnClient()
+        client.start(asyncio.get_running_loop())
+        try:
+            processes = await asyncio.gather(*(
+                client.spawn(["sh", "-c", f"pwd; echo $NAME{i}; echo err{i} >&2; exit {i}"], str(tmp_path),
+                             {"NAME0": "zero", "NAME1": "one", "PATH": "/usr/bin:/bin"}, i == 1)
+                for i in range(2)))
+
+            separate, redirected = processes
+            assert await separate.stdout.read() == f"{tmp_path}\nzero\n".encode()
+            assert await separate.stderr.read() == b"err0\n"
+            assert await separate.wait() == 0
+
+            assert redirected.stderr is None
+            assert sorted((await redirected.stdout.read()).splitlines()) == sorted([str(tmp_path).encode(), b"one",
+                                                                                    b"err1"])
+            assert await redirected.wait() == 1
+
+            with pytest.raises(OSError):
+                await client.spawn(["no-such-program-here"], None, None, False)
+        finally:
+            client.close()
+
+    asyncio.run(asyncio.wait_for(scenario(), 30))
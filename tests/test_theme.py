@@ -0,0 +1,37 @@
+from PySide6.QtWidgets import QStyle
+from tinyioc import get_service
+
+from jorun.messaging.message import TaskStatus
+from jorun.palette.darcula import DarculaColorPalette
+from jorun.ui.task_panel import TaskPanel
+from jorun.ui.theme import Theme
+
+
+def test_stylesheet_uses_the_palette(qt_app):
+    palette = DarculaColorPalette()
+    theme = Theme(palette, qt_app.style())
+
+    assert f"background-color: {palette.current_line}" in theme.stylesheet
+    assert "#taskPanel #taskOutput" in theme.stylesheet
+    assert qt_app.styleSheet() == get_service(Theme).stylesheet
+
+
+def test_icons_rendered_once(qt_app):
+    theme = Theme(DarculaColorPalette(), qt_app.style())
+
+    play = theme.icon(QStyle.StandardPixmap.SP_MediaPlay)
+    assert theme.icon(QStyle.StandardPixmap.SP_MediaPlay) is play
+    assert theme.icon(QStyle.StandardPixmap.SP_MediaStop).cacheKey() != play.cacheKey()
+
+
+def test_panels_share_the_icons(qt_app):
+    theme: Theme = get_service(Theme)
+    first, second = TaskPanel(None, "a"), TaskPanel(None, "b")
+    second.update_status(TaskStatus.STARTED)
+
+    play = theme.icon(QStyle.StandardPixmap.SP_MediaPlay).cacheKey()
+    assert first._task_command_btn.icon().cacheKey() == play
+    assert second._task_command_btn.icon().cacheKey() == theme.icon(QStyle.StandardPixmap.SP_MediaStop).cacheKey()
+
+    second.update_status(TaskStatus.STOPPED)
+    assert second._task_command_btn.icon().cacheKey() == play
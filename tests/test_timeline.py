@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("PySide6")
+
+from jorun import constants
+from jorun.ui.timeline import TimelineBuffer, TimelineModel
+
+
+def rows(model: TimelineModel) -> list:
+    while model.canFetchMore():
+        model.fetchMore()
+    return [model.data(model.index(r)) for r in range(model.rowCount())]
+
+
+def test_buffer_drops_the_oldest_lines():
+    buffer = TimelineBuffer(max_lines=3)
+    for i in range(7):
+        buffer.append(float(i), f"{i}\n")
+
+    assert (buffer.start, buffer.end) == (3, 7)
+    assert buffer.line(2) is None
+    assert buffer.line(6) == "6\n"
+    assert buffer.time(3) == 3.0
+
+
+def test_lines_are_merged_by_time_and_filtered():
+    a, b = TimelineBuffer(), TimelineBuffer()
+    for t, line in [(1, "a ready\n"), (4, "a done\n")]:
+        a.append(t, line)
+    for t, line in [(2, "b ready\n"), (3, "b serving\n")]:
+        b.append(t, line)
+
+    model = TimelineModel()
+    model.set_buffers({"a": a, "b": b})
+    assert [r.split(" ", 1)[1] for r in rows(model)] == ["[a] a ready", "[b] b ready", "[b] b serving", "[a] a done"]
+
+    model.set_buffers({"a": a, "b": b}, "ready")
+    assert [r.split(" ", 1)[1] for r in rows(model)] == ["[a] a ready", "[b] b ready"]
+
+
+def test_fetch_scans_a_bounded_number_of_lines(monkeypatch):
+    monkeypatch.setattr(constants, "TIMELINE_FETCH_SCAN", 10)
+    buffer = TimelineBuffer()
+    for i in range(100):
+        buffer.append(float(i), "match\n" if i == 95 else "other\n")
+
+    model = TimelineModel()
+    model.set_buffers({"a": buffer}, "match")
+    model.fetchMore()
+    assert model.rowCount() == 0
+    assert model.canFetchMore()
+
+    assert len(rows(model)) == 1
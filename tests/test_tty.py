@@ -0,0 +1,41 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from jorun import constants
+from jorun.tty import tty_supported, open_tty, tty_environment, read_tty
+
+pytestmark = pytest.mark.skipif(not tty_supported(), reason="pseudo-terminals are not supported")
+
+
+def test_environment():
+    environment = tty_environment({"COLUMNS": 200, "DEBUG": "1"})
+
+    assert environment["TERM"] == constants.TTY_TERM
+    assert environment["LINES"] == str(constants.TTY_ROWS)
+    assert environment["COLUMNS"] == "200"
+    assert environment["DEBUG"] == "1"
+    assert environment["PATH"] == os.environ["PATH"]
+
+
+def test_output_until_closed():
+    script = "import os, sys; print(sys.stdout.isatty(), os.get_terminal_size().columns); print('done')"
+
+    async def run():
+        master, slave = open_tty()
+        process = subprocess.Popen([sys.executable, "-c", script], stdout=slave, stderr=slave)
+        os.close(slave)
+        reader = await read_tty(master)
+
+        lines = []
+        while line := await reader.readline():
+            lines.append(line)
+        return process.wait(), lines
+
+    returncode, lines = asyncio.run(run())
+    assert returncode == 0
+    # No carriage returns added by the terminal, and the end of the output is not an error
+    assert lines == [f"True {constants.TTY_COLUMNS}\n".encode(), b"done\n"]
@@ -0,0 +1,35 @@
+import json
+
+from jorun import constants
+from jorun.usage import UsageRecorder, TaskUsage
+
+
+def usage(started: float, ready: float = None, ended: float = None, returncode: int = None) -> TaskUsage:
+    return TaskUsage(started=started, ready=ready, ended=ended, returncode=returncode, cpu=1.5, peak_rss=3 * 1024 ** 2,
+                     direct=False)
+
+
+def test_summary():
+    recorder = UsageRecorder()
+    recorder.update("build", usage(10.0, ended=12.5, returncode=0))
+    recorder.update("server", usage(10.0, ready=11.0, ended=20.0, returncode=-15))
+
+    header, build, server = recorder.summary()
+    assert header.split() == ["Task", "Wall", "Ready", "CPU", "Peak", "RSS", "Exit"]
+    assert build.split() == ["build", "2.50s", "-", "1.50s", "3.0M", "0"]
+    assert server.split() == ["server", "10.00s", "1.00s", "1.50s", "3.0M", "-15"]
+
+
+def test_timings_history(tmp_path):
+    path = tmp_path / "timings.json"
+    history = [float(i) for i in range(constants.TIMINGS_HISTORY_LENGTH)]
+    path.write_text(json.dumps({"build": history, "server": 4, "other": [1]}))
+
+    recorder = UsageRecorder()
+    recorder.update("build", usage(10.0, ended=12.5))
+    recorder.update("server", usage(10.0, ready=11.0, ended=20.0))
+    recorder.update("running", usage(10.0))
+    recorder.write_timings(str(path))
+
+    # The time to be ready counts for the services, the oldest timings are dropped
+    assert json.loads(path.read_text()) == {"build": history[1:] + [2.5], "server": [4, 1.0], "other": [1]}
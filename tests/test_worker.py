@@ -0,0 +1,42 @@
+from argparse import Namespace
+
+import pytest
+
+from jorun.errors import TaskRunException
+from jorun.worker import WorkerPool
+
+
+def create_pool(count: int) -> WorkerPool:
+    # The worker processes are not started, only their connections are used to tell whether they are alive
+    return WorkerPool(count, Namespace(level="INFO"), False, None, None, None)
+
+
+def shell_task(name: str) -> dict:
+    return {"name": name, "type": "shell", "shell": {"command": "true"}}
+
+
+def test_tasks_go_to_the_least_loaded_worker():
+    pool = create_pool(2)
+    pool._task_rates = {"chatty": 1000.0, "quiet": 1.0}
+
+    assert pool.create_runner(shell_task("chatty")).worker.index == 0
+    assert pool.create_runner(shell_task("quiet")).worker.index == 1
+    assert pool.create_runner(shell_task("other")).worker.index == 1
+
+
+def test_dead_workers_are_skipped():
+    pool = create_pool(2)
+    pool._workers[0].connection.close()
+
+    assert pool.available
+    assert pool.create_runner(shell_task("t")).worker.index == 1
+
+
+def test_no_worker_left():
+    pool = create_pool(2)
+    for worker in pool._workers:
+        worker.connection.close()
+
+    assert not pool.available
+    with pytest.raises(TaskRunException, match="worker processes terminated"):
+        pool.create_runner(shell_task("t"))